@@ -109,6 +109,18 @@ if __name__ == u'__main__':
                     'default': 'info',
                     'help': 'Set logging level.  Normal logging for the system is info.  Setting to debug will provide much more information about how the system is operating which is useful for debugging'
                 },
+                {
+                    'prompt': 'Location of state file?',
+                    'variable': 'STATEFILE',
+                    'default': '/var/tmp/pydPiper.state',
+                    'help': 'Where should the last known track, weather and system status be saved?  They are shown immediately when pydPiper restarts until fresh data arrives'
+                },
+                {
+                    'prompt': 'Location of album art cache?',
+                    'variable': 'ALBUMARTCACHE',
+                    'default': '/var/tmp/pydPiper.albumart',
+                    'help': 'Which directory should album art be saved to once it has been scaled for the display?  Saved art is not fetched again after a restart'
+                },
                 {
                     'prompt': 'Time Zone?',
                     'variable': 'TIMEZONE',
@@ -263,6 +275,22 @@ if __name__ == u'__main__':
                                 }
                             ]
                     }
+                },
+                {
+                    'prompt': 'Audio fifo?',
+                    'variable': 'AUDIO_FIFO',
+                    'help': 'Path of a fifo to read live audio from for the vumeter and spectrum widgets (e.g. /tmp/mpd.fifo from an MPD fifo output).  Leave empty if the pages do not use meters.  Requires numpy',
+                    'followup_questions': {
+                        '.+':
+                            [
+                                {
+                                    'prompt': 'Audio format?',
+                                    'variable': 'AUDIO_FORMAT',
+                                    'default': '44100:16:2',
+                                    'help': 'Sample rate, bits per sample and channels of the audio written to the fifo.  Use the format from the fifo output in mpd.conf'
+                                }
+                            ]
+                    }
                 }
             ]
         }
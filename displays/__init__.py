@@ -1,12 +1,31 @@
-__all__ = [ "display", "graphics", "winstar_weg", "ssd1306_i2c", "hd44780", "hd44780_i2c", "luma_i2c", "lcd_curses", "fonts" ]
+__all__ = [ "display", "graphics", "winstar_weg", "ssd1306_i2c", "hd44780", "hd44780_i2c", "hd44780_mcp23008", "luma_i2c", "lcd_curses", "fonts", "clock", "hotlog", "bitmap", "pageplan", "assets", "albumart", "meters", "DRIVERS", "driver" ]
 
+import importlib
 
+import hotlog
+import bitmap
+import pageplan
+import assets
+import albumart
+import clock
 import display
 import graphics
-import lcd_curses
-import winstar_weg
-import ssd1306_i2c
-import luma_i2c
-import hd44780
-import hd44780_i2c
 import fonts
+
+# Display drivers are only imported when they are selected (see driver).  Importing them all would load
+# the libraries of every driver (luma, RPi.GPIO, smbus...) and fail if any of them was not installed.
+DRIVERS = {
+	'winstar_weg': 'winstar_weg.winstar_weg',
+	'hd44780': 'hd44780.hd44780',
+	'hd44780_i2c': 'hd44780_i2c.hd44780_i2c',
+	'hd44780_mcp23008': 'hd44780_mcp23008.hd44780_mcp23008',
+	'ssd1306_i2c': 'ssd1306_i2c.ssd1306_i2c',
+	'luma_i2c': 'luma_i2c.luma_i2c',
+	'lcd_curses': 'lcd_curses.lcd_curses',
+}
+
+def driver(name):
+	# Import and return the class of display driver name
+	# Raises KeyError if there is no such driver and ImportError if a library it needs is not installed
+	module, cls = DRIVERS[name].rsplit('.', 1)
+	return getattr(importlib.import_module('{0}.{1}'.format(__name__, module)), cls)
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# albumart - artwork for the albumart widget
+#
+# Artwork is fetched from the music services and scaled and dithered to the size of the widget on a background
+# thread.  The render thread only looks the artwork up and never waits for it.  Until it is ready the widget shows
+# its placeholder.
+#
+# Finished artwork is cached by album.  The most recently used entries are kept in memory and every entry is saved
+# to a directory on disk (as a small 1 bit PNG) so an album is not fetched again after a restart.  Both are bounded
+# and drop the least recently used entries first.
+
+from __future__ import unicode_literals
+
+import collections, hashlib, logging, os, threading, time, io, Queue
+from PIL import Image, ImageChops
+
+# Functions that return the artwork of a track as the contents of an image file (or None if it has none).
+# They are called with (uri, album, artist) from the cache's thread.  Each music service adds its own.
+fetchers = [ ]
+
+# Ways to reduce artwork to 1 bit
+DITHERS = [ 'floydsteinberg', 'ordered', 'none' ]
+
+# Variables the artwork is chosen by
+VARIABLES = [ 'album', 'artist', 'uri' ]
+
+# 4x4 Bayer matrix used by ordered dithering
+BAYER = [ 0, 8, 2, 10, 12, 4, 14, 6, 3, 11, 1, 9, 15, 7, 13, 5 ]
+thresholds = { }
+
+def key(db):
+	# Return the cache key of the artwork for the track in db.  Tracks are keyed by album so every track of an
+	# album shares its artwork.  Tracks without an album (e.g. radio streams) are keyed by their uri.
+	album = db['album'] if 'album' in db else ''
+	artist = db['artist'] if 'artist' in db else ''
+	uri = db['uri'] if 'uri' in db else ''
+	if album:
+		return (artist, album)
+	if uri:
+		return ('', uri)
+	return None
+
+def ordered(image):
+	# Dither mode "L" image to 1 bit with the Bayer matrix.  Flat areas become regular patterns instead of noise.
+	w, h = image.size
+	if image.size not in thresholds:
+		tile = Image.new('L', (4,4))
+		tile.putdata([ v*16+8 for v in BAYER ])
+		t = Image.new('L', image.size)
+		for x in range(0, w, 4):
+			for y in range(0, h, 4):
+				t.paste(tile, (x,y))
+		thresholds[image.size] = t
+	# A pixel is set where it is brighter than its threshold
+	return ImageChops.subtract(image, thresholds[image.size]).point([0] + [255]*255, '1')
+
+def render(data, size, dither='floydsteinberg'):
+	# Return the image file in data scaled to fit within size, centered on a black mode "1" image of that size
+	image = Image.open(io.BytesIO(data))
+	# JPEG files can be scaled down by up to 8 while they are decoded which is much faster than decoding them at full size
+	image.draft('L', size)
+	image = image.convert('L')
+	image.thumbnail(size, Image.ANTIALIAS)
+
+	if dither == 'ordered':
+		body = ordered(image)
+	elif dither == 'none':
+		body = image.convert('1', dither=Image.NONE)
+	else:
+		body = image.convert('1')
+
+	retval = Image.new('1', size)
+	retval.paste(body, ((size[0]-body.size[0])//2, (size[1]-body.size[1])//2))
+	return retval
+
+class artcache(object):
+
+	RETRY = 60	# Seconds before artwork that could not be found is requested again
+
+	def __init__(self, directory=None, memory=16, disk=500):
+		# directory (unicode) -- where artwork is saved.  Not saved to disk if None.
+		# memory (int) -- how many images to keep in memory
+		# disk (int) -- how many images to keep in directory
+		self.directory = directory
+		self.memory = memory
+		self.disk = disk
+
+		self.images = collections.OrderedDict()	# (key, size, dither) -> image.  Least recently used first.
+		self.missing = { }						# key -> time when artwork that was not found may be requested again
+		self.pending = set()					# (key, size, dither) waiting for the thread
+		self.requests = Queue.Queue()
+		self.lock = threading.Lock()
+		self.thread = None
+		self.stats = { 'hits':0, 'fetched':0, 'disk':0, 'failed':0 }
+
+	def get(self, key, size, dither, uri=''):
+		# Return the artwork for key rendered at size or None if it is not ready.  Never waits.
+		# Artwork that is not ready is requested from the cache's thread.
+		entry = (key, tuple(size), dither)
+		with self.lock:
+			if entry in self.images:
+				image = self.images.pop(entry)
+				self.images[entry] = image
+				self.stats['hits'] += 1
+				return image
+			if entry in self.pending or self.missing.get(key, 0) > time.time():
+				return None
+			self.pending.add(entry)
+			if self.thread is None:
+				self.thread = threading.Thread(target=self.run)
+				self.thread.daemon = True
+				self.thread.start()
+		self.requests.put((entry, uri))
+		return None
+
+	def run(self):
+		while True:
+			entry, uri = self.requests.get()
+			key, size, dither = entry
+			try:
+				start = time.time()
+				image = self.load(entry)
+				if image is not None:
+					self.stats['disk'] += 1
+				else:
+					data = self.fetch(key, uri)
+					if data is None:
+						logging.debug('No artwork found for {0}'.format(' - '.join([ k for k in key if k ])))
+						with self.lock:
+							self.missing[key] = time.time() + self.RETRY
+						continue
+					image = render(data, size, dither)
+					self.save(entry, image)
+					self.stats['fetched'] += 1
+					logging.debug('Artwork for {0} ready in {1:.1f}ms'.format(' - '.join([ k for k in key if k ]), (time.time()-start)*1000))
+				with self.lock:
+					self.images[entry] = image
+					while len(self.images) > self.memory:
+						self.images.popitem(last=False)
+			except Exception as e:
+				logging.warning('Unable to get artwork for {0}: {1}'.format(' - '.join([ k for k in key if k ]), e))
+				self.stats['failed'] += 1
+				with self.lock:
+					self.missing[key] = time.time() + self.RETRY
+			finally:
+				with self.lock:
+					self.pending.discard(entry)
+
+	def fetch(self, key, uri):
+		# Ask each music service for the artwork until one has it
+		artist, album = key
+		for f in fetchers:
+			try:
+				data = f(uri, album, artist)
+			except Exception as e:
+				logging.debug('Artwork request failed: {0}'.format(e))
+				continue
+			if data:
+				return data
+		return None
+
+	def filename(self, entry):
+		key, size, dither = entry
+		name = '\0'.join(list(key) + [ '{0}x{1}'.format(*size), dither ])
+		return os.path.join(self.directory, hashlib.sha1(name.encode('utf-8')).hexdigest() + '.png')
+
+	def load(self, entry):
+		# Return the artwork saved for entry or None
+		if not self.directory:
+			return None
+		path = self.filename(entry)
+		try:
+			image = Image.open(path)
+			image.load()
+			# Record the use so the file is not the next one dropped
+			os.utime(path, None)
+			return image
+		except (IOError, OSError):
+			return None
+
+	def save(self, entry, image):
+		# Save the artwork for entry and drop the least recently used files once there are more than disk
+		if not self.directory:
+			return
+		try:
+			if not os.path.isdir(self.directory):
+				os.makedirs(self.directory)
+			path = self.filename(entry)
+			image.save(path + '.tmp', 'PNG')
+			os.rename(path + '.tmp', path)
+
+			files = [ os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.png') ]
+			if len(files) > self.disk:
+				files.sort(key=os.path.getmtime)
+				for f in files[:len(files)-self.disk]:
+					os.remove(f)
+		except (IOError, OSError) as e:
+			logging.warning('Unable to save artwork to {0}: {1}'.format(self.directory, e))
+
+# Used by every albumart widget
+cache = artcache()
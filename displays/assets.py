@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# assets - images loaded by the IMAGES section of a page file
+#
+# The displays are 1 bit so images are converted once when they are loaded instead of every time they are drawn.
+# Each image becomes a 1 bit body and a mask that selects the pixels of the body that are drawn (the alpha channel
+# of images that have one).  The conversion is the one PIL does when an image is pasted onto a mode "1" frame so the
+# pixels drawn are unchanged.
+#
+# Images are keyed by the SHA-1 of their file.  Every widget and page file that uses the same image shares one copy
+# and a file that is edited is loaded again the next time it is requested.
+
+from __future__ import unicode_literals
+
+import collections, hashlib, io, threading
+from PIL import Image
+
+# body (Image) -- mode "1" image
+# mask (Image) -- mode "1" or "L" image the size of body.  Pixels of body are drawn where mask is set.
+# mode (unicode) -- mode of the original image
+# maskfrom (unicode) -- where the mask came from.  'alpha' (the alpha channel), 'image' (a "1" or "L" image masks itself) or 'body' (images without transparency)
+asset = collections.namedtuple('asset', 'body mask mode maskfrom digest')
+
+# Images that have been loaded keyed by the SHA-1 of their file
+loaded = { }
+lock = threading.Lock()
+
+def fromimage(image, digest=None):
+	# Convert a PIL image into an asset
+	mode = image.mode
+	if mode == 'P' and 'transparency' in image.info:
+		image = image.convert('RGBA')
+
+	body = image if image.mode == '1' else image.convert('1')
+	if image.mode in ('RGBA', 'RGBa', 'LA', 'PA'):
+		return asset(body, image.split()[-1], mode, 'alpha', digest)
+	elif image.mode in ('1', 'L'):
+		return asset(body, image, mode, 'image', digest)
+	return asset(body, body, mode, 'body', digest)
+
+def load(path):
+	# Return the asset for the image file at path.  Raises IOError if it can not be read.
+	with open(path, 'rb') as f:
+		data = f.read()
+	digest = hashlib.sha1(data).hexdigest()
+
+	with lock:
+		if digest not in loaded:
+			image = Image.open(io.BytesIO(data))
+			image.load()
+			loaded[digest] = fromimage(image, digest)
+		return loaded[digest]
+
+def describe(a):
+	# One line summary of asset a for the load report
+	return '{0}x{1} {2}, 1 bit body with {3} mask from {4}'.format(a.body.size[0], a.body.size[1], a.mode, a.mask.mode, a.maskfrom)
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# bitmap - packed 1 bit per pixel images
+#
+# PIL stores mode "1" images with a byte per pixel.  A bitmap packs 8 pixels into each byte of a bytearray,
+# rows first with the leftmost pixel in the most significant bit.  That is the same layout PIL uses for the
+# raw data of a mode "1" image so converting either way is a single copy.
+#
+# Rows are manipulated as Python integers so blits, clipping and comparisons cost a few operations per row
+# instead of one per pixel.  pages converts to the layout used by OLED controllers (a byte per column for each
+# band of 8 rows, top row in the least significant bit) and dirty finds the columns of each band that differ
+# between two frames so a driver only needs to send those.
+
+from __future__ import unicode_literals
+
+import binascii
+from PIL import Image
+
+# Byte b spread out into 8 bytes of 0 or 1, most significant bit first
+SPREAD = [ bytes(bytearray([ (b >> (7-i)) & 1 for i in range(8) ])) for b in range(256) ]
+
+class bitmap(object):
+
+	__slots__ = ('width', 'height', 'stride', 'data')
+
+	def __init__(self, width, height, data=None):
+		self.width = width
+		self.height = height
+		self.stride = (width+7)/8		# Bytes per row
+		self.data = bytearray(data) if data is not None else bytearray(self.stride*height)
+		if len(self.data) != self.stride*height:
+			raise ValueError('Expected {0} bytes of data for a {1}x{2} bitmap but received {3}'.format(self.stride*height, width, height, len(self.data)))
+
+	@classmethod
+	def frompil(cls, image):
+		if image.mode != '1':
+			image = image.convert('1')
+		return cls(image.size[0], image.size[1], image.tobytes())
+
+	def topil(self):
+		return Image.frombytes('1', (self.width, self.height), bytes(self.data))
+
+	@property
+	def size(self):
+		return (self.width, self.height)
+
+	def copy(self):
+		return bitmap(self.width, self.height, self.data)
+
+	def __eq__(self, other):
+		return isinstance(other, bitmap) and self.size == other.size and self.data == other.data
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+	def get(self, x, y):
+		return (self.data[y*self.stride + x/8] >> (7 - x%8)) & 1
+
+	def set(self, x, y, value):
+		if value:
+			self.data[y*self.stride + x/8] |= 0x80 >> (x%8)
+		else:
+			self.data[y*self.stride + x/8] &= ~(0x80 >> (x%8)) & 0xff
+
+	def row(self, y):
+		# Row y as an integer.  The leftmost pixel is the most significant of stride*8 bits.
+		return int(binascii.hexlify(self.data[y*self.stride:(y+1)*self.stride]) or '0', 16)
+
+	def setrow(self, y, value):
+		self.data[y*self.stride:(y+1)*self.stride] = binascii.unhexlify('{0:0{1}x}'.format(value, self.stride*2))
+
+	def blit(self, src, (x,y), mask=False):
+		# Copy bitmap src into this bitmap with its top left corner at x,y.  Whatever falls outside is clipped.
+		# mask (bool) -- Only copy the set pixels of src (the pixels under its clear pixels are left alone)
+
+		sx0 = max(0, -x)
+		sx1 = min(src.width, self.width - x)
+		sy0 = max(0, -y)
+		sy1 = min(src.height, self.height - y)
+		if sx1 <= sx0 or sy1 <= sy0:
+			return self
+
+		w = sx1 - sx0
+		dx = x + sx0
+
+		# Whole bytes can be copied directly
+		if not mask and dx%8 == 0 and sx0%8 == 0 and (w%8 == 0 or dx+w == self.width):
+			n = (w+7)/8
+			so = sx0/8
+			do = dx/8
+			for sy in range(sy0, sy1):
+				s = sy*src.stride + so
+				d = (sy+y)*self.stride + do
+				self.data[d:d+n] = src.data[s:s+n]
+			return self
+
+		ones = (1 << w) - 1
+		srcshift = src.stride*8 - sx1
+		dstshift = self.stride*8 - dx - w
+		keep = ~(ones << dstshift)
+		for sy in range(sy0, sy1):
+			bits = (src.row(sy) >> srcshift) & ones
+			if mask:
+				if bits:
+					self.setrow(sy+y, self.row(sy+y) | (bits << dstshift))
+			else:
+				self.setrow(sy+y, (self.row(sy+y) & keep) | (bits << dstshift))
+		return self
+
+	def crop(self, (x0, y0, x1, y1)):
+		# Return the x0,y0 to x1,y1 region as a new bitmap.  Parts outside this bitmap are clear.
+		retval = bitmap(x1-x0, y1-y0)
+		retval.blit(self, (-x0, -y0))
+		return retval
+
+	def xor(self, other):
+		# Return a bitmap with the pixels that differ between this bitmap and other set
+		if self.size != other.size:
+			raise ValueError('Can not compare a {0}x{1} bitmap with a {2}x{3} bitmap'.format(self.width, self.height, other.width, other.height))
+		a = int(binascii.hexlify(self.data) or '0', 16)
+		b = int(binascii.hexlify(other.data) or '0', 16)
+		return bitmap(self.width, self.height, binascii.unhexlify('{0:0{1}x}'.format(a ^ b, len(self.data)*2)))
+
+	def band(self, p):
+		# Rows 8*p to 8*p+7 as an integer with a byte for each of stride*8 columns (column 0 is the most significant).
+		# Bit k of a column's byte is row 8*p+k.
+		retval = 0
+		for k in range(min(8, self.height-p*8)):
+			r = self.data[(p*8+k)*self.stride:(p*8+k+1)*self.stride]
+			# Every pixel of the row becomes a 0 or 1 byte.  Shifting by k moves it to bit k of its column.
+			retval |= int(binascii.hexlify(b''.join([ SPREAD[b] for b in r ])), 16) << k
+		return retval
+
+	def pages(self):
+		# Return the bitmap as a list of bytearrays, one for each band of 8 rows, with a byte for each column.
+		# The top row of the band is the least significant bit.
+		retval = []
+		for p in range((self.height+7)/8):
+			page = binascii.unhexlify('{0:0{1}x}'.format(self.band(p), self.stride*16))
+			retval.append(bytearray(page[:self.width]))
+		return retval
+
+	def dirty(self, other):
+		# Return (page, x0, x1) for each band of 8 rows that differs from bitmap other where
+		# x0 and x1 are the first and last columns that changed.  Everything is dirty if other is None or a different size.
+		if other is None or self.size != other.size:
+			return [ (p, 0, self.width-1) for p in range((self.height+7)/8) ]
+
+		retval = []
+		padding = 8*(self.stride*8 - self.width)
+		for p in range((self.height+7)/8):
+			rows = slice(p*8*self.stride, min(p*8+8, self.height)*self.stride)
+			if self.data[rows] == other.data[rows]:
+				continue
+			d = (self.band(p) ^ other.band(p)) >> padding
+			if d:
+				# The first column is the most significant byte
+				x0 = self.width - 1 - (d.bit_length()-1)/8
+				x1 = self.width - 1 - ((d & -d).bit_length()-1)/8
+				retval.append( (p, x0, x1) )
+		return retval
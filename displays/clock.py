@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# clock - cached time values for musicdata and pages
+#
+# Replaces the moment objects that used to be stored in musicdata (utc, localtime).
+# Time only has a resolution of one second so a value is created once per second and timezone
+# and strftime results are memoized by (format, timezone, second) until the next second begins.
+
+from __future__ import unicode_literals
+
+import time, datetime
+import pytz
+
+class clocktime(object):
+
+	# A second in time as seen from a timezone
+	# Provides the timezone and strftime methods that pages use on utc and localtime
+
+	def __init__(self, clock, second, tz):
+		self.clock = clock
+		self.second = second	# Seconds since the epoch
+		self.tz = tz			# Name of the timezone
+
+	def timezone(self, tz):
+		# Returns the same second as seen from timezone tz.  Raises ValueError if tz is not a valid timezone.
+		return self.clock.at(self.second, tz)
+
+	def strftime(self, format):
+		return self.clock.format(self.second, self.tz, format)
+
+	def todatetime(self):
+		return datetime.datetime.fromtimestamp(self.second, self.clock.timezone(self.tz))
+
+	def __eq__(self, other):
+		return isinstance(other, clocktime) and self.second == other.second and self.tz == other.tz
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+	def __hash__(self):
+		return hash((self.second, self.tz))
+
+	def __repr__(self):
+		return 'clocktime({0}, {1})'.format(self.todatetime().isoformat(), self.tz)
+
+
+class clock(object):
+
+	def __init__(self, tz='UTC'):
+		self.timezones = { }	# Timezone name -> tzinfo
+		self.times = { }		# (second, timezone name) -> clocktime for the current second
+		self.formats = { }		# (format, timezone name, second) -> formatted string for the current second
+		self.second = 0			# The current second.  Caches are cleared when it changes.
+		self.settimezone(tz)
+
+	def settimezone(self, tz):
+		# Set the timezone used for localtime.  Raises ValueError if tz is not a valid timezone.
+		tz = tz or 'UTC'
+		self.timezone(tz)
+		self.tz = tz
+
+	def timezone(self, tz):
+		# Returns the tzinfo for the timezone named tz
+		try:
+			return self.timezones[tz]
+		except KeyError:
+			pass
+		try:
+			tzinfo = pytz.timezone(tz)
+		except (pytz.UnknownTimeZoneError, AttributeError):
+			raise ValueError('Unknown timezone {0}'.format(tz))
+		self.timezones[tz] = tzinfo
+		return tzinfo
+
+	def tick(self, second):
+		# Start a new second.  Anything cached for previous seconds is no longer needed.
+		if second > self.second:
+			self.second = second
+			self.times = { }
+			self.formats = { }
+
+	def at(self, second, tz):
+		key = (second, tz)
+		try:
+			return self.times[key]
+		except KeyError:
+			pass
+		self.timezone(tz)
+		self.tick(second)
+		t = clocktime(self, second, tz)
+		if second == self.second:
+			self.times[key] = t
+		return t
+
+	def format(self, second, tz, format):
+		key = (format, tz, second)
+		try:
+			return self.formats[key]
+		except KeyError:
+			pass
+		retval = datetime.datetime.fromtimestamp(second, self.timezone(tz)).strftime(format.encode('utf-8'))
+		retval = retval.decode('utf-8')
+		if second == self.second:
+			self.formats[key] = retval
+		return retval
+
+	def utcnow(self):
+		return self.at(int(time.time()), 'UTC')
+
+	def localnow(self):
+		return self.at(int(time.time()), self.tz)
+
+
+# Clock shared by the music controller and the display widgets
+default = clock()
+
+def settimezone(tz):
+	default.settimezone(tz)
+
+def utcnow():
+	return default.utcnow()
+
+def localnow():
+	return default.localnow()
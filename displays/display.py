@@ -6,17 +6,184 @@
 
 from __future__ import unicode_literals
 
-import math, abc, logging, time, imp, sys, os
-import moment
+import math, abc, logging, time, imp, sys, os, threading, re, bisect, collections, marshal
 from PIL import Image
 from PIL import ImageDraw
-from PIL import ImageFont
 
 import fonts
+import clock
+import hotlog
+import bitmap
+import pageplan
+import assets
+import albumart
+
+# Returned by display_controller.next when the frame is identical to the last one returned
+SAMEFRAME = object()
+
+# Due time of a widget whose variables only change when they are assigned
+NEVER = float('inf')
+
+# Variable references and conditionals are parsed and compiled once.  display_controller.load fills these from the page plan.
+pipelines = { }		# Variable reference -> (name, ((transform, parameters), ...))
+conditions = { }	# Conditional -> code object (None if it does not compile)
+
+def pipeline(variable):
+	try:
+		return pipelines[variable]
+	except KeyError:
+		pipelines[variable] = pageplan.pipeline(variable)
+		return pipelines[variable]
+
+def loadmeters():
+	# Import and return displays/meters.py which draws the vumeter and spectrum widgets.  It needs numpy which is slow
+	# to import so it is only imported when a page file uses a meter.  Raises ImportError if numpy is not installed.
+	global meters
+	import meters
+	return meters
+
+meters = None
+
+def condition(source):
+	try:
+		return conditions[source]
+	except KeyError:
+		conditions[source] = pageplan.condition(source)
+		return conditions[source]
+
+class pinnedview(object):
+	# Stable reference to the variable db that widgets and sequences hold on to
+	# display_controller pins the db (or a snapshot of it) that a frame should be rendered from
+	# so that every widget in the frame sees the same values.
+
+	def __init__(self, db):
+		self.db = db
+
+	def pin(self, db):
+		self.db = db
 
-class widget:
+	def __getitem__(self, key):
+		return self.db[key]
+
+	def __contains__(self, key):
+		return key in self.db
+
+	def __getattr__(self, name):
+		# Pass everything else (get, keys, stamp, version...) to the pinned db
+		return getattr(self.db, name)
+
+# Widget specs
+# The parameters a widget was created with never change so they are kept in an immutable spec.
+# Widgets created from identical definitions share the same spec.  What changes as a widget
+# is rendered (its image, scroll position, last message...) is kept in the widget's slots.
+textspec = collections.namedtuple('textspec', 'formatstring variables fontpkg varwidth specifiedsize just')
+progressbarspec = collections.namedtuple('progressbarspec', 'value rangeval style')
+progressimagebarspec = collections.namedtuple('progressimagebarspec', 'maskimage value rangeval direction')
+albumartspec = collections.namedtuple('albumartspec', 'specifiedsize dither placeholder')
+meterspec = collections.namedtuple('meterspec', 'value peak specifiedsize direction gap')
+linespec = collections.namedtuple('linespec', 'xy color')
+rectanglespec = collections.namedtuple('rectanglespec', 'xy fill outline')
+popupspec = collections.namedtuple('popupspec', 'dheight duration pduration speed')
+scrollspec = collections.namedtuple('scrollspec', 'direction distance speed gap hesitatetype hesitatetime threshold')
+
+specs = { }
+
+def frozen(value):
+	# Return a hashable stand in for value to look its spec up by
+	if isinstance(value, (list, tuple)):
+		return tuple([ frozen(v) for v in value ])
+	try:
+		hash(value)
+		return value
+	except TypeError:
+		# Unhashable values like font packages are matched by identity.  The spec keeps them alive.
+		return (u'id', id(value))
+
+def widgetspec(spec, *values):
+	# Return the shared spec of type spec holding values
+	values = [ tuple(v) if type(v) is list else v for v in values ]
+	key = (spec,) + frozen(values)
+	try:
+		return specs[key]
+	except KeyError:
+		specs[key] = spec(*values)
+		return specs[key]
+
+def prunespecs(widgets):
+	# Drop the specs that are not used by widgets or the widgets they contain.  Called after a reload so that the
+	# specs of edited widgets (and the fonts and images they refer to) do not stay in specs for as long as pydPiper runs.
+	# Widgets keep their own reference to their spec so dropping one that is still in use only stops it being shared.
+	used = set()
+	seen = set()
+	stack = list(widgets)
+	while stack:
+		w = stack.pop()
+		if id(w) in seen:
+			continue
+		seen.add(id(w))
+		spec = getattr(w, 'spec', None)
+		if spec is not None:
+			used.add(id(spec))
+		inner = getattr(w, 'widget', None)			# scroll and popup
+		if inner is not None:
+			stack.append(inner)
+		for e in getattr(w, 'widgets', None) or [ ]:	# canvas
+			stack.append(e[0])
+
+	for k in [ k for k, spec in specs.iteritems() if id(spec) not in used ]:
+		del specs[k]
+
+class specparam(object):
+	# Widget attribute that is read from the widget's spec
+	def __init__(self, name):
+		self.name = name
+
+	def __get__(self, obj, cls=None):
+		if obj is None:
+			return self
+		return getattr(obj.spec, self.name)
+
+class widget(object):
 	__metaclass__ = abc.ABCMeta
 
+	__slots__ = (
+		'width', 'height', 'size', 'type', 'image', 'spec', 'currentvardict', 'variabledict', 'curMsg', 'dbversion', 'due',
+		'levels', 'marquee', 'marqueetext', 'marqueex', 'textwidth', 'textheight', 'cells',		# text and progress bars
+		'widgets',																				# canvas
+		'widget', 'popped', 'end', 'index', 'windows',											# popup
+		'start', 'hindex', 'vindex', 'shouldscroll', 'speedcount', 'ewidth', 'eheight',			# scroll
+		'expanded_image', 'strip', 'stripx'
+	)
+
+	# Parameters held by the spec
+	formatstring = specparam('formatstring')
+	variables = specparam('variables')
+	fontpkg = specparam('fontpkg')
+	varwidth = specparam('varwidth')
+	specifiedsize = specparam('specifiedsize')
+	just = specparam('just')
+	value = specparam('value')
+	rangeval = specparam('rangeval')
+	style = specparam('style')
+	maskimage = specparam('maskimage')
+	direction = specparam('direction')
+	xy = specparam('xy')
+	color = specparam('color')
+	fill = specparam('fill')
+	outline = specparam('outline')
+	dheight = specparam('dheight')
+	duration = specparam('duration')
+	pduration = specparam('pduration')
+	speed = specparam('speed')
+	distance = specparam('distance')
+	gap = specparam('gap')
+	hesitatetype = specparam('hesitatetype')
+	hesitatetime = specparam('hesitatetime')
+	threshold = specparam('threshold')
+	dither = specparam('dither')
+	placeholder = specparam('placeholder')
+	peak = specparam('peak')
+
 	def __init__(self, variabledict={ }):
 		# width and height.  In pixels for graphics displays and characters for character displays
 		self.width = 0						# Width of the widget
@@ -24,10 +191,17 @@ class widget:
 		self.size = (0,0)					# Size of the widget
 		self.type = None					# What type of widget this is.  Used to determine what to do on a refresh.
 		self.image = None					# A render of the current contents of the widget.
-		self.variables = []					# Names of variables in to-be-used order
+		self.spec = None					# The parameters the widget was created with
 		self.currentvardict = { }			# A record of any variables that have been used and their last value
 		self.variabledict = variabledict	# variabledict.  A pointer to the current active system variable db
 		self.curMsg = None					# If widget is derived from text, record the current message this widget was derived from
+		self.dbversion = -1					# Version of variabledict when this widget was last evaluated (if variabledict is versioned)
+		self.due = NEVER					# When a variable that changes with time (e.g. elapsed) next changes.  Checked against variabledict.clock.
+		self.levels = None					# Rendered images of a progress bar keyed by what is visible.  Created when first needed.
+		self.marquee = 0					# Width of the window a scrolling text widget is seen through.  0 if unknown.
+		self.marqueetext = None				# Message of a text widget that is too wide for its marquee and is rendered a window at a time
+		self.marqueex = None				# x offset of each character of marqueetext
+		self.cells = None					# Glyphs cropped to the font's cell width for fixed width text.  Created when first needed.
 
 	@abc.abstractmethod
 	def update(self):
@@ -75,12 +249,13 @@ class widget:
 		return
 
 	@abc.abstractmethod
-	def popup(self, widget, dheight, duration=15, pduration=10):
+	def popup(self, widget, dheight, duration=15, pduration=10, speed=8):
 		# Input
 		#	widget (widget) -- Widget to pop up
 		#	dheight (integer) -- Sets the height of the window which will get displayed from the canvas
 		#	duration (float) -- How long to display the top of the canvas
 		#	pduration (float) -- How long to stay popped up
+		#	speed (float) -- How fast to slide in pixels per second
 		return
 
 	@abc.abstractmethod
@@ -114,16 +289,13 @@ class widget:
 		# then if variables are required a series of values seperated by '+' symbols
 
 
-		transforms = name.split(u'|')
-		if len(transforms) == 0:
-			return ''
-		elif len(transforms) == 1:
+		steps = pipeline(name)[1]
+		if not steps:
 			return val
 
 		retval = val
 		# Compute transforms
-		for i in range(1,len(transforms)):
-			transform_request = transforms[i].split(u'+')[0].lower() # Pull request type away from variables
+		for transform_request, tvalues in steps:
 			if transform_request in [u'onoff',u'truefalse',u'yesno']:
 				# Make sure input is a Boolean
 				if type(retval) is bool:
@@ -158,30 +330,29 @@ class widget:
 					elif transform_request == u'lower':
 						retval = retval.lower()
 				else:
-					logging.debug(u"Request to perform transform on {0} requires string input".format(name))
+					hotlog.debug(u"Request to perform transform on {0} requires string input", name)
 					return val
 
 # Time transforms
 # --------------------------
-# Input must be a moment object
-# |timezone+tz - converts utc referenced moment object into an equivalant moment object in the timezone requested by the tz parameter
-# |local - converts utc referenced moment object into an equivalant moment object in the local timezone (as specified in pydPiper_config.TIMEZONE variable)
-# |strftime+s - converts moment object into string formated using the strftime format string provided in the s parameter
+# Input must be a clocktime object
+# |timezone+tz - converts utc referenced clocktime object into an equivalant clocktime object in the timezone requested by the tz parameter
+# |local - converts utc referenced clocktime object into an equivalant clocktime object in the local timezone (as specified in pydPiper_config.TIMEZONE variable)
+# |strftime+s - converts clocktime object into string formated using the strftime format string provided in the s parameter
+# clocktime objects memoize both transforms so clock widgets only format the time once a second
 
 			elif transform_request in [ u'timezone', u'strftime' ]:
-				# requires a moment object as input
-
-				tvalues = transforms[i].split('+')[1:]
+				# requires a clocktime object as input
 
-				if type(retval) is moment.core.Moment:
+				if type(retval) is clock.clocktime:
 
 					if len(tvalues) > 1:
 						# Safe to ignore but logging
-						logging.debug(u"Expected one parameter but received {0}".format(len(values)))
+						hotlog.debug(u"Expected one parameter but received {0}", len(tvalues))
 
 					if len(tvalues) == 0:
 						# Requires at least one variable to specify line so will return error in retval
-						logging.debug(u"Expected one parameter but received none")
+						hotlog.debug(u"Expected one parameter but received none")
 						retval = u"Err"
 					else:
 
@@ -190,25 +361,24 @@ class widget:
 								retval = retval.timezone(tvalues[0])
 							except ValueError:
 								# Received bad timezone value
-								logging.debug("Cannot convert timezone.  Requested timezone ({0}) is not valid".format(tvalues[0]))
+								hotlog.debug(u"Cannot convert timezone.  Requested timezone ({0}) is not valid", tvalues[0])
 
 						elif transform_request == u'strftime':
 							try:
 								retval = retval.strftime(tvalues[0])
 							except:
-								logging.debug(u"Cannot format moment.  Bad strftime value provided ({0})".format(tvalues[0]))
+								hotlog.debug(u"Cannot format time.  Bad strftime value provided ({0})", tvalues[0])
 								retval = u'Err'
 				elif transform_request in [u'strftime'] and type(retval) is int:
 					retval = time.strftime(tvalues[0], time.gmtime(int(retval)))
 				else:
 					# Bad input provided
-					logging.debug(u'Expected a moment variable but received a {0}'.format(type(retval)))
+					hotlog.debug(u'Expected a clocktime variable but received a {0}', type(retval))
 
 			elif transform_request in [ u'select' ]:
 				# select replaces the variable with string based upon a matching pattern.
 				# <variable>|select+matchstring+replacestring+matchstring+replacestring+...
 
-				tvalues = transforms[i].split('+')[1:]
 				if len(tvalues)%2 != 0 or len(tvalues)==0:
 					# Must have pairs of input (match+replace)
 					retval = u'Err'
@@ -221,9 +391,9 @@ class widget:
 						retval = u' '
 
 #			elif transform_request in [ u'local' ]:
-#				# requires a moment object as input
+#				# requires a clocktime object as input
 #
-#				if type(retval) is moment.core.Moment:
+#				if type(retval) is clock.clocktime:
 #					try:
 #						retval = retval.timezone(pydPiper_config.TIMEZONE)
 #					except ValueError:
@@ -231,7 +401,7 @@ class widget:
 #						logging.debug("Cannot convert timezone.  Requested timezone ({0}) is not valid".format(pydPiper_config.TIMEZONE))
 #				else:
 #					# Bad input provided
-#					logging.debug(u'Expected a moment variable but received a {0}'.format(type(retval)))
+#					logging.debug(u'Expected a clocktime variable but received a {0}'.format(type(retval)))
 
 		return retval
 
@@ -245,12 +415,11 @@ class widget:
 		parms = []
 		try:
 			for k in range(len(variables)):
-				varname = variables[k].split(u'|')[0]
+				varname = pipeline(variables[k])[0]
 				val = self.transformvariable(self.variabledict[varname], variables[k])
 				parms.append(val)
 		except KeyError:
-			logging.debug( u"Variable not found in evaltext.  Values requested are {0}".format(variables) )
-			print u"Variable not found in evaltext.  Values requested are {0}".format(variables)
+			hotlog.warning(u"Variable not found in evaltext.  Values requested are {0}", variables)
 			# Format doesn't match available variables
 			segval = u"VarErr"
 			return segval
@@ -259,19 +428,41 @@ class widget:
 		try:
 			segval = formatstring.format(*parms)
 		except:
-			logging.debug( u"Var Error Format {0}, Parms {1} Vars {2}".format(formatstring, parms, variables) )
-			print u"Var Error Format {0}, Parms {1} Vars {2}".format(formatstring, parms, variables)
+			hotlog.warning(u"Var Error Format {0}, Parms {1} Vars {2}", formatstring, parms, variables)
 			# Format doesn't match available variables
-			logging.debug(u"Var Error with parm type {0} and format type {1}".format(type(parms), type(formatstring)))
+			hotlog.debug(u"Var Error with parm type {0} and format type {1}", type(parms), type(formatstring))
 			segval = u"VarErr"
 
 		return segval
 
+	def changedsince(self, variables):
+		# variables (unicode array) -- An array containing the names of the variables being used
+		# returns False only if variabledict is versioned and none of the variables have changed since the widget was last evaluated
+		try:
+			stamp = self.variabledict.stamp
+		except AttributeError:
+			return True
+		if self.due != NEVER and self.variabledict.clock() >= self.due:
+			return True
+		for v in variables:
+			if stamp(pipeline(v)[0]) > self.dbversion:
+				return True
+		return False
+
+	def nextdue(self, variables):
+		# variables (unicode array) -- An array containing the names of the variables being used
+		# returns when the first of the variables next changes without being assigned (e.g. elapsed while playing)
+		try:
+			due = self.variabledict.due
+		except AttributeError:
+			return NEVER
+		return min([ due(pipeline(v)[0]) for v in variables ] or [ NEVER ])
+
 	def changed(self, variables):
 		# variables (unicode array) -- An array containing the names of the variables being used
 		# returns bool based upon whether any variables that have been used have changed since the last time a render was requested
 		for v in variables:
-			v = v.split(u'|')[0]
+			v = pipeline(v)[0]
 			try:
 				if self.variabledict[v] != self.currentvardict[v]:
 					return True
@@ -281,6 +472,7 @@ class widget:
 
 
 class gwidget(widget):
+	__slots__ = ()
 
 	def update(self, reset=False):
 
@@ -289,6 +481,11 @@ class gwidget(widget):
 #			if not self.changed(self.variables):
 #				return False
 
+		# Text only needs to be evaluated again if one of its variables has changed
+		if self.type in ['text', 'ttext']:
+			if not self.changedsince(self.variables):
+				return False
+
 		if self.type == 'text':
 			return self.text(self.formatstring, self.variables, self.fontpkg, self.varwidth, self.specifiedsize, self.just)
 		if self.type == 'ttext':
@@ -297,6 +494,10 @@ class gwidget(widget):
 			return self.progressbar(self.value, self.rangeval, self.size, self.style)
 		elif self.type == 'progressimagebar':
 			return self.progressimagebar(self.maskimage, self.value, self.rangeval, self.direction)
+		elif self.type == 'albumart':
+			return self.albumart(self.specifiedsize, self.dither, self.placeholder)
+		elif self.type in ['vumeter', 'spectrum']:
+			return self.meter(self.type, self.value, self.peak, self.specifiedsize, self.direction, self.gap)
 		elif self.type == 'canvas':
 			retval = True if reset else False
 			for e in self.widgets:
@@ -314,7 +515,7 @@ class gwidget(widget):
 		elif self.type == u'scroll':
 			return self.scroll(self.widget, self.direction, self.distance, self.speed, self.gap, self.hesitatetype, self.hesitatetime,self.threshold, reset)
 		elif self.type == u'popup':
-			return self.popup(self.widget, self.dheight, self.duration, self.pduration)
+			return self.popup(self.widget, self.dheight, self.duration, self.pduration, self.speed)
 		else:
 			# Static content like images, lines, rectangles do not need to be refreshed
 			return False
@@ -335,6 +536,7 @@ class gwidget(widget):
 			return
 
 		self.widgets.append( (widget,x,y,w,h) )
+		widget.viewport(w if w > 0 else self.width-x)
 		self.place(widget, (x,y), (w,h) )
 		return self
 
@@ -399,6 +601,70 @@ class gwidget(widget):
 
 		return ((maxw, maxh))
 
+	def charoffsets(self, msg, fontpkg, varwidth): # returns the x position of each character of a single line message
+		(fx,fy) = fontpkg['size']
+		retval = []
+		cx = 0
+		for c in msg:
+			retval.append(cx)
+			cx += self.glyph(c, fontpkg, varwidth).size[0] if varwidth else fx
+		return retval
+
+	def glyph(self, c, fontpkg, varwidth): # returns the image used to draw character c
+		try:
+			charimg = fontpkg[ord(c)]
+		except KeyError:
+			# Requested character does not exist in font.  Replace with '?'
+			charimg = fontpkg[ord('?')]
+		if varwidth:
+			return charimg
+
+		# Fixed width characters are centered in the font's cell.  Each is only cropped once.
+		if self.cells is None:
+			self.cells = { }
+		try:
+			return self.cells[c]
+		except KeyError:
+			(fx,fy) = fontpkg['size']
+			offset = (fx-charimg.size[0])/2
+			charimg = charimg.crop( (-offset,0,fx-offset,fy) )
+			charimg.load()
+			self.cells[c] = charimg
+			return charimg
+
+	def marqueestrip(self, x, width, period): # Render part of a marquee text
+		# Input
+		#	x (integer) -- Position within the text of the left edge of the strip
+		#	width (integer) -- Width of the strip
+		#	period (integer) -- The text repeats every period pixels (the text plus the scroll gap)
+
+		image = Image.new("1", (width, self.textheight), 0)
+		xs = self.marqueex
+		msg = self.marqueetext
+
+		# o is where a copy of the text begins relative to the strip
+		o = -(x % period)
+		while o < width:
+			# Skip to the first character that reaches into the strip
+			i = max(bisect.bisect_right(xs, -o)-1, 0)
+			while i < len(xs) and xs[i]+o < width:
+				image.paste(self.glyph(msg[i], self.fontpkg, self.varwidth), (xs[i]+o, 0))
+				i += 1
+			o += period
+		return image
+
+	def viewport(self, width): # Record how much of this widget a canvas shows
+		# Text being scrolled horizontally only needs to be rendered as wide as the widest window it is seen through
+		if self.type != u'scroll' or self.direction not in [u'left',u'right'] or self.widget.type != u'text':
+			return
+		if width <= self.widget.marquee:
+			return
+
+		self.widget.marquee = width
+		self.widget.curMsg = None
+		self.widget.text(self.widget.formatstring, self.widget.variables, self.widget.fontpkg, self.widget.varwidth, self.widget.specifiedsize, self.widget.just)
+		self.expand(self.gap)
+
 	def text(self, formatstring, variables, fontpkg, varwidth = True, specifiedsize=(0,0), just=u'left'):
 		# Input
 		# 	formatstring (unicode) -- format string
@@ -412,26 +678,23 @@ class gwidget(widget):
 		self.currentvardict = { }
 		for v in variables:
 			try:
-				jv = v.split(u'|')[0]
+				jv = pipeline(v)[0]
 				self.currentvardict[jv] = self.variabledict[jv]
 			except KeyError:
-				logging.debug('Trying to save state of {0} but it was not found within database'.format(jv))
+				hotlog.debug(u'Trying to save state of {0} but it was not found within database', jv)
 				pass
 
 		# save parameters for future updates
 		self.type = u'text'
-		self.formatstring = formatstring
-		self.variables = variables
-		self.fontpkg = fontpkg
-		self.varwidth = varwidth
-		self.just = just
-		self.specifiedsize = specifiedsize
+		self.spec = widgetspec(textspec, formatstring, variables, fontpkg, varwidth, specifiedsize, just)
 
 		(fx,fy) = fontpkg['size']
 		cx = 0
 		cy = 0
 		cw = 0
 
+		self.dbversion = getattr(self.variabledict, 'version', -1)
+		self.due = self.nextdue(variables)
 		msg = self.evaltext(formatstring, variables)
 		# initialize image
 
@@ -445,6 +708,7 @@ class gwidget(widget):
 			msg = ' '
 
 		maxw, maxh = self.textsize(msg, fontpkg, varwidth)
+		textwidth = maxw
 
 		# msglines = msg.split('\n')
 		# maxw = 0
@@ -459,6 +723,20 @@ class gwidget(widget):
 		width, height = specifiedsize
 		maxw = maxw if maxw > width else width
 		maxh = maxh if maxh > height else height
+
+		# A single line that is wider than the marquee it scrolls through is never rendered whole.
+		# Only the character offsets are computed and marqueestrip renders the part that is visible.
+		if self.marquee and textwidth > self.marquee and maxw == textwidth and u'\n' not in msg and just != u'centerchar':
+			self.marqueetext = msg
+			self.marqueex = self.charoffsets(msg, fontpkg, varwidth)
+			self.textwidth = textwidth
+			self.textheight = maxh
+			self.image = self.marqueestrip(0, self.marquee, textwidth)
+			self.updatesize()
+			return True
+		self.marqueetext = None
+		self.marqueex = None
+
 		self.image = Image.new("1", (maxw, maxh), 0)
 
 		lineimage = Image.new("1", (maxw, fy), 0)
@@ -539,7 +817,7 @@ class gwidget(widget):
 
 		return True
 
-	def ttext(self, formatstring, variables, fontpkg, varwidth = True, specifiedsize=8, just=u'left'):
+	def ttext(self, formatstring, variables, fontpkg, varwidth = True, specifiedsize=(0,0), just=u'left'):
 		# Input
 		# 	formatstring (unicode) -- format string
 		#	variables (unicode array) -- list of variables used to populate formatstring.  Variable values come from variabledict.
@@ -552,21 +830,18 @@ class gwidget(widget):
 		self.currentvardict = { }
 		for v in variables:
 			try:
-				jv = v.split(u'|')[0]
+				jv = pipeline(v)[0]
 				self.currentvardict[jv] = self.variabledict[jv]
 			except KeyError:
-				logging.debug('Trying to save state of {0} but it was not found within database'.format(jv))
+				hotlog.debug(u'Trying to save state of {0} but it was not found within database', jv)
 				pass
 
 		# save parameters for future updates
 		self.type = u'ttext'
-		self.formatstring = formatstring
-		self.variables = variables
-		self.fontpkg = fontpkg
-		self.varwidth = varwidth
-		self.just = just
-		self.specifiedsize = specifiedsize
+		self.spec = widgetspec(textspec, formatstring, variables, fontpkg, varwidth, specifiedsize, just)
 
+		self.dbversion = getattr(self.variabledict, 'version', -1)
+		self.due = self.nextdue(variables)
 		msg = self.evaltext(formatstring, variables)
 		# initialize image
 
@@ -579,48 +854,62 @@ class gwidget(widget):
 		if msg == '':
 			msg = ' '
 
-		maxw, maxh = self.fontpkg.getsize(msg)
-		cx = maxw
-		textimage = Image.new("1", (maxw, maxh), 0)
-
-		# msglines = msg.split('\n')
-		# maxw = 0
-		# for line in msglines:
-		# 	if maxw < len(line):
-		# 		maxw = len(line)
-		# maxw = maxw * fx
-		# maxh = len(msglines) * fy
+		# Glyphs come from the font's glyph cache.  Each line is as tall as its tallest glyph.
+		(fx,fy) = fontpkg['size']
+		lines = msg.split(u'\n')
+		sizes = []
+		for line in lines:
+			lw = 0
+			lh = 0
+			for c in line:
+				charimg, x, advance = fontpkg[ord(c)]
+				lw += advance if varwidth else fx
+				lh = max(lh, charimg.size[1])
+			sizes.append( (lw, lh or fontpkg[ord(' ')][0].size[1]) )
+		cx = max([ lw for lw, lh in sizes ])
+		cy = sum([ lh for lw, lh in sizes ])
 
 		# If a size was provided that is larger than what is required to display the text
 		# expand the image size as appropriate
-		width, height = specifiedsize
-		maxw = maxw if maxw > width else width
-		maxh = maxh if maxh > height else height
+		try:
+			width, height = specifiedsize
+		except TypeError:
+			width, height = (0,0)
+		maxw = cx if cx > width else width
+		maxh = cy if cy > height else height
 		self.image = Image.new("1", (maxw, maxh), 0)
 
-		draw = ImageDraw.Draw(textimage)
-		draw.text( (0,0), msg, font=self.fontpkg, fill='white')
-		del draw
-		# # resize to exact requirement of message
-		# self.image.crop((0,0,cx-1, cy+fy))
+		ay = 0
+		for line, (lw, lh) in zip(lines, sizes):
+			# Place line into image
+			if just == u'left':
+				ax = 0
+			elif just == u'center':
+				ax = (maxw-lw)/2
+
+			# if this is a character mode display then we need to be careful not to split a character across the character boundary
+			elif just == u'centerchar':
+				# If the number of chars is even, then we should be ok
+				if lw % 2 == 0:
+					ax = (maxw-lw)/2
+				else:
+				# If it's odd though we'll get split so add another character worth of space to the calculation
+					ax = (maxw-lw-fx)/2
+			elif just == u'right':
+				ax = (maxw-lw)
+			else:
+				ax = 0
 
-		# Place last line into image
-		if just == u'left':
-			ax = 0
-		elif just == u'center':
-			ax = (maxw-cx)/2
+			for c in line:
+				charimg, x, advance = fontpkg[ord(c)]
 
-		# if this is a character mode display then we need to be careful not to split a character across the character boundary
-		elif just == u'centerchar':
-			# If the number of chars is even, then we should be ok
-			if cx % 2 == 0:
-				ax = (maxw-cx)/2
-			else:
-			# If it's odd though we'll get split so add another character worth of space to the calculation
-				ax = (maxw-cx-fx)/2
-		elif just == u'right':
-			ax = (maxw-cx)
-		self.image.paste(textimage, (ax, 0))
+				# Center character in its cell if varwidth is False
+				offset = 0 if varwidth else (fx-advance)/2
+
+				# Glyphs can overlap their neighbours so only paste the character's set pixels
+				self.image.paste(charimg, (ax+x+offset, ay), charimg)
+				ax += advance if varwidth else fx
+			ay += lh
 
 		self.updatesize()
 
@@ -659,13 +948,13 @@ class gwidget(widget):
 		#	size (number tuple) -- width and height to draw progress bar
 		#	style (unicode) -- Sets the style of the progress bar.  Allowed values [ 'rounded', 'square' ]
 
-		self.variables = []
+		variables = []
 
 		# Convert variable to value if needed
 		if type(value) is unicode:
 			v = self.variabledict[value] if value in self.variabledict else 0
 			if value in self.variabledict:
-				self.variables.append(value)
+				variables.append(value)
 		elif type(value) is int or type(value) is float:
 			v = value
 		else:
@@ -676,7 +965,7 @@ class gwidget(widget):
 		if type(l) is unicode:
 			rvlow = self.variabledict[l] if l in self.variabledict else 0
 			if l in self.variabledict:
-				self.variables.append(l)
+				variables.append(l)
 		elif type(l) is int or type(l) is float:
 			rvlow = l
 		else:
@@ -686,7 +975,7 @@ class gwidget(widget):
 		if type(h) is unicode:
 			rvhigh = self.variabledict[h] if h in self.variabledict else 0
 			if h in self.variabledict:
-				self.variables.append(h)
+				variables.append(h)
 		elif type(h) is int or type(h) is float:
 			rvhigh = h
 		else:
@@ -694,7 +983,7 @@ class gwidget(widget):
 
 		# Save variables used for this progressbar widget
 		self.currentvardict = { }
-		for sv in self.variables:
+		for sv in variables:
 			self.currentvardict[sv] = self.variabledict[sv]
 
 		width, height = size
@@ -706,10 +995,10 @@ class gwidget(widget):
 			rvhigh = t
 
 		if v < rvlow :
-			logging.debug("v out of range with value {0}.  Should have been between {1} and {2}".format(v,rvlow,rvhigh))
+			hotlog.debug(u"v out of range with value {0}.  Should have been between {1} and {2}", v, rvlow, rvhigh)
 			v = rvlow
 		if v > rvhigh :
-			logging.debug("v out of range with value {0}.  Should have been between {1} and {2}".format(v,rvlow,rvhigh))
+			hotlog.debug(u"v out of range with value {0}.  Should have been between {1} and {2}", v, rvlow, rvhigh)
 			v = rvhigh
 
 		try:
@@ -717,36 +1006,42 @@ class gwidget(widget):
 		except ZeroDivisionError:
 			percent = 0
 
-		# If the evaluated value has not changed, skip processing
-		if percent == self.curMsg:
+		# The bar can only show whole columns so it only needs to change when the number of filled columns does
+		if height > 2:
+			level = int((width-2)*percent)
+		else:
+			level = int(width*percent)
+
+		# If the visible bar has not changed, skip processing
+		if (size, style, level) == self.curMsg:
 			return False
 		else:
-			self.curMsg = percent
-
-		# make image to place progress bar
-		self.image = Image.new("1", size, 0)
-
-		if style == u'square':
-			draw = ImageDraw.Draw(self.image)
-			if height > 2:
-				draw.line( (0,0,0,height-1),1)
-				for i in range (0,int((width-2)*percent)):
-					draw.line( (i+1,0,i+1,height-1),1)
-				for i in range (int((width-2)*percent), width-2):
-					self.image.putpixel((i+1,0), 1)
-					self.image.putpixel((i+1,height-1), 1)
-				draw.line( (width-1,0,width-1,height-1),1)
-			else:
-				for i in range (0,int((width)*percent)):
-					draw.line( (i,0,i,height-1),1)
+			self.curMsg = (size, style, level)
+
+		# Each fill level is only drawn once.  There are at most width of them.
+		if self.levels is None:
+			self.levels = { }
+		try:
+			self.image = self.levels[self.curMsg]
+		except KeyError:
+			# make image to place progress bar
+			self.image = Image.new("1", size, 0)
+
+			if style == u'square':
+				draw = ImageDraw.Draw(self.image)
+				if height > 2:
+					draw.rectangle( (0,0,width-1,height-1), outline=1, fill=0)
+					if level > 0:
+						draw.rectangle( (1,0,level,height-1), fill=1)
+				elif level > 0:
+					draw.rectangle( (0,0,level-1,height-1), fill=1)
+			self.levels[self.curMsg] = self.image
 
 
 		self.updatesize()
 
 		# Save parameters for update
-		self.value = value
-		self.rangeval = rangeval
-		self.style = style
+		self.spec = widgetspec(progressbarspec, value, rangeval, style)
 		self.type = 'progressbar'
 
 		return True
@@ -754,19 +1049,19 @@ class gwidget(widget):
 	# PROGRESSBAR widget function
 	def progressimagebar(self, maskimage, value, rangeval, direction='right'):
 		# Input
-		#	image (Image) -- The image to fill for the progress bar.  Must have a transparent region to fill!
+		#	maskimage (assets.asset) -- The image to fill for the progress bar.  Must have a transparent region to fill!
 		#	value (numeric) -- Value of the variable showing progress.
 		#	rangeval (numeric tuple) -- Range of possible values.  Used to calculate percentage complete.
 		#	direction (unicode) -- The direction to fill towards.  Allowed values ['right', 'left', 'up', 'down']
 		#	style (unicode) -- Sets the style of the progress bar.  Allowed values [ 'rounded', 'square' ]
 
-		self.variables = []
+		variables = []
 
 		# Convert variable to value if needed
 		if type(value) is unicode:
 			v = self.variabledict[value] if value in self.variabledict else 0
 			if value in self.variabledict:
-				self.variables.append(value)
+				variables.append(value)
 		elif type(value) is int or type(value) is float:
 			v = value
 		else:
@@ -777,7 +1072,7 @@ class gwidget(widget):
 		if type(l) is unicode:
 			rvlow = self.variabledict[l] if l in self.variabledict else 0
 			if l in self.variabledict:
-				self.variables.append(l)
+				variables.append(l)
 		elif type(l) is int or type(l) is float:
 			rvlow = l
 		else:
@@ -787,7 +1082,7 @@ class gwidget(widget):
 		if type(h) is unicode:
 			rvhigh = self.variabledict[h] if h in self.variabledict else 0
 			if h in self.variabledict:
-				self.variables.append(h)
+				variables.append(h)
 		elif type(h) is int or type(h) is float:
 			rvhigh = h
 		else:
@@ -795,7 +1090,7 @@ class gwidget(widget):
 
 		# Save variables used for this progressbar widget
 		self.currentvardict = { }
-		for sv in self.variables:
+		for sv in variables:
 			self.currentvardict[sv] = self.variabledict[sv]
 
 
@@ -806,60 +1101,131 @@ class gwidget(widget):
 			rvhigh = t
 
 		if v < rvlow :
-			logging.debug("v out of range with value {0}.  Should have been between {1} and {2}".format(v,rvlow,rvhigh))
+			hotlog.debug(u"v out of range with value {0}.  Should have been between {1} and {2}", v, rvlow, rvhigh)
 			v = rvlow
 		if v > rvhigh :
-			logging.debug("v out of range with value {0}.  Should have been between {1} and {2}".format(v,rvlow,rvhigh))
+			hotlog.debug(u"v out of range with value {0}.  Should have been between {1} and {2}", v, rvlow, rvhigh)
 			v = rvhigh
 
-		percent = (v - rvlow) / float((rvhigh - rvlow))
-
-		# If the evaluated value has not changed, skip processing
-		if percent == self.curMsg:
-			return False
-		else:
-			self.curMsg = percent
+		try:
+			percent = (v - rvlow) / float((rvhigh - rvlow))
+		except ZeroDivisionError:
+			percent = 0
 
-		# make a copy of the image to make the progress bar
-		self.image = maskimage.copy()
-		width, height = self.image.size
+		width, height = maskimage.body.size
 
-		if direction in ['left','right']:
-			bheight = self.image.size[1]
-			bwidth = int(width*percent)
-		elif direction in ['up','down']:
+		# direction has been checked by gwidgetProgressImageBar
+		if direction in ['up','down']:
 			bheight = int(height*percent)
-			bwidth = self.image.size[0]
+			bwidth = width
 		else:
-			logging.warning('Direction value invalid.  Defaulting to left')
-			bwidth = self.image.size[0]*percent
-			bheight = self.image.size[1]
-
-		background = Image.new("1", (width, height),0)
+			bheight = height
+			bwidth = int(width*percent)
 
-		if bwidth > 0 and bheight > 0:
-			if direction in ['right']:
-				background.paste(Image.new("1", (bwidth, bheight), 1), (self.image.size[0]-bwidth,0))
-			elif direction in ['up']:
-				background.paste(Image.new("1", (bwidth, bheight), 1), (0,self.image.size[1]-bheight))
-			else: # ['left', 'down'] or default if bad direction provided
-				background.paste(Image.new("1", (bwidth, bheight), 1), (0,0))
+		# If the visible fill has not changed, skip processing
+		if (direction, bwidth, bheight) == self.curMsg:
+			return False
+		else:
+			self.curMsg = (direction, bwidth, bheight)
 
-		# Combine background with image
-		background.paste(self.image, (0,0), self.image)
-		self.image = background
+		# Each fill level is only composited once
+		if self.levels is None:
+			self.levels = { }
+		try:
+			self.image = self.levels[self.curMsg]
+		except KeyError:
+			background = Image.new("1", (width, height),0)
+
+			if bwidth > 0 and bheight > 0:
+				if direction in ['right']:
+					box = (width-bwidth, 0, width, height)
+				elif direction in ['up']:
+					box = (0, height-bheight, width, height)
+				else: # ['left', 'down']
+					box = (0, 0, bwidth, bheight)
+				background.paste(1, box)
+
+			# Combine background with image
+			background.paste(maskimage.body, (0,0), maskimage.mask)
+			self.image = background
+			self.levels[self.curMsg] = self.image
 
 		self.updatesize()
 
 		# Save parameters for update
-		self.value = value
-		self.rangeval = rangeval
-		self.direction = direction
-		self.maskimage = maskimage
+		self.spec = widgetspec(progressimagebarspec, maskimage, value, rangeval, direction)
 		self.type = 'progressimagebar'
 
 		return True
 
+	# ALBUMART widget function
+	def albumart(self, size, dither=u'floydsteinberg', placeholder=None):
+		# Input
+		#	size (integer tuple) -- size of the widget.  The artwork is scaled to fit within it.
+		#	dither (unicode) -- How the artwork is reduced to 1 bit.  Allowed values [ 'floydsteinberg', 'ordered', 'none' ]
+		#	placeholder (assets.asset) -- Image shown until the artwork is ready.  Blank if None.
+		# The artwork is fetched and dithered by albumart.cache.  Until it is ready the placeholder is shown
+		# and the cache is asked again on every update.  curMsg holds the key of the artwork and whether it is shown.
+
+		if self.type != 'albumart':
+			self.spec = widgetspec(albumartspec, size, dither, placeholder)
+			self.type = 'albumart'
+			self.curMsg = None
+
+		if self.curMsg is not None and self.curMsg[1] and not self.changedsince(albumart.VARIABLES):
+			return False
+		self.dbversion = getattr(self.variabledict, 'version', -1)
+
+		key = albumart.key(self.variabledict)
+		art = None
+		if key is not None:
+			art = albumart.cache.get(key, size, dither, self.variabledict['uri'] if 'uri' in self.variabledict else u'')
+
+		if art is not None:
+			if self.curMsg == (key, True):
+				return False
+			self.image = art
+		else:
+			if self.curMsg is not None and not self.curMsg[1]:
+				self.curMsg = (key, False)
+				return False
+			self.image = Image.new('1', size)
+			if placeholder is not None:
+				self.image.paste(placeholder.body, (0,0), placeholder.mask)
+		self.curMsg = (key, art is not None)
+		self.updatesize()
+
+		return True
+
+	# VUMETER and SPECTRUM widget function
+	def meter(self, kind, value, peak, size, direction=u'up', gap=1):
+		# Input
+		#	kind (unicode) -- Type of meter.  Allowed values [ 'vumeter', 'spectrum' ]
+		#	value (unicode) -- Name of the variable holding the level (0-100) of each bar.  e.g. audio_rms or audio_spectrum
+		#	peak (unicode) -- Name of the variable holding the peak (0-100) of each bar.  Drawn as a line across the bar.  None for no peaks.
+		#	size (integer tuple) -- size of the widget
+		#	direction (unicode) -- The direction the bars grow towards.  Allowed values [ 'up', 'down', 'left', 'right' ]
+		#	gap (integer) -- pixels between bars
+		# curMsg holds the levels and peaks that were drawn
+
+		variables = [ value, peak ] if peak else [ value ]
+		if self.type == kind and not self.changedsince(variables):
+			return False
+		self.dbversion = getattr(self.variabledict, 'version', -1)
+
+		levels = self.variabledict[value] if value in self.variabledict else ()
+		peaks = self.variabledict[peak] if peak and peak in self.variabledict else ()
+		if self.type == kind and self.curMsg == (levels, peaks):
+			return False
+
+		self.type = kind
+		self.spec = widgetspec(meterspec, value, peak, size, direction, gap)
+		self.curMsg = (levels, peaks)
+		self.image = meters.bars(levels, peaks, size, direction, gap)
+		self.updatesize()
+
+		return True
+
 
 	# LINE widget function
 	def line(self, (x,y), color=1):
@@ -881,8 +1247,7 @@ class gwidget(widget):
 		self.updatesize()
 
 		# save parameters
-		self.xy = (x,y)
-		self.color = color
+		self.spec = widgetspec(linespec, (x,y), color)
 
 		return True
 
@@ -906,19 +1271,18 @@ class gwidget(widget):
 		self.updatesize()
 
 		# save parameters
-		self.xy = (x,y)
-		self.fill = fill
-		self.outline = outline
+		self.spec = widgetspec(rectanglespec, (x,y), fill, outline)
 
 		return True
 
 	# POPUP widget function
-	def popup(self, widget, dheight, duration=15, pduration=10): # Set up for pop-up display
+	def popup(self, widget, dheight, duration=15, pduration=10, speed=8): # Set up for pop-up display
 		# Input
 		#	widget (widget) -- Widget to pop up
 		#	dheight (integer) -- Sets the height of the window which will get displayed from the canvas
 		#	duration (float) -- How long to display the top of the canvas
 		#	pduration (float) -- How long to stay popped up
+		#	speed (float) -- How fast to slide between the top and the bottom in pixels per second
 
 		# If this is the first pass, initialize state variables
 		try:
@@ -927,45 +1291,66 @@ class gwidget(widget):
 			self.type = u'popup'
 			self.popped = False
 			self.end = time.time() + duration
-			self.image = widget.image
-			self.updatesize()
 			self.index = 0
+			self.windows = { }		# Cropped window at each index.  Emptied when the widget changes.
 
 			# Save parameters
 			self.widget = widget
-			self.dheight = dheight
-			self.duration = duration
-			self.pduration = pduration
+			self.spec = widgetspec(popupspec, dheight, duration, pduration, speed)
+
+			self.image = self.window(self.index)
+			self.updatesize()
+			return True
 
 		# Update the widget if needed
-		self.widget.update()
+		changed = self.widget.update()
+		if changed:
+			self.windows = { }
+
+		now = time.time()
 
-		# If we are waiting for a transition
-		if self.end > time.time():
-			self.image = self.widget.image.crop( (0, self.index, self.widget.size[0], self.index+self.dheight) )
+		# If we are waiting for a transition nothing moves
+		if self.end > now:
+			if not changed:
+				return False
+			self.image = self.window(self.index)
 			self.updatesize()
 			return True
 
+		# The slide started when the wait ended.  Position it by how long it has been sliding.
+		travel = max(self.widget.size[1] - self.dheight, 0)
+		moved = int((now - self.end) * self.speed)
 		if self.popped:
 			# Move back into non-popped mode
-			if self.index > 0:
-				self.index -= 1
-			else:
+			index = travel - moved
+			if index <= 0:
+				index = 0
 				self.popped = False
-				self.end = time.time()+self.duration
+				self.end = now + self.duration
 		else:
 			# Move into popped mode
-			if self.index < self.widget.size[1] - self.dheight:
-				self.index += 1
-			else:
+			index = moved
+			if index >= travel:
+				index = travel
 				self.popped = True
-				self.end = time.time() + self.pduration
+				self.end = now + self.pduration
+
+		if index == self.index and not changed:
+			return False
 
-		self.image = self.widget.image.crop( (0, self.index, self.widget.size[0], self.index+self.dheight) )
+		self.index = index
+		self.image = self.window(self.index)
 		self.updatesize()
 
 		return True
 
+	def window(self, index): # Return the part of a popup's widget that is visible at index
+		try:
+			return self.windows[index]
+		except KeyError:
+			self.windows[index] = self.widget.image.crop( (0, index, self.widget.size[0], index+self.dheight) )
+			return self.windows[index]
+
 	# SCROLL widget function
 	def scroll(self, widget, direction=u'left', distance=1, speed=1, gap=20, hesitatetype=u'onloop', hesitatetime=2, threshold=0, reset=False): # Set up for scrolling
 		# Input
@@ -1002,42 +1387,19 @@ class gwidget(widget):
 			self.shouldscroll = False
 
 			# Save parameters
+			# speed is used to slow scroll.  Speed is an integer that tells how many calls to scroll before an update is made
 			self.widget = widget
 			direction = direction.lower()
-			self.direction = direction
-			self.distance = distance
-			self.speed = speed # Used to slow scroll.  Speed is an integer that tells how many calls to scroll before an update is made
-			self.speedcount = speed
-			self.gap = gap
 			hesitatetype = hesitatetype.lower()
-			self.hesitatetype = hesitatetype
-			self.hesitatetime = hesitatetime
-			self.threshold = threshold
 
 			# Make sure direction is valid.  Set to 'left' if not.
-			if self.direction not in [u'left',u'right',u'up',u'down']:
-				self.direction = u'left'
+			if direction not in [u'left',u'right',u'up',u'down']:
+				direction = u'left'
 
-			# Set height and width for expanded image
-			self.eheight = self.widget.size[1] if self.direction in [u'left',u'right'] else self.widget.size[1]+gap
-			self.ewidth = self.widget.size[0]+gap if self.direction in [u'left',u'right'] else self.widget.size[0]
-
-			# Update image using current index values
-			self.expanded_image = self.widget.image.copy().crop( (0,0,self.ewidth,self.eheight) )
-			self.image = self.expanded_image.copy()
-			self.image.paste( self.widget.image, (0,0) )
+			self.spec = widgetspec(scrollspec, direction, distance, speed, gap, hesitatetype, hesitatetime, threshold)
+			self.speedcount = speed
 
-			# Check to see if scrolling is needed
-			if self.direction in ['left','right']:
-				if self.widget.size[0] > self.threshold:
-					self.shouldscroll = True
-				else:
-					self.shouldscroll = False
-			elif self.direction in ['up','down']:
-				if self.widget.height > self.threshold:
-					self.shouldscroll = True
-				else:
-					self.shouldscroll = False
+			self.expand(gap)
 			return True
 
 			# # Expand canvas
@@ -1069,26 +1431,7 @@ class gwidget(widget):
 			# Reset speed count
 			self.speedcount = self.speed
 
-			# Set height and width for expanded image
-			self.eheight = self.widget.size[1] if self.direction in [u'left',u'right'] else self.widget.size[1]+gap
-			self.ewidth = self.widget.size[0]+gap if self.direction in [u'left',u'right'] else self.widget.size[0]
-
-			# Update image using current index values
-			self.expanded_image = self.widget.image.copy().crop( (0,0,self.ewidth,self.eheight) )
-			self.image = self.expanded_image.copy()
-			self.image.paste( self.widget.image, (0,0) )
-
-			# Check to see if scrolling is needed
-			if self.direction in ['left','right']:
-				if self.widget.size[0] > self.threshold:
-					self.shouldscroll = True
-				else:
-					self.shouldscroll = False
-			elif self.direction in ['up','down']:
-				if self.widget.height > self.threshold:
-					self.shouldscroll = True
-				else:
-					self.shouldscroll = False
+			self.expand(gap)
 			return True
 
 		# Decrement the speed counter and test to see if this update should be skipped
@@ -1119,18 +1462,21 @@ class gwidget(widget):
 			if self.vindex < 0:
 				self.vindex = self.eheight
 
-		# Reset expanded_image
-		self.expanded_image = self.widget.image.copy().crop( (0,0,self.ewidth,self.eheight) )
-
 		# Update image using current index values
-		if direction in [u'left',u'right']:
+		if self.widget.marqueetext is not None and direction in [u'left',u'right']:
+			self.image = self.marqueeview()
+		elif direction in [u'left',u'right']:
+			# Reset expanded_image
+			self.expanded_image = self.widget.image.copy().crop( (0,0,self.ewidth,self.eheight) )
 			hregion = self.expanded_image.crop( (0,0,self.hindex,self.eheight) )
 			hbody = self.expanded_image.crop( (self.hindex,0,self.ewidth,self.eheight) )
 			self.image.paste( hbody, (0,0) )
 			self.image.paste( hregion, (self.ewidth - self.hindex, 0) )
 		elif direction in [u'up',u'down']:
-			vregion = expanded_image.crop( (0,0,self.ewidth,self.vindex) )
-			vbody = expanded_image.crop( (0,self.vindex,self.ewidth,self.eheight) )
+			# Reset expanded_image
+			self.expanded_image = self.widget.image.copy().crop( (0,0,self.ewidth,self.eheight) )
+			vregion = self.expanded_image.crop( (0,0,self.ewidth,self.vindex) )
+			vbody = self.expanded_image.crop( (0,self.vindex,self.ewidth,self.eheight) )
 			self.image.paste( vbody, (0,0) )
 			self.image.paste( vregion, (0, self.eheight - self.vindex) )
 
@@ -1140,64 +1486,149 @@ class gwidget(widget):
 
 		return True
 
+	def expand(self, gap): # Size the scroll's loop (widget plus gap) and render its image at the current index
+		marquee = self.widget.marqueetext is not None and self.direction in [u'left',u'right']
+		width = self.widget.textwidth if marquee else self.widget.size[0]
+
+		# Set height and width for expanded image
+		self.eheight = self.widget.size[1] if self.direction in [u'left',u'right'] else self.widget.size[1]+gap
+		self.ewidth = width+gap if self.direction in [u'left',u'right'] else self.widget.size[0]
+
+		# Update image using current index values
+		self.strip = None
+		if marquee:
+			self.expanded_image = None
+			self.image = self.marqueeview()
+		else:
+			self.expanded_image = self.widget.image.copy().crop( (0,0,self.ewidth,self.eheight) )
+			self.image = self.expanded_image.copy()
+			self.image.paste( self.widget.image, (0,0) )
+
+		# Check to see if scrolling is needed
+		if self.direction in ['left','right']:
+			if width > self.threshold:
+				self.shouldscroll = True
+			else:
+				self.shouldscroll = False
+		elif self.direction in ['up','down']:
+			if self.widget.height > self.threshold:
+				self.shouldscroll = True
+			else:
+				self.shouldscroll = False
+
+	# Extra width rendered ahead of the visible window of a marquee so that it is not rendered again on every step
+	LOOKAHEAD = 32
+
+	def marqueeview(self): # Return the visible window of a scrolling marquee
+		w = self.widget.marquee
+		if self.strip is None or self.hindex < self.stripx or self.hindex+w > self.stripx+self.strip.size[0]:
+			self.stripx = self.hindex if self.direction == u'left' else self.hindex-self.LOOKAHEAD
+			self.strip = self.widget.marqueestrip(self.stripx, w+self.LOOKAHEAD, self.ewidth)
+		x = self.hindex-self.stripx
+		return self.strip.crop( (x, 0, x+w, self.eheight) )
+
+
 class gwidgetText(gwidget):
+	__slots__ = ()
+
 	def __init__(self, formatstring, fontpkg, variabledict={ }, variables =[], varwidth = True, size=(0,0), just=u'left'):
 		super(gwidgetText, self).__init__(variabledict)
 		self.text(formatstring, variables, fontpkg, varwidth, size, just)
 
 class gwidgetTText(gwidget):
-	def __init__(self, formatstring, fontpkg, variabledict={ }, variables =[], varwidth = True, size=8, just=u'left'):
+	__slots__ = ()
+
+	def __init__(self, formatstring, fontpkg, variabledict={ }, variables =[], varwidth = True, size=(0,0), just=u'left'):
 		super(gwidgetTText, self).__init__(variabledict)
 		self.ttext(formatstring, variables, fontpkg, varwidth, size, just)
 
 class gwidgetProgressBar(gwidget):
+	__slots__ = ()
+
 	def __init__(self, value, rangeval, size, style=u'square',variabledict={ }):
 		super(gwidgetProgressBar, self).__init__(variabledict)
 		self.progressbar(value, rangeval, size, style)
 
 class gwidgetProgressImageBar(gwidget):
+	__slots__ = ()
+
 	def __init__(self, maskimage, value, rangeval, direction=u'left',variabledict={ }):
 		super(gwidgetProgressImageBar, self).__init__(variabledict)
+		if isinstance(maskimage, Image.Image):
+			maskimage = assets.fromimage(maskimage)
+		# An invalid direction is replaced once here so that the spec holds the direction that is drawn
+		if direction not in ['left', 'right', 'up', 'down']:
+			logging.warning('Progressimagebar direction {0} is invalid.  Defaulting to left'.format(direction))
+			direction = u'left'
 		self.progressimagebar(maskimage, value, rangeval, direction)
 
+class gwidgetAlbumArt(gwidget):
+	__slots__ = ()
+
+	def __init__(self, size, dither=u'floydsteinberg', placeholder=None, variabledict={ }):
+		super(gwidgetAlbumArt, self).__init__(variabledict)
+		self.albumart(size, dither, placeholder)
+
+class gwidgetMeter(gwidget):
+	__slots__ = ()
+
+	def __init__(self, kind, value, peak, size, direction=u'up', gap=1, variabledict={ }):
+		super(gwidgetMeter, self).__init__(variabledict)
+		loadmeters()
+		self.meter(kind, value, peak, size, direction, gap)
+
 class gwidgetImage(gwidget):
+	__slots__ = ()
+
 	def __init__(self, image, size=(0,0)):
 		super(gwidgetImage, self).__init__()
 		self.imagewidget(image, size)
 
 class gwidgetLine(gwidget):
+	__slots__ = ()
+
 	def __init__(self, (x,y), color=1):
 		super(gwidgetLine, self).__init__()
 		self.line((x,y), color)
 
 class gwidgetRectangle(gwidget):
+	__slots__ = ()
+
 	def __init__(self, (x,y), fill=0, outline=1):
 		super(gwidgetRectangle, self).__init__()
 		self.rectangle((x,y), fill, outline)
 
 class gwidgetCanvas(gwidget):
+	__slots__ = ()
+
 	def __init__(self, (w,h)):
 		super(gwidgetCanvas, self).__init__()
 		self.canvas((w,h))
 
 class gwidgetPopup(gwidget):
-	def __init__(self, widget, dheight, duration=15, pduration=10):
+	__slots__ = ()
+
+	def __init__(self, widget, dheight, duration=15, pduration=10, speed=8):
 		super(gwidgetPopup, self).__init__()
-		self.popup(widget, dheight, duration, pduration)
+		self.popup(widget, dheight, duration, pduration, speed)
 
 class gwidgetScroll(gwidget):
+	__slots__ = ()
+
 	def __init__(self, widget, direction=u'left', distance=1, speed=1, gap=20, hesitatetype=u'onloop', hesitatetime=2, threshold=0, reset=False):
 		super(gwidgetScroll, self).__init__()
 		self.scroll(widget, direction, distance, speed, gap, hesitatetype, hesitatetime,threshold,reset)
 
 
 class sequence(object): # Holds a sequence of widgets to display on the screen in turn
-	def __init__(self, name, conditional, db, dbprevious, coolingperiod, minimum, coordinates): # initialize class
+	def __init__(self, name, conditional, db, dbprevious, coolingperiod, minimum, coordinates, z=0, opaque=True): # initialize class
 		# Input
 		#	conditional (unicode) -- a string containing an evaluable boolean logic statement which determines whether the sequence is active
 		#	db (dict) -- A dictionary that points to system variable db
 		#	dbp (dict) -- A dictionary that points to the previous state of the system variable db
 		#	coolingperiod (float) -- Amount of time to wait before a sequence can be displayed again
+		#	z (integer) -- Layer order.  Sequences with a higher z are drawn on top of sequences with a lower z
+		#	opaque (bool) -- If True the layer hides everything beneath its bounding box.  If False it is OR'ed onto the layers below
 
 		self.widgets = []					# Array to hold widget list
 		self.name = name			# Name of sequence
@@ -1211,6 +1642,9 @@ class sequence(object): # Holds a sequence of widgets to display on the screen i
 		self.currentwidget = 0				# Marks the index of the current widget
 		self.minimum = minimum				# When this sequence activates, keep in active for a least minimum seconds
 		self.expires = 0					# Time that this sequence can be allowed to go inactive
+		self.z = z							# Layer order used by the display_controller compositor
+		self.opaque = opaque				# Whether this layer hides the layers beneath it
+		self.pendingreset = False			# Set when the current widget changed while the layer was not being rendered
 
 		return
 
@@ -1236,15 +1670,19 @@ class sequence(object): # Holds a sequence of widgets to display on the screen i
 		db = self.db
 		dbp = self.dbp
 
+		code = condition(conditional)
+		if code is None:
+			return False
 		try:
-			return eval(conditional)
+			return eval(code)
 		except:
 			# Could not evaluate conditional so returning False
 			return False
 
- 	def get(self, restart=False): # Return current widget (or None) if none are active
+	def get(self, restart=False, render=True): # Return current widget (or None) if none are active
 		# Input
 		#	restart (bool) -- If True resets the sequence to the first widget on the list
+		#	render (bool) -- If False, advance the sequence timers but do not update the widget.  Call render to update it later.
 
 		# Evaluate sequence conditional and check for cooling period.
 		if self.expires < time.time() and (not self.evalconditional(self.conditional) or self.coolingexpires > time.time()):
@@ -1278,7 +1716,9 @@ class sequence(object): # Holds a sequence of widgets to display on the screen i
 				widget, duration, conditional = self.widgets[self.currentwidget]
 				if self.evalconditional(conditional):
 					self.end = duration + time.time()
-					widget.update(True)
+					self.pendingreset = True
+					if render:
+						self.render(widget)
 					return widget
 				else:
 					self.currentwidget += 1
@@ -1289,68 +1729,150 @@ class sequence(object): # Holds a sequence of widgets to display on the screen i
 			return None
 		else:
 			# If current widget is active and has not expired, then return it
-			widget.update()
+			if render:
+				self.render(widget)
 			return widget
 
+	def render(self, widget): # Update the widget returned by get
+		# Input
+		#	widget (widget) -- The current widget of this sequence
+
+		# If the sequence switched widgets while this layer was hidden, the widget still needs its reset
+		reset = self.pendingreset
+		self.pendingreset = False
+		return widget.update(reset)
+
+	def bbox(self, widget, size): # Return the region of the display that widget covers when drawn by this sequence
+		# Input
+		#	widget (widget) -- The current widget of this sequence
+		#	size (integer tuple) -- Size of the display.  The box is clipped to it.
+
+		x,y = self.coordinates
+		w,h = widget.size
+		dw,dh = size
+		return ( max(x,0), max(y,0), min(x+w,dw), min(y+h,dh) )
+
 class display_controller(object):
 	def __init__(self, size):
 		self.sequences = []
+		self.layers = []
 		self.size = size
 
-	def load(self, file, db, dbp,): # Load config file and initialize sequences
+		self.image = None			# Last frame composited
+		self.frame = None			# Last frame composited as a bitmap
+		self.delivered = None		# Bitmap of the last frame returned to a caller that displayed it
+		self.lastactive = []		# (widget, sequence) pairs that made up the last frame
+		self.undelivered = False	# True if a frame was composited by a call that did not consume it
+		self.lock = threading.Lock()	# Serializes calls to next
+		self.pending = None			# (plan, compile time) of a changed page file waiting to be swapped in by next
+		self.sequencedefs = []		# (page file entry, sequence or None if it could not be built) for each sequence
+
+		self.source = { }
+		self.sourcep = { }
+		self.db = pinnedview(self.source)
+		self.dbp = pinnedview(self.sourcep)
+
+		# Frame statistics
+		self.stats = { 'frames':0, 'skipped':0, 'culled':0, 'reloads':0 }
+
+	def load(self, file, db, dbp, plan=None): # Load config file and initialize sequences
 		# Input
 		#	file (unicode) -- file that contains a valid display configuration
+		#	plan (pageplan) -- the plan of file if the caller has already loaded it (see pageplan.load)
 
 		self.file = file
-		self.db = db
-		self.dbp = dbp
+
+		# Widgets and sequences read db through pinned views.  If db publishes snapshots
+		# (see sources.musicstore) each frame is rendered from the latest snapshot which
+		# means the caller does not need to lock db while calling next.
+		self.source = db
+		self.sourcep = dbp
+		self.db = pinnedview(db)
+		self.dbp = pinnedview(dbp)
 
 		self.pages = None
 		self.widgets = { }
 		self.sequences = []
+		self.sequencedefs = []
 		self.errwidgets = { }
 		self.defaultfontpkg = None
+		self.pending = None
 
 		logging.debug("Loading {0} as page file".format(file))
-		# If page file provided, try to load provided file on top of default pages file
+		# The page file is validated and compiled into a plan (or the plan is read from the cache if the page file has not changed)
 		try:
-			newpages = imp.load_source('pages', file)
-				# Need to have the following structures to be valid
-			self.pages = newpages
+			self.pages = plan if plan is not None else pageplan.load(file)
 		except:
 			logging.critical('Page file {0} was unable to be loaded'.format(file))
 			self.pages = None
 			raise
 
+		logging.debug('Using {0} plan for {1}'.format('cached' if self.pages.cached else 'new', file))
+		self.definitions = pageplan.definitions(self.pages)
+		self.prepare(self.pages)
+		self.loadassets(self.pages)
+
+		# Add type field to CANVAS widgets
+		for k,v in self.pages.CANVASES.iteritems():
+			v['type'] = 'canvas'
+
+		self.loadwidgets(self.pages.WIDGETS)
+		self.loadwidgets(self.pages.CANVASES)
+		self.loadsequences(self.pages.SEQUENCES)
+
+		# Report which of db's derived variables the page file uses.  Derived variables are only computed when read so the rest are never computed.
+		self.variables = self.references()
+		try:
+			derived = sorted(set(self.source.derivednames()) & self.variables)
+			logging.debug('Page file uses derived variables {0}'.format(', '.join(derived) if derived else 'none'))
+		except AttributeError:
+			# db does not have derived variables
+			pass
+
+	def prepare(self, plan): # Report the problems found in plan and add its compiled variables and conditionals to the module caches
+		for level, msg in plan.errors:
+			logging.log(level, 'Page file {0}: {1}'.format(os.path.basename(plan.file), msg))
+		pipelines.update(plan.pipelines)
+		for k, v in plan.conditions.iteritems():
+			conditions[k] = marshal.loads(v) if v is not None else None
+
+	def loadassets(self, plan): # Load the fonts and images of plan.  Entries that already have their font or image are left alone.
+		self.defaultfontpkg = None
+
 		# Load fonts
 		try:
-			for k,v in self.pages.FONTS.iteritems():
+			for k,v in plan.FONTS.iteritems():
 				fontfile = v['file'] if 'file' in v else ''
 				isdefault = v['default'] if 'default' in v else False
-				if fontfile:
+				if 'fontpkg' in v:
+					pass
+				elif fontfile:
 	#				try:
 #					logging.debug('Loading font {0}'.format(k))
 					v['fontpkg'] = fonts.bmfont.bmfont(fontfile).fontpkg
-					if isdefault:
-						self.defaultfontpkg = v['fontpkg']
+					v['fontpkg'].preload(v.get('preload', ''))
 	#				except:
 						# Font load failed
 	#					logging.critical('Attempt to load font {0} failed'.format(fontfile))
 				else:
 					logging.critical('Expected a font file for {0} but none provided'.format(k))
+				if isdefault and 'fontpkg' in v:
+					self.defaultfontpkg = v['fontpkg']
 		except AttributeError:
 			# No fonts specified
 			pass
 
 		# Load truetype fonts
 		try:
-			for k,v in self.pages.TRUETYPE_FONTS.iteritems():
+			for k,v in plan.TRUETYPE_FONTS.iteritems():
 				fontfile = v['file'] if 'file' in v else ''
 				fontsize = v['size'] if 'size' in v else 8
-				if fontfile:
+				if 'fontpkg' in v:
+					pass
+				elif fontfile:
 #					logging.debug('Loading font {0}'.format(k))
 					try:
-						v['fontpkg'] = ImageFont.truetype(font=fontfile, size=fontsize)
+						v['fontpkg'] = fonts.ttfont.ttfont(fontfile, fontsize)
 					except IOError:
 						logging.critical('Font {0} not found'.format(fontfile))
 				else:
@@ -1368,13 +1890,15 @@ class display_controller(object):
 
 		try:
 			# Load images
-			for k,v in self.pages.IMAGES.iteritems():
+			for k,v in plan.IMAGES.iteritems():
 				imagefile = v['file'] if 'file' in v else ''
-				if imagefile:
-					logging.debug('Loading image {0}'.format(k))
+				if 'image' in v:
+					pass
+				elif imagefile:
 					try:
 						i_path = os.path.join(os.path.dirname(__file__), 'images', imagefile)
-						v['image'] = Image.open(i_path)
+						v['image'] = assets.load(i_path)
+						logging.debug('Loaded image {0} ({1}): {2}'.format(k, imagefile, assets.describe(v['image'])))
 					except IOError:
 						logging.critical('Failed to open file {0} for image {1}'.format(i_path, k))
 				else:
@@ -1383,13 +1907,171 @@ class display_controller(object):
 			# No Images specified
 			pass
 
-		# Add type field to CANVAS widgets
-		for k,v in self.pages.CANVASES.iteritems():
-			v['type'] = 'canvas'
+	def splash(self, fontpkg, message='Starting'): # Return a frame with message centered on it.  Used before the page file has loaded.
+		img = Image.new("1", self.size)
+		widget = gwidgetText(message, fontpkg, {}, [], True)
+		w, h = widget.image.size
+		img.paste(widget.image, ( max(0, (self.size[0]-w)/2), max(0, (self.size[1]-h)/2) ))
+		return img
 
-		self.loadwidgets(self.pages.WIDGETS)
-		self.loadwidgets(self.pages.CANVASES)
-		self.loadsequences(self.pages.SEQUENCES)
+	def watch(self, interval=2): # Reload the page file whenever it is saved
+		# Uses inotify if pyinotify is installed.  Otherwise the page file is checked every interval seconds.
+		# The page file is compiled on the watching thread and swapped in by next between frames.
+		# Modules the page file imports (e.g. pydPiper_config) are not reimported so changes to them still require a restart.
+		try:
+			import pyinotify
+		except ImportError:
+			pyinotify = None
+
+		if pyinotify is not None:
+			path = os.path.abspath(self.file)
+			controller = self
+
+			class handler(pyinotify.ProcessEvent):
+				def process_default(self, event):
+					if event.pathname == path:
+						controller.refresh()
+
+			wm = pyinotify.WatchManager()
+			self.notifier = pyinotify.ThreadedNotifier(wm, handler())
+			self.notifier.daemon = True
+			self.notifier.start()
+
+			# Editors often save by renaming a new file over the old one so the directory is watched instead of the file
+			wm.add_watch(os.path.dirname(path), pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO)
+			logging.debug('Watching {0} for changes with inotify'.format(self.file))
+		else:
+			watch_t = threading.Thread(target=self.poll, args=(interval,))
+			watch_t.daemon = True
+			watch_t.start()
+			logging.debug('Checking {0} for changes every {1} seconds'.format(self.file, interval))
+
+	def poll(self, interval): # Check the page file's modification time and size every interval seconds
+		# The first check compares the page file with the loaded plan in case it changed before watch was called
+		last = None
+		while True:
+			try:
+				st = os.stat(self.file)
+				stamp = (st.st_mtime, st.st_size)
+			except OSError:
+				# The file can briefly disappear while an editor saves it
+				stamp = None
+
+			if stamp is not None and stamp != last:
+				self.refresh()
+				last = stamp
+			time.sleep(interval)
+
+	def refresh(self): # Compile the page file and queue the new plan for next if it differs from the loaded one
+		start = time.time()
+		try:
+			plan = pageplan.load(self.file)
+		except Exception as e:
+			# Keep showing the loaded pages until the page file is fixed
+			logging.error('Unable to reload page file {0}: {1}'.format(self.file, e))
+			return
+
+		# Saved without changes
+		if plan.dependencies == self.pages.dependencies:
+			return
+		self.pending = (plan, time.time() - start)
+
+	def reload(self, plan, compiletime=0): # Swap plan in for the loaded page file.  Only the widgets, canvases and sequences that changed are rebuilt.
+		# Input
+		#	plan (pageplan) -- The new plan for the page file
+		#	compiletime (float) -- How long plan took to compile.  Used for the report.
+		# Returns True if the plan was swapped in.  If anything fails the loaded page file is kept.
+
+		start = time.time()
+		new = pageplan.definitions(plan)
+		changes = pageplan.diff(self.definitions, new)
+		saved = (self.pages, self.definitions, self.widgets, self.sequences, self.sequencedefs, self.layers, self.defaultfontpkg, self.defaultwidget)
+
+		try:
+			# Fonts and images that did not change are reused
+			for name, key in [ ('FONTS', 'fontpkg'), ('TRUETYPE_FONTS', 'fontpkg'), ('IMAGES', 'image') ]:
+				for k,v in getattr(plan, name).iteritems():
+					entry = getattr(self.pages, name).get(k, { })
+					if k not in changes[name] and key in entry:
+						v[key] = entry[key]
+
+			self.pages = plan
+			self.definitions = new
+			self.prepare(plan)
+			self.loadassets(plan)
+
+			# Widgets and canvases are built into a copy so the loaded ones are untouched if something fails
+			self.widgets = dict( (k,w) for k,w in self.widgets.iteritems() if k not in changes['WIDGETS'] and k not in changes['CANVASES'] )
+			self.loadwidgets(dict( (k,v) for k,v in plan.WIDGETS.iteritems() if k in changes['WIDGETS'] ))
+			self.loadwidgets(dict( (k,v) for k,v in plan.CANVASES.iteritems() if k in changes['CANVASES'] ))
+
+			# Sequences that are kept keep their timers and current canvas
+			kept = list(self.sequencedefs)
+			self.sequences = []
+			self.sequencedefs = []
+			for i, value in enumerate(plan.SEQUENCES):
+				if i in changes['SEQUENCES']:
+					seq = self.loadsequence(value, len(self.sequences))
+				else:
+					seq = None
+					for j, (d, s) in enumerate(kept):
+						if d == value:
+							seq = s
+							del kept[j]
+							break
+					if seq is not None:
+						seq.z = value['z'] if 'z' in value else len(self.sequences)
+				self.sequencedefs.append( (value, seq) )
+				if seq is not None:
+					self.sequences.append(seq)
+			self.layers = sorted(self.sequences, key=lambda s: s.z)
+		except Exception as e:
+			self.pages, self.definitions, self.widgets, self.sequences, self.sequencedefs, self.layers, self.defaultfontpkg, self.defaultwidget = saved
+			logging.error('Unable to reload page file {0}: {1}.  Keeping the loaded pages.'.format(self.file, e))
+			return False
+
+		self.variables = self.references()
+		self.lastactive = []
+		self.stats['reloads'] += 1
+
+		# Forget the specs of the widgets that were replaced
+		before = len(specs)
+		prunespecs(self.widgets.values() + [ w for s in self.sequences for w, duration, conditional in s.widgets ] + [ self.defaultwidget ])
+		logging.debug('Dropped {0} of {1} widget specs after reload'.format(before - len(specs), before))
+
+		logging.info('Reloaded {0} in {1:.1f}ms ({2:.1f}ms to compile).  Rebuilt {3} of {4} widgets, {5} of {6} canvases and {7} of {8} sequences'.format(
+			os.path.basename(self.file), (time.time()-start)*1000, compiletime*1000,
+			len(changes['WIDGETS'] & set(plan.WIDGETS)), len(plan.WIDGETS),
+			len(changes['CANVASES'] & set(plan.CANVASES)), len(plan.CANVASES),
+			len(changes['SEQUENCES']), len(plan.SEQUENCES)))
+		return True
+
+	def references(self): # Return the names of the db variables used by the page file's widgets and conditionals
+		names = set()
+
+		for k,v in self.pages.WIDGETS.iteritems():
+			for var in v['variables'] if 'variables' in v else []:
+				names.add(pipeline(var)[0])
+			# Progress bars name their variables directly
+			for var in [ v['value'] if 'value' in v else None ] + list(v['rangeval'] if 'rangeval' in v else []):
+				if isinstance(var, basestring):
+					names.add(var)
+			# Album art is chosen by the track
+			if 'type' in v and v['type'] == 'albumart':
+				names.update(albumart.VARIABLES)
+			# Meters name their variables directly
+			if isinstance(v.get('peak'), basestring):
+				names.add(v['peak'])
+
+		conditionals = []
+		for seq in self.pages.SEQUENCES:
+			conditionals.append(seq['conditional'] if 'conditional' in seq else '')
+			for c in seq['canvases'] if 'canvases' in seq else []:
+				conditionals.append(c['conditional'] if 'conditional' in c else '')
+		for c in conditionals:
+			names.update(re.findall(r"""dbp?\[\s*u?['"]([^'"]+)['"]\s*\]""", c))
+
+		return names
 
 
 
@@ -1401,7 +2083,7 @@ class display_controller(object):
 
 #			logging.debug('Loading widget {0}'.format(k))
 
-			if typeval not in ['canvas', 'text', 'ttext', 'progressbar', 'progressimagebar', 'line', 'rectangle', 'image' ]:
+			if typeval not in ['canvas', 'text', 'ttext', 'progressbar', 'progressimagebar', 'line', 'rectangle', 'image', 'albumart', 'vumeter', 'spectrum' ]:
 				if typeval:
 					logging.warning('Attempted to add widget {0} with an unsupported widget type {1}.  Skipping...'.format(k,typeval))
 				else:
@@ -1458,12 +2140,36 @@ class display_controller(object):
 			elif typeval == 'image':
 				imagename = v['image'] if 'image' in v else ''
 				entry = self.pages.IMAGES[imagename] if imagename in self.pages.IMAGES else { }
-				image = entry['image'] if 'image' in entry else None
+				image = entry['image'].body if 'image' in entry else None
 				size = v['size'] if 'size' in v else (0,0)
 				if not image:
 					logging.warning('Attempted to add image widget {0} without an image.  Skipping...'.format(k))
 					continue
 				widget = gwidgetImage(image, size)
+			elif typeval == 'albumart':
+				size = v['size'] if 'size' in v else None
+				dither = v['dither'] if 'dither' in v else 'floydsteinberg'
+				imagename = v['placeholder'] if 'placeholder' in v else ''
+				entry = self.pages.IMAGES[imagename] if imagename in self.pages.IMAGES else { }
+				placeholder = entry['image'] if 'image' in entry else None
+				if not size:
+					logging.warning('Attempted to add albumart widget {0} without a size.  Skipping...'.format(k))
+					continue
+				widget = gwidgetAlbumArt(tuple(size), dither, placeholder, self.db)
+			elif typeval in ['vumeter', 'spectrum']:
+				value = v['value'] if 'value' in v else ('audio_rms' if typeval == 'vumeter' else 'audio_spectrum')
+				peak = v['peak'] if 'peak' in v else ('audio_peak' if typeval == 'vumeter' else None)
+				size = v['size'] if 'size' in v else None
+				direction = v['direction'] if 'direction' in v else ('right' if typeval == 'vumeter' else 'up')
+				gap = v['gap'] if 'gap' in v else 1
+				if not size:
+					logging.warning('Attempted to add {0} widget {1} without a size.  Skipping...'.format(typeval, k))
+					continue
+				try:
+					widget = gwidgetMeter(typeval, value, peak, tuple(size), direction, gap, self.db)
+				except ImportError as e:
+					logging.warning('Attempted to add {0} widget {1} but numpy is not installed ({2}).  Skipping...'.format(typeval, k, e))
+					continue
 			elif typeval == 'line':
 				point = v['point'] if 'point' in v else None
 				color = v['color'] if 'color' in v else 1
@@ -1552,29 +2258,92 @@ class display_controller(object):
 			# Add widget to widget list
 			self.widgets[k] = widget
 
-	def next(self): # Compute and return the next image to display
+	def occluded(self, box, occluders): # Is box completely hidden by one of the opaque boxes in occluders
+		x0,y0,x1,y1 = box
+
+		# Nothing of this layer is on the display
+		if x0 >= x1 or y0 >= y1:
+			return True
+
+		for ox0,oy0,ox1,oy1 in occluders:
+			if ox0 <= x0 and oy0 <= y0 and ox1 >= x1 and oy1 >= y1:
+				return True
+		return False
+
+	def next(self, deliver=True): # Compute and return the next image to display
+		# Input
+		#	deliver (bool) -- Set to False if the caller is not going to display the result.  The frame will then be returned by the next call that delivers.
+		# Returns SAMEFRAME if nothing has changed since the last frame that was delivered
+
+		with self.lock:
+			try:
+				snap = self.source.snapshot
+				self.db.pin(snap)
+				self.dbp.pin(snap.dbp)
+			except AttributeError:
+				self.db.pin(self.source)
+				self.dbp.pin(self.sourcep)
+
+			# A page file that changed is swapped in between frames (see watch)
+			if self.pending is not None:
+				(plan, compiletime), self.pending = self.pending, None
+				self.reload(plan, compiletime)
+			return self.compose(deliver)
+
+	def compose(self, deliver): # Render the active widgets from the pinned db and composite them into a frame
 		active = []
+		occluders = []
+		changed = False
 		img = None
 
-		for s in self.sequences:
-			w = s.get()
+		# Walk the layers from the top down so that a layer can be culled if it is hidden by an opaque layer above it.
+		# Culled layers still call get so that their sequence timers keep advancing, but their widgets are not rendered.
+		for s in reversed(self.layers):
+			w = s.get(render=False)
 			if w != None:
-				active.append((w,s.coordinates))
 				# If sequence does not have an active coolingperiod timer set then set one
 				if s.coolingexpires < time.time():
 					s.coolingexpires = s.coolingperiod + time.time()
-		img = None
-		for wid in active:
+
+				if self.occluded(s.bbox(w, self.size), occluders):
+					self.stats['culled'] += 1
+					continue
+
+				if s.render(w):
+					changed = True
+				if s.opaque:
+					occluders.append(s.bbox(w, self.size))
+				active.append((w,s))
+
+		# A widget that switched, appeared or disappeared changes the frame even if none of the widgets changed their image
+		if active != self.lastactive or self.image is None:
+			changed = True
+		self.lastactive = active
+
+		if not changed:
+			if self.undelivered and deliver:
+				self.undelivered = False
+				self.delivered = self.frame
+				self.stats['frames'] += 1
+				return self.image
+			self.stats['skipped'] += 1
+			return SAMEFRAME
+
+		# Paste the visible layers from the bottom up
+		for wid, s in reversed(active):
 			if not img:
 				img = Image.new("1", self.size)
 
 			# If more than one sequence is active, paste together.
-			w = wid[0].image.size[0]+wid[1][0] if wid[0].image.size[0]+wid[1][0] > img.size[0] else img.size[0]
-			h = wid[0].image.size[1]+wid[1][1] if wid[0].image.size[1]+wid[1][1] > img.size[1] else img.size[1]
+			w = wid.image.size[0]+s.coordinates[0] if wid.image.size[0]+s.coordinates[0] > img.size[0] else img.size[0]
+			h = wid.image.size[1]+s.coordinates[1] if wid.image.size[1]+s.coordinates[1] > img.size[1] else img.size[1]
 			if w > img.size[0] or h > img.size[1]:
 				img = img.crop((0,0,w,h))
 
-			img.paste(wid[0].image,wid[1])
+			if s.opaque:
+				img.paste(wid.image,s.coordinates)
+			else:
+				img.paste(wid.image,s.coordinates,wid.image)
 
 		if img is None:
 			try:
@@ -1588,40 +2357,68 @@ class display_controller(object):
 			x,y = self.size
 			img = img.crop( (0,0,x,y))
 
+		self.image = img
+		self.frame = bitmap.bitmap.frompil(img)
+
+		# Widgets can change without changing a pixel (e.g. a value that renders the same)
+		if self.frame == self.delivered:
+			self.undelivered = False
+			self.stats['skipped'] += 1
+			return SAMEFRAME
+
+		self.undelivered = not deliver
+		if deliver:
+			self.delivered = self.frame
+		self.stats['frames'] += 1
+
 		# Return next valid image
 		return img
 
 	def loadsequences(self, sequences):
 
 		for value in sequences:
+			newseq = self.loadsequence(value, len(self.sequences))
+			self.sequencedefs.append( (value, newseq) )
+			if newseq is not None:
+				self.sequences.append(newseq)
+
+		# Order the layers for compositing.  The sort is stable so sequences with the same z keep their page file order.
+		self.layers = sorted(self.sequences, key=lambda s: s.z)
 
-			conditional = value['conditional'] if 'conditional' in value else 'True'
-			coolingperiod = value['coolingperiod'] if 'coolingperiod' in value else 0
-			minimum = value['minimum'] if 'minimum' in value else 0
-			name = value['name'] if 'name' in value else 'name not provided'
-			coordinates = value['coordinates'] if 'coordinates' in value else (0,0)
-
-#			logging.debug('Loading sequence {0}'.format(name))
-
-			newseq = sequence(name,conditional,self.db,self.dbp, coolingperiod, minimum, coordinates)
-			self.sequences.append(newseq)
-			canvases = value['canvases'] if 'canvases' in value else []
-			if canvases:
-				for c in canvases:
-					cname = c['name'] if 'name' in c else ''
-					duration = c['duration'] if 'duration' in c else 0
-					cconditional = c['conditional'] if 'conditional' in c else 'True'
-					if cname and duration and cconditional:
-						widget = self.widgets[cname] if cname in self.widgets else None
-						if widget:
-							newseq.add(widget,duration, cconditional)
-						else:
-							logging.warning('Trying to add widget {0} to sequence {1} but widget was not found'.format(cname, name))
-
-			# If no canvases were added to the sequence, remove it
-			if len(newseq.widgets) == 0:
-				logging.warning('Unable to create sequence {0}.  No widgets'.format(name))
-				del self.sequences[-1]
+	def loadsequence(self, value, position): # Return a sequence built from its page file entry or None if it has no widgets
+		# Input
+		#	value (dict) -- The sequence's entry in SEQUENCES
+		#	position (int) -- The number of sequences before it.  Used as its z if it does not have one.
+
+		conditional = value['conditional'] if 'conditional' in value else 'True'
+		coolingperiod = value['coolingperiod'] if 'coolingperiod' in value else 0
+		minimum = value['minimum'] if 'minimum' in value else 0
+		name = value['name'] if 'name' in value else 'name not provided'
+		coordinates = value['coordinates'] if 'coordinates' in value else (0,0)
+		z = value['z'] if 'z' in value else position
+		opaque = value['opaque'] if 'opaque' in value else True
+
+#		logging.debug('Loading sequence {0}'.format(name))
+
+		newseq = sequence(name,conditional,self.db,self.dbp, coolingperiod, minimum, coordinates, z, opaque)
+		canvases = value['canvases'] if 'canvases' in value else []
+		if canvases:
+			for c in canvases:
+				cname = c['name'] if 'name' in c else ''
+				duration = c['duration'] if 'duration' in c else 0
+				cconditional = c['conditional'] if 'conditional' in c else 'True'
+				if cname and duration and cconditional:
+					widget = self.widgets[cname] if cname in self.widgets else None
+					if widget:
+						newseq.add(widget,duration, cconditional)
+					else:
+						logging.warning('Trying to add widget {0} to sequence {1} but widget was not found'.format(cname, name))
+
+		# If no canvases were added to the sequence, drop it
+		if len(newseq.widgets) == 0:
+			logging.warning('Unable to create sequence {0}.  No widgets'.format(name))
+			return None
+		return newseq
 
 
 def printsequences(seq):
@@ -1644,7 +2441,7 @@ def processevent(events, starttime, prepost, db, dbp):
 if __name__ == '__main__':
 
 	import graphics as g
-	import moment
+	import clock
 
 	starttime = time.time()
 	elapsed = int(time.time()-starttime)
@@ -1663,7 +2460,7 @@ if __name__ == '__main__':
 			'length':400,
 			'volume':50,
 			'stream':'Not webradio',
-			'utc': 	moment.utcnow(),
+			'utc': 	clock.utcnow(),
 			'outside_temp_formatted':'46\xb0F',
 			'outside_temp_max':72,
 			'outside_temp_min':48,
@@ -1684,7 +2481,7 @@ if __name__ == '__main__':
 			'length':400,
 			'volume':50,
 			'stream':'Not webradio',
-			'utc': 	moment.utcnow(),
+			'utc': 	clock.utcnow(),
 			'outside_temp_formatted':'46\xb0F',
 			'outside_temp_max':72,
 			'outside_temp_min':48,
@@ -1719,13 +2516,14 @@ if __name__ == '__main__':
 	while True:
 		db['elapsed'] = int(time.time()-starttime)
 		# timepos = time.strftime(u"%-M:%S", time.gmtime(int(elapsed))) + "/" + time.strftime(u"%-M:%S", time.gmtime(int(254)))
-		# current_time = moment.utcnow().timezone('US/Eastern').strftime(u"%H:%M:%S").strip().decode()
+		# current_time = clock.utcnow().timezone('US/Eastern').strftime(u"%H:%M:%S").strip().decode()
 		# db['elapsed_formatted'] = timepos
 		# db['time_formatted'] = current_time
 
 		processevent(events, starttime, 'pre', db, dbp)
 		img = dc.next()
 		processevent(events, starttime, 'post', db, dbp)
-		frame = g.getframe( img, 0,0, 80,16 )
-		g.show( frame, 80, int(math.ceil(16/8.0)))
+		if img is not SAMEFRAME:
+			frame = g.getframe( img, 0,0, 80,16 )
+			g.show( frame, 80, int(math.ceil(16/8.0)))
 		time.sleep(.1)
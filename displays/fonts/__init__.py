@@ -1,4 +1,4 @@
-__all__ = [ "size5x8", "map", "bmfont" ]
+__all__ = [ "size5x8", "map", "bmfont", "ttfont" ]
 
 
 try:
@@ -15,3 +15,8 @@ try:
 	import bmfont
 except ImportError:
 	pass
+
+try:
+	import ttfont
+except ImportError:
+	pass
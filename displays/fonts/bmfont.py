@@ -6,17 +6,150 @@
 #           Not tested beyond that use case
 # Written by: Ron Ritchey
 
+# Parsing a font and cropping its glyphs out of the sprite sheet is slow on a Pi so the result is compiled
+# into a cache file next to the font (name.fntc).  The cache holds the metrics and each glyph packed 8 pixels
+# to a byte.  It is rebuilt whenever the modification time or size of the font or its sprite sheet changes.
+# If the cache can not be written the font is simply parsed every time.
+#
+# Glyphs stay packed until they are used.  The image of a character is created the first time it is drawn
+# so characters a page never shows do not take up memory.  A page can preload the characters of widgets
+# that must not wait for that (see 'preload' in the FONTS section of the page file).
+#
+# Use bmfont(fontfile) to get a font.  Every caller in the process receives the same object.
+
 from PIL import Image
+import cPickle as pickle
 import logging
 import os
+import threading
+
+FORMAT = 2 # Version of the compiled font format.  Changing it invalidates every cache file.
+
+# Fonts that have already been loaded keyed by the path of their font file
+loaded = { }
+lock = threading.Lock()	# Held while a font is loaded so a font requested by two threads at startup is only loaded once
+
+def bmfont(fontfile, usecache=True):
+	# Return the font for fontfile.  The font is shared so it must not be modified.
+	# usecache (bool) -- Set to False to ignore the cache file (the font is still compiled into it)
+	key = os.path.realpath(os.path.join(os.path.dirname(__file__), fontfile))
+	try:
+		return loaded[key]
+	except KeyError:
+		pass
+	with lock:
+		if key not in loaded:
+			loaded[key] = bmfontfile(fontfile, usecache)
+		return loaded[key]
+
+def memory():
+	# Returns (font file, glyphs created, glyphs in font, bytes) for every loaded font.
+	# bytes counts the pixels of the glyphs that have been created (PIL uses a byte per pixel) and the packed glyphs.
+	retval = []
+	for key, font in sorted(loaded.iteritems()):
+		count, size = font.fontpkg.resident()
+		retval.append( (os.path.basename(key), count, len(font.fontpkg.packed), size + sum([ len(v[1]) for v in font.fontpkg.packed.itervalues() ])) )
+	return retval
+
+def stamp(path):
+	# Identifies the version of a file
+	st = os.stat(path)
+	return (st.st_mtime, st.st_size)
+
+class glyphtable(dict):
+
+	# Maps ord(character) to the image of the character.  'size' holds the cell size of the font.
+	# Images are created from packed when a character is first looked up.
+
+	def __init__(self):
+		super(glyphtable, self).__init__()
+		self.packed = { } # ord(character) -> (size, pixels packed 8 to a byte) of every glyph in the font
+
+	def __missing__(self, c):
+		size, data = self.packed[c]
+		self[c] = Image.frombytes('1', size, data)
+		return self[c]
+
+	def __contains__(self, c):
+		return dict.__contains__(self, c) or c in self.packed
+
+	def preload(self, chars):
+		# Create the images of the characters in chars now instead of when they are first drawn
+		for c in chars:
+			if ord(c) in self.packed:
+				self[ord(c)]
+
+	def resident(self):
+		# Returns the number of glyph images that have been created and the bytes of pixels they hold
+		images = [ v for k, v in self.iteritems() if k != 'size' ]
+		return len(images), sum([ i.size[0]*i.size[1] for i in images ])
+
+class bmfontfile(object):
+
+	def __init__(self,fontfile,usecache=True):
+		self.fontpkg = glyphtable() # Holds an image of each font character
+		self.lookup = None # Holds image key to perform a reverse lookup of an image back to the character it represents
+		self.chardata = { } # Holds position and size data for each character on sprite sheet
 
-class bmfont:
+		f_path = os.path.join(os.path.dirname(__file__), fontfile)
+		self.cachefile = os.path.splitext(f_path)[0] + '.fntc'
+		if usecache and self.loadcache(f_path):
+			return
 
-	def __init__(self,fontfile):
-		self.fontpkg = { } # Holds an image of each font character
-		self.imglookup = { } # Holds image key to perform a reverse lookup of an image back to the character it represents
-		self.chardata = { } # Holds position and size data for each character on sprite sheet
+		self.parse(fontfile)
+		self.savecache(f_path)
 
+	def loadcache(self, f_path):
+		# Restore the font from its cache file.  Returns False if there is no cache or it is out of date.
+		try:
+			with open(self.cachefile, 'rb') as f:
+				cache = pickle.load(f)
+			if cache['format'] != FORMAT or cache['stamp'] != stamp(f_path) or cache['spritestamp'] != stamp(os.path.join(os.path.dirname(__file__), cache['file'])):
+				return False
+		except (IOError, OSError, EOFError, KeyError, TypeError, ValueError, pickle.UnpicklingError):
+			return False
+
+		for k in [ 'face', 'bold', 'italic', 'lineHeight', 'scaleW', 'scaleH', 'file', 'count', 'chardata' ]:
+			setattr(self, k, cache[k])
+		self.fontpkg['size'] = cache['size']
+		self.fontpkg.packed = cache['glyphs']
+		return True
+
+	def savecache(self, f_path):
+		cache = {
+			'format': FORMAT,
+			'stamp': stamp(f_path),
+			'spritestamp': stamp(os.path.join(os.path.dirname(__file__), self.file)),
+			'size': self.fontpkg['size'],
+			'glyphs': self.fontpkg.packed,
+		}
+		for k in [ 'face', 'bold', 'italic', 'lineHeight', 'scaleW', 'scaleH', 'file', 'count', 'chardata' ]:
+			cache[k] = getattr(self, k)
+
+		# Write to a temporary file first so that a partially written cache is never read
+		tmp = '{0}.{1}'.format(self.cachefile, os.getpid())
+		try:
+			with open(tmp, 'wb') as f:
+				pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+			os.rename(tmp, self.cachefile)
+		except (IOError, OSError) as e:
+			logging.debug(u'Unable to write font cache {0}: {1}'.format(self.cachefile, e))
+			try:
+				os.remove(tmp)
+			except OSError:
+				pass
+
+	@property
+	def imglookup(self):
+		# Only the character LCD drivers use the reverse lookup so it is built the first time it is needed
+		if self.lookup is None:
+			self.lookup = { }
+			for k in self.chardata:
+				size, data = self.fontpkg.packed[k]
+				self.lookup[tuple(Image.frombytes('1', size, data).getdata())] = k
+		return self.lookup
+
+	def parse(self,fontfile):
 		# Read file
 		try:
 			f_path = os.path.join(os.path.dirname(__file__), fontfile)
@@ -134,10 +267,8 @@ class bmfont:
 				img = im.crop( (x,y,x+w,y+h) )
 
 				# Resize to xadvance width
-				img = img.crop( (0,0,xadvance,h) )
-				self.fontpkg[k] = img
-				data = tuple(list(img.convert("1").getdata()))
-				self.imglookup[data] = k
+				img = img.crop( (0,0,xadvance,h) ).convert("1")
+				self.fontpkg.packed[k] = (img.size, img.tobytes())
 
 
 		# except IOError:
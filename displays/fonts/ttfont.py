@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# Font class that rasterizes truetype fonts into a cache of 1-bit glyphs
+# Each character is drawn by FreeType once per font and size.  Text is then composed
+# from the cached glyphs the same way it is for bmfont fonts.
+# Glyphs are placed by their advance widths only (no kerning).
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Fonts that have already been loaded keyed by (file, size).  Shared by every page and widget in the process.
+loaded = { }
+
+def ttfont(fontfile, size):
+	# Return the glyph cache for fontfile at size.  Raises IOError if the font can not be found.
+	key = (fontfile, size)
+	try:
+		return loaded[key]
+	except KeyError:
+		pass
+	loaded[key] = glyphcache(ImageFont.truetype(font=fontfile, size=size))
+	return loaded[key]
+
+class glyphcache(dict):
+
+	# Maps ord(character) to (image, x, advance) where
+	#	image (Image) -- 1-bit image of the character as FreeType draws it into a mode "1" image
+	#	x (integer) -- Offset of the image from the pen position.  Negative if the glyph reaches to the left of its cell.
+	#	advance (integer) -- How far the pen moves after the character
+	# Characters are rasterized the first time they are used.
+	# 'size' holds the cell size (width of the widest ASCII character, height of a line) like it does for bmfont fonts.
+
+	def __init__(self, font):
+		super(glyphcache, self).__init__()
+		self.font = font
+		ascent, descent = font.getmetrics()
+		self['size'] = (max([ self[c][2] for c in range(32,127) ]), ascent+descent)
+
+	def __missing__(self, c):
+		char = unichr(c)
+		advance, height = self.font.getsize(char)
+
+		# Leave room for ink that falls outside the character's cell
+		ox, oy = self.font.getoffset(char)
+		mw, mh = self.font.getmask(char).size
+		left = -ox if ox < 0 else 0
+		width = max(advance, ox+mw) + left
+
+		image = Image.new("1", (max(width,1), max(height,1)), 0)
+		draw = ImageDraw.Draw(image)
+		draw.text( (left,0), char, font=self.font, fill='white')
+		del draw
+
+		self[c] = (image, -left, advance)
+		return self[c]
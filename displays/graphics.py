@@ -6,6 +6,7 @@
 import sys, copy, math
 from PIL import Image
 from PIL import ImageDraw
+import bitmap
 
 
 # def set(image,x,y,val):
@@ -80,42 +81,12 @@ def getframe(image,x,y,width,height):
 	#				 ...
 	#   [ ]  # Array of bytes for line n
 	# ]
+	# Each line is a bytearray with a byte for each column.  Bit 0 is the top pixel.
+	# image may be a PIL image or a bitmap
 
-	# Select portion of image to work with
-	img = image.convert("1")
-	#img.crop( (x,y, width, height) )
-
-
-	width, height = img.size
-	bheight = int(math.ceil(height / 8.0))
-	imgdata = list(img.getdata())
-
-
-	retval = []	# The variable to hold the return value (an array of byte arrays)
-	retline = [0]*width # Line to hold the first byte of image data
-	bh = 0 # Used to determine when we've consumed a byte worth of the line
-
-	# Perform a horizontal iteration of the image data
-	for i in range(0,height):
-		for j in range(0,width):
-			# if the value is true then mask a bit into the byte within retline
-			if imgdata[(i*width)+j]:
-				try:
-					retline[j] |= 1<<bh
-				except IndexError as e:
-					# WTF
-					print "width = {0}".format(width)
-					raise e
-		# If we've written a full byte, start a new retline
-		bh += 1
-		if bh == 8: # We reached a byte boundary
-			bh = 0
-			retval.append(retline)
-			retline = [0]*width
-	if bh > 0:
-		retval.append(retline)
-
-	return retval
+	if not isinstance(image, bitmap.bitmap):
+		image = bitmap.bitmap.frompil(image)
+	return image.pages()
 
 def scrollbuffer(image, direction=u'left', distance=1):
 	direction = direction.lower()
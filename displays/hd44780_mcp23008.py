@@ -350,7 +350,7 @@ if __name__ == '__main__':
 	import graphics as g
 	import fonts
 	import display
-	import moment
+	import clock
 
 	def processevent(events, starttime, prepost, db, dbp):
 		for evnt in events:
@@ -373,7 +373,7 @@ if __name__ == '__main__':
 			'length':400,
 			'volume':50,
 			'stream':'Not webradio',
-			'utc': 	moment.utcnow(),
+			'utc': 	clock.utcnow(),
 			'outside_temp_formatted':u'46\xb0F',
 			'outside_temp_max':72,
 			'outside_temp_min':48,
@@ -394,7 +394,7 @@ if __name__ == '__main__':
 			'length':400,
 			'volume':50,
 			'stream':'Not webradio',
-			'utc': 	moment.utcnow(),
+			'utc': 	clock.utcnow(),
 			'outside_temp_formatted':u'46\xb0F',
 			'outside_temp_max':72,
 			'outside_temp_min':48,
@@ -476,11 +476,12 @@ if __name__ == '__main__':
 		while True:
 			elapsed = int(time.time()-starttime)
 			db['elapsed']=elapsed
-			db['utc'] = moment.utcnow()
+			db['utc'] = clock.utcnow()
 			processevent(events, starttime, 'pre', db, dbp)
 			img = dc.next()
 			processevent(events, starttime, 'post', db, dbp)
-			lcd.update(img)
+			if img is not display.SAMEFRAME:
+				lcd.update(img)
 			time.sleep(.1)
 
 		lcd.clear()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# hotlog - logging for code that runs on every frame
+#
+# The render and driver paths run many times a second so a problem with a page or a variable gets
+# reported hundreds of times a minute.  hotlog wraps logging so that those paths can report problems cheaply.
+#   * Messages use format strings with their arguments passed separately.  Nothing is formatted unless
+#     the message is actually going to be logged.
+#   * Each call site may log BURST messages per INTERVAL.  Anything past that is counted and reported
+#     as a single line when the interval ends.
+#   * A message identical to the last one logged from the same call site is only counted.  The count is
+#     reported as "(repeated N times)" when the call site logs something else or the interval ends.
+#
+# Usage
+#   hotlog.debug(u"v out of range with value {0}", v)
+
+from __future__ import unicode_literals
+
+import logging, sys, os, time, threading
+
+INTERVAL = 60	# Seconds before a call site's counts are reported and reset
+BURST = 5		# Different messages a call site may log per interval
+
+class callsite(object):
+
+	def __init__(self, filename, lineno):
+		self.filename = filename
+		self.lineno = lineno
+		self.start = 0.0		# When the current interval began
+		self.count = 0			# Messages logged during the current interval
+		self.level = None		# Level, message and arguments of the last message logged
+		self.msg = None
+		self.args = None
+		self.repeats = 0		# Times the last message was repeated without being logged
+		self.suppressed = 0		# Other messages not logged because BURST was reached
+
+	def report(self, logger):
+		# Log what has been held back since the last message from this call site
+		if self.repeats:
+			logger.log(self.level, u"{0} (repeated {1} times)".format(render(self.msg, self.args), self.repeats))
+			self.repeats = 0
+		if self.suppressed:
+			logger.log(self.level, u"{0} more messages from {1}:{2} were suppressed".format(self.suppressed, os.path.basename(self.filename), self.lineno))
+			self.suppressed = 0
+
+sites = { }
+lock = threading.Lock()
+
+def render(msg, args):
+	if not args:
+		return msg
+	try:
+		return msg.format(*args)
+	except Exception:
+		return u"{0} {1}".format(msg, repr(args))
+
+def same(site, level, msg, args):
+	try:
+		return site.level == level and site.msg == msg and site.args == args
+	except Exception:
+		return False
+
+def log(level, msg, *args):
+	logger = logging.getLogger()
+	if not logger.isEnabledFor(level):
+		return
+
+	# Identify the call site by the frame that called debug, info, warning or error
+	frame = sys._getframe(2)
+	key = (frame.f_code, frame.f_lineno)
+	now = time.time()
+
+	with lock:
+		site = sites.get(key)
+		if site is None:
+			site = sites[key] = callsite(frame.f_code.co_filename, frame.f_lineno)
+
+		if now - site.start >= INTERVAL:
+			site.report(logger)
+			site.start = now
+			site.count = 0
+		elif same(site, level, msg, args):
+			site.repeats += 1
+			return
+		elif site.count >= BURST:
+			site.suppressed += 1
+			return
+
+		if site.repeats:
+			site.report(logger)
+		site.count += 1
+		site.level = level
+		site.msg = msg
+		site.args = args
+		logger.log(level, render(msg, args))
+
+def flush():
+	# Report everything that is still being held back (e.g. on exit)
+	logger = logging.getLogger()
+	with lock:
+		for site in sites.itervalues():
+			site.report(logger)
+
+def debug(msg, *args):
+	log(logging.DEBUG, msg, *args)
+
+def info(msg, *args):
+	log(logging.INFO, msg, *args)
+
+def warning(msg, *args):
+	log(logging.WARNING, msg, *args)
+
+def error(msg, *args):
+	log(logging.ERROR, msg, *args)
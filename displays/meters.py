@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# meters - bars of the vumeter and spectrum widgets
+#
+# Every bar of a meter is drawn at once with numpy.  Each pixel across the meter is given the length of the bar it
+# belongs to and the image is the comparison of every pixel's distance along the meter against that length.
+#
+# Only imported when a page file uses a meter (see display.loadmeters) because numpy is slow to import.
+
+from __future__ import unicode_literals
+
+import numpy
+from PIL import Image
+
+# Layouts of the bars across a meter keyed by (pixels across, bars, gap)
+layouts = { }
+
+def layout(across, count, gap):
+	# Return the bar each pixel across the meter belongs to (-1 for the gaps between bars)
+	k = (across, count, gap)
+	if k not in layouts:
+		width = max(1, (across - gap*(count-1)) // count)
+		position = numpy.arange(across)
+		bar = position // (width + gap)
+		layouts[k] = numpy.where((position % (width + gap) < width) & (bar < count), bar, -1)
+	return layouts[k]
+
+def bars(levels, peaks, size, direction='up', gap=1):
+	# Return a mode "1" image of size with a bar for each of levels
+	#	levels (sequence) -- length of each bar (0-100)
+	#	peaks (sequence) -- position of a one pixel peak marker on each bar (0-100).  Empty for no markers.
+	#	direction (unicode) -- the direction the bars grow towards.  Allowed values [ 'up', 'down', 'left', 'right' ]
+	#	gap (int) -- pixels between bars
+	w, h = size
+	if direction not in ('down', 'left', 'right'):
+		direction = 'up'
+	across, along = (w, h) if direction in ('up', 'down') else (h, w)
+
+	mask = numpy.zeros((along, across), bool)
+	if len(levels):
+		bar = layout(across, len(levels), gap)
+		inbar = bar >= 0
+		distance = numpy.arange(along)[:, None]
+
+		lengths = numpy.rint(numpy.asarray(levels, float) * along / 100).astype(int)
+		mask = distance < numpy.where(inbar, lengths[bar], 0)[None, :]
+
+		if len(peaks) == len(levels):
+			markers = numpy.rint(numpy.asarray(peaks, float) * along / 100).astype(int) - 1
+			mask |= (distance == numpy.where(inbar, markers[bar], -1)[None, :])
+
+	# mask runs from the start of the bars along its rows.  Turn it so the bars grow towards direction.
+	if direction == 'up':
+		mask = mask[::-1]
+	elif direction == 'right':
+		mask = mask.T
+	elif direction == 'left':
+		mask = mask.T[:, ::-1]
+
+	return Image.frombytes('1', (w, h), numpy.packbits(mask, axis=1).tobytes())
@@ -0,0 +1,369 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# pageplan - compiles page files into validated render plans
+#
+# A page file is a python module describing fonts, images, widgets, canvases and sequences.  compilepage loads it,
+# checks every entry and every reference between entries and returns a pageplan.  The plan holds the page
+# file's sections as plain data along with its variable pipelines already parsed and its conditionals already
+# compiled.  Problems are recorded in the plan instead of being raised so they can all be reported at once.
+#
+# load returns the plan for a page file.  Plans are cached next to the page file (name.plan) and are only
+# used while the page file and the modules it imports (e.g. pydPiper_config) have the same SHA-1 as when
+# the plan was compiled.  A warm start therefore skips loading and validating the page file.
+
+from __future__ import unicode_literals
+
+import imp, os, sys, copy, types, logging, hashlib, marshal, string
+import cPickle as pickle
+from PIL import ImageFont
+
+FORMAT = 2 # Version of the plan format.  Changing it invalidates every cached plan.
+
+SECTIONS = [ 'FONTS', 'TRUETYPE_FONTS', 'IMAGES', 'WIDGETS', 'CANVASES', 'SEQUENCES' ]
+REQUIRED = [ 'FONTS', 'WIDGETS', 'CANVASES', 'SEQUENCES' ]
+WIDGETTYPES = [ 'canvas', 'text', 'ttext', 'progressbar', 'progressimagebar', 'line', 'rectangle', 'image', 'albumart', 'vumeter', 'spectrum' ]
+TRANSFORMS = [ 'onoff', 'truefalse', 'yesno', 'int', 'upper', 'capitalize', 'title', 'lower', 'timezone', 'strftime', 'select' ]
+
+number = (int, long, float)
+
+# Parameters of each effect in page file order as (name, types, allowed values)
+EFFECTS = {
+	'scroll': [ ('direction', basestring, ['left', 'right', 'up', 'down']), ('distance', int, None), ('speed', number, None), ('gap', int, None),
+		('hesitatetype', basestring, ['onstart', 'onloop']), ('hesitatetime', number, None), ('threshold', number, None) ],
+	'popup': [ ('dheight', int, None), ('duration', number, None), ('pduration', number, None), ('speed', number, None) ],
+}
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+
+def pipeline(variable):
+	# Split a variable reference such as 'utc|timezone+Europe/Paris|strftime+%H:%M' into its name and
+	# a tuple of (transform, parameters) steps e.g. ('utc', (('timezone', ('Europe/Paris',)), ('strftime', ('%H:%M',))))
+	steps = variable.split('|')
+	return (steps[0], tuple([ (s.split('+')[0].lower(), tuple(s.split('+')[1:])) for s in steps[1:] ]))
+
+def condition(source):
+	# Compile a conditional.  Returns None if it is not valid python.
+	try:
+		return compile(source, '<conditional>', 'eval')
+	except (SyntaxError, TypeError, ValueError):
+		return None
+
+def digest(path):
+	with open(path, 'rb') as f:
+		return hashlib.sha1(f.read()).hexdigest()
+
+def filedigest(path):
+	# digest of path or None if it does not exist.  A dependency that is created later makes the plan out of date.
+	return digest(path) if os.path.isfile(path) else None
+
+class pageplan(object):
+
+	def __init__(self, file):
+		self.file = file
+		self.FONTS = { }
+		self.TRUETYPE_FONTS = { }
+		self.IMAGES = { }
+		self.WIDGETS = { }
+		self.CANVASES = { }
+		self.SEQUENCES = [ ]
+
+		self.errors = [ ]			# (level, message) for each problem found.  ERROR if the page will not work as written (including references to
+									# fonts, images, widgets or canvases that do not exist), WARNING if an entry is incomplete and will be skipped.
+		self.pipelines = { }		# Variable reference -> pipeline (see pipeline)
+		self.conditions = { }		# Conditional -> marshalled code object (None if it does not compile)
+		self.dependencies = { }		# Path -> SHA-1 of every file the plan was compiled from
+		self.cached = False			# True if the plan was read from the cache
+
+	def error(self, msg, *args):
+		self.errors.append( (logging.ERROR, msg.format(*args)) )
+
+	def warning(self, msg, *args):
+		self.errors.append( (logging.WARNING, msg.format(*args)) )
+
+	def variable(self, widget, v):
+		if not isinstance(v, basestring):
+			self.warning('Widget {0} has a variable that is not a string ({1!r})', widget, v)
+			return
+		p = pipeline(v)
+		self.pipelines[v] = p
+		for t, parms in p[1]:
+			if t not in TRANSFORMS:
+				self.warning('Widget {0} uses unknown transform {1} on {2}', widget, t, p[0])
+
+	def conditional(self, where, source):
+		code = condition(source)
+		self.conditions[source] = marshal.dumps(code) if code is not None else None
+		if code is None:
+			self.error('Conditional of {0} is not valid: {1}', where, source)
+
+def compilepage(file):
+	# Load and validate a page file.  Raises the page file's exception if it can not be imported.
+	plan = pageplan(file)
+	plan.dependencies[os.path.abspath(file)] = digest(file)
+	module = imp.load_source('pages', file)
+
+	# Modules the page file imports (e.g. pydPiper_config) can change what it contains and so can the
+	# configuration file they read (pydPiper_config names pydPiper.cfg in CONFIGFILE)
+	for v in vars(module).itervalues():
+		if isinstance(v, types.ModuleType) and getattr(v, '__file__', None):
+			source = os.path.splitext(v.__file__)[0] + '.py'
+			if os.path.isfile(source):
+				plan.dependencies[os.path.abspath(source)] = digest(source)
+			configfile = getattr(v, 'CONFIGFILE', None)
+			if isinstance(configfile, basestring):
+				plan.dependencies[os.path.abspath(configfile)] = filedigest(configfile)
+
+	for name in SECTIONS:
+		value = getattr(module, name, None)
+		if value is None:
+			if name in REQUIRED:
+				plan.error('The page file has no {0} section', name)
+		elif not isinstance(value, list if name == 'SEQUENCES' else dict):
+			plan.error('{0} should be a {1}', name, 'list' if name == 'SEQUENCES' else 'dictionary')
+		else:
+			setattr(plan, name, copy.deepcopy(value))
+
+	checkfonts(plan)
+	checkimages(plan)
+	for k, v in plan.CANVASES.iteritems():
+		v['type'] = 'canvas'
+	for section in [ plan.WIDGETS, plan.CANVASES ]:
+		for k, v in section.iteritems():
+			checkwidget(plan, k, v)
+	checksequences(plan)
+	return plan
+
+def checkfonts(plan):
+	defaults = [ ]
+	for k, v in plan.FONTS.iteritems():
+		if not v.get('file'):
+			plan.error('Font {0} has no file', k)
+		elif not os.path.isfile(os.path.join(basedir, 'fonts', v['file'])):
+			plan.error('Font {0}: {1} was not found in {2}', k, v['file'], os.path.join(basedir, 'fonts'))
+		if v.get('default'):
+			defaults.append(k)
+	if not defaults:
+		plan.error('No default font.  One of the FONTS must have default set to True')
+	elif len(defaults) > 1:
+		plan.warning('More than one default font ({0}).  Only one of them will be used', ', '.join(sorted(defaults)))
+
+	for k, v in plan.TRUETYPE_FONTS.iteritems():
+		if not v.get('file'):
+			plan.error('Truetype font {0} has no file', k)
+			continue
+		try:
+			ImageFont.truetype(font=v['file'], size=v.get('size', 8))
+		except IOError:
+			plan.error('Truetype font {0}: {1} was not found', k, v['file'])
+
+def checkimages(plan):
+	for k, v in plan.IMAGES.iteritems():
+		if not v.get('file'):
+			plan.error('Image {0} has no file', k)
+		elif not os.path.isfile(os.path.join(basedir, 'images', v['file'])):
+			plan.error('Image {0}: {1} was not found in {2}', k, v['file'], os.path.join(basedir, 'images'))
+
+def checkwidget(plan, k, v):
+	t = v.get('type', '').lower()
+	if t not in WIDGETTYPES:
+		plan.warning('Widget {0} has {1}.  It will be skipped', k, 'unsupported type {0}'.format(t) if t else 'no type')
+		return
+
+	if t in [ 'text', 'ttext' ]:
+		fonts = plan.FONTS if t == 'text' else plan.TRUETYPE_FONTS
+		variables = v.get('variables', [])
+		if not v.get('format'):
+			plan.warning('Widget {0} has no format.  It will be skipped', k)
+		else:
+			try:
+				fields = [ f for l, f, spec, conv in string.Formatter().parse(v['format']) if f is not None ]
+			except ValueError as e:
+				plan.error('Widget {0}: format {1!r} is not valid ({2})', k, v['format'], e)
+				fields = [ ]
+			# Fields are numbered ({0}) or take the next variable ({})
+			needed = 0
+			for n, f in enumerate(fields):
+				index = f.split('.')[0].split('[')[0]
+				if not index:
+					needed = max(needed, n+1)
+				elif index.isdigit():
+					needed = max(needed, int(index)+1)
+				else:
+					plan.error('Widget {0}: format {1!r} uses the named field {2}.  Fields must be numbered', k, v['format'], index)
+			if needed > len(variables):
+				plan.error('Widget {0}: format {1!r} needs {2} variables but has {3}', k, v['format'], needed, len(variables))
+		if v.get('font') not in fonts:
+			plan.error('Widget {0} uses font {1} which is not in {2}.  It will be skipped', k, v.get('font'), 'FONTS' if t == 'text' else 'TRUETYPE_FONTS')
+		for var in variables:
+			plan.variable(k, var)
+	elif t in [ 'progressbar', 'progressimagebar' ]:
+		if not v.get('value'):
+			plan.warning('Widget {0} has no value.  It will be skipped', k)
+		if t == 'progressbar' and not v.get('size'):
+			plan.warning('Widget {0} has no size.  It will be skipped', k)
+		if t == 'progressimagebar' and v.get('image') not in plan.IMAGES:
+			plan.error('Widget {0} uses image {1} which is not in IMAGES.  It will be skipped', k, v.get('image'))
+		if v.get('direction', 'left') not in [ 'left', 'right', 'up', 'down' ]:
+			plan.warning('Widget {0} has an unknown direction {1}.  left will be used', k, v.get('direction'))
+	elif t == 'image':
+		if v.get('image') not in plan.IMAGES:
+			plan.error('Widget {0} uses image {1} which is not in IMAGES.  It will be skipped', k, v.get('image'))
+	elif t == 'albumart':
+		if not v.get('size'):
+			plan.warning('Widget {0} has no size.  It will be skipped', k)
+		if v.get('dither', 'floydsteinberg') not in [ 'floydsteinberg', 'ordered', 'none' ]:
+			plan.warning('Widget {0} has an unknown dither {1}.  floydsteinberg will be used', k, v.get('dither'))
+		if 'placeholder' in v and v['placeholder'] not in plan.IMAGES:
+			plan.error('Widget {0} uses image {1} which is not in IMAGES.  No placeholder will be shown', k, v['placeholder'])
+		for var in [ 'album', 'artist', 'uri' ]:
+			plan.variable(k, var)
+	elif t in [ 'vumeter', 'spectrum' ]:
+		if not v.get('size'):
+			plan.warning('Widget {0} has no size.  It will be skipped', k)
+		if v.get('direction', 'up') not in [ 'left', 'right', 'up', 'down' ]:
+			plan.warning('Widget {0} has an unknown direction {1}.  The bars will grow up', k, v.get('direction'))
+		for var in [ v.get('value'), v.get('peak') ]:
+			if var is not None:
+				plan.variable(k, var)
+	elif t in [ 'line', 'rectangle' ]:
+		if not v.get('point'):
+			plan.warning('Widget {0} has no point.  It will be skipped', k)
+	elif t == 'canvas':
+		if not v.get('size'):
+			plan.warning('Canvas {0} has no size.  It will be skipped', k)
+		for w in v.get('widgets', []):
+			try:
+				name, x, y = w
+			except (TypeError, ValueError):
+				plan.warning('Canvas {0} includes {1!r} which is not (widget, x, y).  It will be skipped', k, w)
+				continue
+			if type(x) is not int or type(y) is not int:
+				plan.warning('Canvas {0} places {1} at an invalid point ({2!r}, {3!r}).  It will be skipped', k, name, x, y)
+			if name not in plan.WIDGETS and name not in plan.CANVASES:
+				plan.error('Canvas {0} includes {1} which is not a widget or canvas', k, name)
+
+	if 'effect' in v:
+		checkeffect(plan, k, v['effect'])
+
+def checkeffect(plan, k, effect):
+	if not effect or not isinstance(effect, (tuple, list)):
+		plan.warning('Widget {0} has an effect without details.  It will be ignored', k)
+		return
+	parms = EFFECTS.get(effect[0])
+	if parms is None:
+		plan.warning('Widget {0} has an unrecognized effect ({1}).  It will be ignored', k, effect[0])
+		return
+	if len(effect)-1 > len(parms):
+		plan.error('Widget {0}: {1} takes at most {2} parameters ({3}) but was given {4}', k, effect[0], len(parms), ', '.join([ p[0] for p in parms ]), len(effect)-1)
+	for value, (name, types, allowed) in zip(effect[1:], parms):
+		if not isinstance(value, types) or isinstance(value, bool):
+			plan.error('Widget {0}: {1} parameter {2} should be a {3} not {4!r}', k, effect[0], name, 'string' if types is basestring else 'number', value)
+		elif allowed and value.lower() not in allowed:
+			plan.error('Widget {0}: {1} parameter {2} should be one of {3} not {4!r}', k, effect[0], name, ', '.join(allowed), value)
+
+def checksequences(plan):
+	for i, s in enumerate(plan.SEQUENCES):
+		name = s.get('name', 'number {0}'.format(i+1))
+		plan.conditional('sequence {0}'.format(name), s.get('conditional', 'True'))
+		canvases = s.get('canvases', [])
+		if not canvases:
+			plan.warning('Sequence {0} has no canvases.  It will be skipped', name)
+		for c in canvases:
+			cname = c.get('name', '')
+			if cname not in plan.WIDGETS and cname not in plan.CANVASES:
+				plan.error('Sequence {0} includes {1} which is not a widget or canvas', name, cname)
+			if not c.get('duration'):
+				plan.warning('Sequence {0} shows {1} without a duration.  It will be skipped', name, cname)
+			plan.conditional('{0} in sequence {1}'.format(cname, name), c.get('conditional', 'True'))
+
+def definitions(plan):
+	# Return a copy of the plan's sections.  display_controller adds the loaded fonts and images to the plan so it keeps this copy to diff against.
+	return dict( (name, copy.deepcopy(getattr(plan, name))) for name in SECTIONS )
+
+def diff(old, new):
+	# Compare two sets of definitions (see definitions) and return what has to be rebuilt to go from old to new.
+	# Returns a dictionary with the names that were added, changed or removed in each section except SEQUENCES
+	# which has the indexes of the sequences in new that have to be rebuilt.  Widgets that use a changed font or image
+	# are changed and so are canvases and sequences that contain something that changed.
+	retval = { }
+	for name in SECTIONS[:-1]:
+		o = old.get(name, { })
+		n = new.get(name, { })
+		retval[name] = set( k for k in set(o) | set(n) if o.get(k) != n.get(k) )
+
+	for k, v in new['WIDGETS'].iteritems():
+		typeval = v.get('type', '').lower() if isinstance(v.get('type', ''), basestring) else ''
+		if typeval == 'text' and v.get('font') in retval['FONTS']:
+			retval['WIDGETS'].add(k)
+		elif typeval == 'ttext' and v.get('font') in retval['TRUETYPE_FONTS']:
+			retval['WIDGETS'].add(k)
+		elif typeval in [ 'image', 'progressimagebar' ] and v.get('image') in retval['IMAGES']:
+			retval['WIDGETS'].add(k)
+		elif typeval == 'albumart' and v.get('placeholder') in retval['IMAGES']:
+			retval['WIDGETS'].add(k)
+
+	# Canvases can contain canvases so keep going until nothing else changes
+	changed = retval['WIDGETS'] | retval['CANVASES']
+	while True:
+		more = set( k for k, v in new['CANVASES'].iteritems() if k not in changed and any(w[0] in changed for w in v.get('widgets', []) if w) )
+		if not more:
+			break
+		changed |= more
+		retval['CANVASES'] |= more
+
+	# A sequence is rebuilt unless an identical sequence in old can be kept
+	unused = list(old.get('SEQUENCES', [ ]))
+	retval['SEQUENCES'] = set()
+	for i, v in enumerate(new['SEQUENCES']):
+		if v in unused and not any(c.get('name') in changed for c in v.get('canvases', [])):
+			unused.remove(v)
+		else:
+			retval['SEQUENCES'].add(i)
+	return retval
+
+def cachefile(file):
+	return os.path.splitext(file)[0] + '.plan'
+
+def save(plan):
+	# Write plan to the cache.  Failures are logged and otherwise ignored.
+	path = cachefile(plan.file)
+	tmp = '{0}.{1}'.format(path, os.getpid())
+	try:
+		with open(tmp, 'wb') as f:
+			pickle.dump({ 'format': FORMAT, 'python': sys.version, 'plan': plan.__dict__ }, f, pickle.HIGHEST_PROTOCOL)
+		os.rename(tmp, path)
+	except (IOError, OSError, pickle.PicklingError, TypeError) as e:
+		logging.debug('Unable to cache the plan for {0}: {1}'.format(plan.file, e))
+		try:
+			os.remove(tmp)
+		except OSError:
+			pass
+
+def cached(file):
+	# Return the cached plan for file or None if there is none or it is out of date
+	try:
+		with open(cachefile(file), 'rb') as f:
+			cache = pickle.load(f)
+		if cache['format'] != FORMAT or cache['python'] != sys.version:
+			return None
+		for path, sha1 in cache['plan']['dependencies'].iteritems():
+			if filedigest(path) != sha1:
+				return None
+	except (IOError, OSError, EOFError, KeyError, TypeError, ValueError, pickle.UnpicklingError):
+		return None
+
+	plan = pageplan.__new__(pageplan)
+	plan.__dict__.update(cache['plan'])
+	plan.file = file
+	plan.cached = True
+	return plan
+
+def load(file, usecache=True):
+	# Return the plan for page file.  Raises the page file's exception if it can not be imported.
+	# usecache (bool) -- Set to False to compile the page file even if a cached plan is current
+	plan = cached(file) if usecache else None
+	if plan is None:
+		plan = compilepage(file)
+		save(plan)
+	return plan
@@ -11,7 +11,7 @@ import time, math, logging, os
 import fonts
 import graphics as g
 import display
-import moment
+import clock
 import RPi.GPIO as GPIO
 from PIL import Image
 
@@ -76,7 +76,7 @@ class pyLCD(object):
                 'length':400,
                 'volume':50,
                 'stream':'Not webradio',
-                'utc':     moment.utcnow(),
+                'utc':     clock.utcnow(),
                 'outside_temp_formatted':'46\xb0F',
                 'outside_temp_max':72,
                 'outside_temp_min':48,
@@ -97,7 +97,7 @@ class pyLCD(object):
                 'length':400,
                 'volume':50,
                 'stream':'Not webradio',
-                'utc': moment.utcnow(),
+                'utc': clock.utcnow(),
                 'outside_temp_formatted':'46\xb0F',
                 'outside_temp_max':72,
                 'outside_temp_min':48,
@@ -133,11 +133,12 @@ class pyLCD(object):
         while True:
             elapsed = int(time.time()-starttime)
             db['elapsed']=elapsed
-            db['utc'] = moment.utcnow()
+            db['utc'] = clock.utcnow()
             self.processevent(events, starttime, 'pre', db, dbp)
             img = dc.next()
             self.processevent(events, starttime, 'post', db, dbp)
-            lcd.update(img)
+            if img is not display.SAMEFRAME:
+                lcd.update(img)
             time.sleep(.01)
 
     def simpleDemo(self):
@@ -85,7 +85,7 @@ if __name__ == '__main__':
 	import graphics as g
 	import fonts
 	import display
-	import moment
+	import clock
 
 	def processevent(events, starttime, prepost, db, dbp):
 		for evnt in events:
@@ -139,7 +139,7 @@ if __name__ == '__main__':
 			'length':400,
 			'volume':50,
 			'stream':'Not webradio',
-			'utc': 	moment.utcnow(),
+			'utc': 	clock.utcnow(),
 			'outside_temp_formatted':'46\xb0F',
 			'outside_temp_max':72,
 			'outside_temp_min':48,
@@ -163,7 +163,7 @@ if __name__ == '__main__':
 			'length':400,
 			'volume':50,
 			'stream':'Not webradio',
-			'utc': 	moment.utcnow(),
+			'utc': 	clock.utcnow(),
 			'outside_temp_formatted':'46\xb0F',
 			'outside_temp_max':72,
 			'outside_temp_min':48,
@@ -209,11 +209,12 @@ if __name__ == '__main__':
 		while True:
 			elapsed = int(time.time()-starttime)
 			db['elapsed']=elapsed
-			db['utc'] = moment.utcnow()
+			db['utc'] = clock.utcnow()
 			processevent(events, starttime, 'pre', db, dbp)
 			img = dc.next()
 			processevent(events, starttime, 'post', db, dbp)
-			lcd.update(img)
+			if img is not display.SAMEFRAME:
+				lcd.update(img)
 			time.sleep(.001)
 
 
@@ -26,6 +26,7 @@ import time, math,logging
 import lcd_display_driver
 import fonts
 import graphics as g
+import bitmap
 from PIL import Image
 import logging
 
@@ -36,6 +37,8 @@ except:
 
 class winstar_weg(lcd_display_driver.lcd_display_driver):
 
+	BITMAPS_SUPPORTED = True
+
 	# commands
 	LCD_CLEARDISPLAY = 0x01
 	LCD_RETURNHOME = 0x02
@@ -93,6 +96,7 @@ class winstar_weg(lcd_display_driver.lcd_display_driver):
 		self.enable_duration = enable_duration
 
 		self.fb = [[]]
+		self.frame = None # Bitmap of what is on the display
 
 		self.FONTS_SUPPORTED = True
 
@@ -152,6 +156,7 @@ class winstar_weg(lcd_display_driver.lcd_display_driver):
 		# Set cursor back to 0,0
 		self.setCursor(0,0) # set cursor position to zero
 		self.fb = [[]]
+		self.frame = None # Send every column on the next update
 
 		# And then clear the screen
 		self.write4bits(self.LCD_CLEARDISPLAY) # command to clear display
@@ -186,13 +191,21 @@ class winstar_weg(lcd_display_driver.lcd_display_driver):
 		self.update(textwidget.image)
 
 	def update(self, image):
+		# image may be a PIL image or a bitmap
 
 		# Make image the same size as the display
-		img = image.crop( (0,0,self.cols, self.rows))
-
-		# Compute frame from image
-		frame = self.getframe( img, 0,0, self.cols,self.rows )
-		self.updateframe(frame)
+		if not isinstance(image, bitmap.bitmap):
+			image = bitmap.bitmap.frompil(image)
+		if image.size != (self.cols, self.rows):
+			image = image.crop( (0,0,self.cols, self.rows))
+
+		# Only send the columns of each page that have changed
+		pages = image.pages()
+		for j, x0, x1 in image.dirty(self.frame):
+			self.setCursor(j*8,x0)
+			for byte in pages[j][x0:x1+1]:
+				self.write4bits(byte, True)
+		self.frame = image
 
 	def updateframe(self, newbuf):
 
@@ -205,6 +218,7 @@ class winstar_weg(lcd_display_driver.lcd_display_driver):
 				except IndexError:
 					byte = 0
 				self.write4bits(byte, True)
+		self.frame = None
 
 	def cleanup(self):
 		GPIO.cleanup()
@@ -219,7 +233,7 @@ if __name__ == '__main__':
 	import graphics as g
 	import fonts
 	import display
-	import moment
+	import clock
 
 	def processevent(events, starttime, prepost, db, dbp):
 		for evnt in events:
@@ -286,7 +300,7 @@ if __name__ == '__main__':
 			'length':400,
 			'volume':50,
 			'stream':'Not webradio',
-			'utc': 	moment.utcnow(),
+			'utc': 	clock.utcnow(),
 			'outside_temp_formatted':'46\xb0F',
 			'outside_temp_max':72,
 			'outside_temp_min':48,
@@ -307,7 +321,7 @@ if __name__ == '__main__':
 			'length':400,
 			'volume':50,
 			'stream':'Not webradio',
-			'utc': 	moment.utcnow(),
+			'utc': 	clock.utcnow(),
 			'outside_temp_formatted':'46\xb0F',
 			'outside_temp_max':72,
 			'outside_temp_min':48,
@@ -354,11 +368,12 @@ if __name__ == '__main__':
 		while True:
 			elapsed = int(time.time()-starttime)
 			db['elapsed']=elapsed
-			db['utc'] = moment.utcnow()
+			db['utc'] = clock.utcnow()
 			processevent(events, starttime, 'pre', db, dbp)
 			img = dc.next()
 			processevent(events, starttime, 'post', db, dbp)
-			lcd.update(img)
+			if img is not display.SAMEFRAME:
+				lcd.update(img)
 			time.sleep(.1)
 
 
@@ -5,12 +5,13 @@
 # Written by: Ron Ritchey
 
 from __future__ import unicode_literals
-import json, threading, logging, Queue, time, sys, getopt, moment, signal, commands, os, copy, datetime, math, requests
+import json, threading, logging, Queue, time, sys, getopt, signal, commands, os, copy, datetime, math, requests
 import pages
 import displays
 import sources
 import pydPiper_config
 import pause
+import startup
 
 #try:
 #    import pyowm
@@ -19,6 +20,15 @@ import pause
 
 
 exitapp = [ False ]
+launched = time.time() # Used to report how long startup takes
+
+class timedqueue(Queue.Queue):
+    # A Queue that records when each item was placed on it
+    # Sources put their updates as normal.  get returns a (time enqueued, item) tuple.
+    # Times come from the monotonic clock that the virtual elapsed variable is based on.
+
+    def _put(self, item):
+        Queue.Queue._put(self, (sources.derived.monotonic(), item))
 
 class music_controller(threading.Thread):
     # Receives updates from music services
@@ -27,6 +37,8 @@ class music_controller(threading.Thread):
 
     # musicdata variables.
     # Includes all from musicdata class plus environmentals
+    # Derived variables (elapsed_formatted, remaining, *_onoff and the backwards compatibility aliases) are
+    # computed by musicdata when a page reads them.  See sources/derived.py.
     musicdata_init = {
         'state':u"stop",
         'musicdatasource':u"",
@@ -35,13 +47,10 @@ class music_controller(threading.Thread):
         'title':u"",
         'album':u"",
         'uri':u"",
-        'current':-1,
-        'elapsed':-1,
-        'remaining':u"",
-        'duration':-1,
+        'elapsed_anchor':-1,        # elapsed is computed from these.  See sources/derived.py
+        'elapsed_anchortime':0.0,
+        'elapsed_rate':0.0,
         'length':-1,
-        'position':u"",
-        'elapsed_formatted':u"",
         'volume':-1,
         'repeat': 0,
         'single': 0,
@@ -52,52 +61,83 @@ class music_controller(threading.Thread):
         'samplerate':u"",
         'type':u"",
         'tracktype':u"",
-        'repeat_onoff': u"Off",
-        'single_onoff': u"Off",
-        'random_onoff': u"Off",
         'playlist_display':u"",
         'playlist_position':-1,
-        'playlist_count':-1,
         'playlist_length':-1,
-        'current_tempc':0,
-        'current_tempf':0,
+        'system_tempc':0,
+        'system_tempf':0,
         'disk_avail':0,
         'disk_availp':0,
         'current_time':u"",
-        'utc':moment.utcnow(),
-        'localtime':moment.utcnow().timezone(pydPiper_config.TIMEZONE),
+        'utc':displays.clock.utcnow(),
+        'localtime':displays.clock.localnow(),
         'current_time_sec':u"",
         'current_time_formatted':u"",
         'time_formatted':u"",
-        'current_ip':u"",
+        'ip':u"",
         'outside_conditions':'No data',
         'outside_temp_min':0,
         'outside_temp_max':0,
         'outside_temp_formatted':'',
-        'system_temp_formatted':''
+        'system_temp_formatted':'',
+        'stale':False,              # True while showing the values restored from the state file (see restorestate)
+        'audio_rms':(),             # Live audio levels.  Set by sources/audiometer.py when AUDIO_FIFO is configured
+        'audio_peak':(),
+        'audio_spectrum':()
     }
 
+    # Variables saved to the state file.  elapsed is saved as well.
+    statekeys = [ u'state', u'musicdatasource', u'actPlayer', u'artist', u'title', u'album', u'uri', u'length', u'volume',
+        u'repeat', u'single', u'random', u'channels', u'bitdepth', u'bitrate', u'samplerate', u'type', u'tracktype',
+        u'playlist_display', u'playlist_position', u'playlist_length',
+        u'outside_conditions', u'outside_temp', u'outside_temp_formatted', u'outside_temp_min', u'outside_temp_max',
+        u'outside_temp_min_formatted', u'outside_temp_max_formatted',
+        u'system_temp', u'system_temp_formatted', u'system_tempc', u'system_tempf',
+        u'disk_avail', u'disk_availp', u'disk_used', u'disk_usedp', u'ip' ]
+    stateinterval = 60 # Seconds between saves of the state file
+
 
     def __init__(self, servicelist, display_controller, showupdates=False):
         threading.Thread.__init__(self)
 
         self.daemon = True
-        self.musicqueue = Queue.Queue()
+        self.musicqueue = timedqueue()
         self.image = None
         self.showupdates = showupdates
         self.display_controller = display_controller
 
-        self.musicdata = copy.deepcopy(self.musicdata_init)
-        self.musicdata_prev = copy.deepcopy(self.musicdata)
+        # Set the timezone used for localtime
+        try:
+            displays.clock.settimezone(pydPiper_config.TIMEZONE)
+        except ValueError:
+            logging.warning(u"Timezone {0} is not valid.  Using UTC".format(pydPiper_config.TIMEZONE))
+
+        self.musicdata = sources.musicstore.musicstore(self.musicdata_init)
+        self.musicdata_prev = self.musicdata.dbp
         self.servicelist = servicelist
         self.services = { }
 
+        # When the weather restored from the state file has to be fetched again
+        self.weatherexpires = { }
+        self.statelock = threading.Lock()
+
+        # Show the last known state at once if the previous run saved it.  Otherwise show the startup message until a music service sends its status (see run).
+        self.restored = self.restorestate()
+        if not self.restored:
+            self.musicdata[u'state'] = u'starting'
+        self.musicdata.commit()
+
         # Attempt to initialize services
         self.initservices()
 
         # Lock used to prevent simultaneous update of the musicdata dictionary
+        # Writers must commit their changes before releasing it.  The display controller reads
+        # the committed snapshot and so never needs to take this lock.
         self.musicdata_lock = threading.Lock()
 
+        # Update statistics.  Latencies are measured from when a source enqueued an update until it was committed to musicdata.
+        self.stats = { 'messages':0, 'commits':0, 'latency_last':0.0, 'latency_max':0.0, 'latency_total':0.0 }
+
 
     def initservices(self):
 
@@ -109,29 +149,31 @@ class music_controller(threading.Thread):
             logging.critical(u"Volumio service can only be used alone")
             raise RuntimeError(u"Volumio service can only be used alone")
 
-        musicservice = None
+        # Arguments for each music service.  The services are imported from sources.SOURCES only when they are selected.
+        arguments = {
+            u'mpd': (pydPiper_config.MPD_SERVER, pydPiper_config.MPD_PORT, pydPiper_config.MPD_PASSWORD),
+            u'moode': (pydPiper_config.MPD_SERVER, pydPiper_config.MPD_PORT, pydPiper_config.MPD_PASSWORD),
+            u'spop': (pydPiper_config.SPOP_SERVER, pydPiper_config.SPOP_PORT, pydPiper_config.SPOP_PASSWORD),
+            u'lms': (pydPiper_config.LMS_SERVER, pydPiper_config.LMS_PORT, pydPiper_config.LMS_USER, pydPiper_config.LMS_PASSWORD, pydPiper_config.LMS_PLAYER),
+            u'rune': (pydPiper_config.RUNE_SERVER, pydPiper_config.RUNE_PORT, pydPiper_config.RUNE_PASSWORD),
+            u'volumio': (pydPiper_config.VOLUMIO_SERVER, pydPiper_config.VOLUMIO_PORT, exitapp),
+        }
+
         for s in self.servicelist:
             s = s.lower()
+            musicservice = None
+            if s not in sources.SOURCES or s not in arguments:
+                logging.debug(u"Unsupported music service {0} requested".format(s))
+                continue
             try:
-                if s == u"mpd" or s == u"moode":
-                    musicservice = sources.musicdata_mpd.musicdata_mpd(self.musicqueue, pydPiper_config.MPD_SERVER, pydPiper_config.MPD_PORT, pydPiper_config.MPD_PASSWORD)
-                elif s == u"spop":
-                    musicservice = sources.musicdata_spop.musicdata_spop(self.musicqueue, pydPiper_config.SPOP_SERVER, pydPiper_config.SPOP_PORT, pydPiper_config.SPOP_PASSWORD)
-                elif s == u"lms":
-                    musicservice = sources.musicdata_lms.musicdata_lms(self.musicqueue, pydPiper_config.LMS_SERVER, pydPiper_config.LMS_PORT, pydPiper_config.LMS_USER, pydPiper_config.LMS_PASSWORD, pydPiper_config.LMS_PLAYER)
-                elif s == u"rune":
-                    musicservice = sources.musicdata_rune.musicdata_rune(self.musicqueue, pydPiper_config.RUNE_SERVER, pydPiper_config.RUNE_PORT, pydPiper_config.RUNE_PASSWORD)
-                elif s == u"volumio":
-                    musicservice = sources.musicdata_volumio2.musicdata_volumio2(self.musicqueue, pydPiper_config.VOLUMIO_SERVER, pydPiper_config.VOLUMIO_PORT, exitapp )
-                else:
-                    logging.debug(u"Unsupported music service {0} requested".format(s))
-                    continue
-            except NameError:
+                musicservice = sources.source(s)(self.musicqueue, *arguments[s])
+            except ImportError as e:
                 # Missing dependency for requested servicelist
-                logging.warning(u"Request for {0} failed due to missing dependencies".format(s))
-                pass
+                logging.warning(u"Request for {0} failed due to missing dependencies ({1})".format(s, e))
             if musicservice != None:
                 self.services[s] = musicservice
+                # albumart widgets ask the services for artwork
+                displays.albumart.fetchers.append(musicservice.artwork)
 
         if len(self.services) == 0:
             logging.critical(u"No music services succeeded in initializing")
@@ -149,90 +191,88 @@ class music_controller(threading.Thread):
         self.launch_update_thread(self.updatesystemvars)
         self.launch_update_thread(self.updateconditions)
         self.launch_update_thread(self.updateforecast)
-
-        timesongstarted = 0
+        self.launch_update_thread(self.updatestatefile)
+        self.startaudiometer()
 
 
-        # Inform the system that we are starting up
-        with self.musicdata_lock:
-            self.musicdata_prev[u'state'] = ''
-            self.musicdata[u'state'] = 'starting'
+        lastversion = 0 # Version of musicdata when changes were last processed
         self.starttime = time.time()
+        firststatus = True
+        firsttrack = True
 
         lastupdate = 0 # Initialize variable to be used to force updates every second regardless of the receipt of a source update
         while not exitapp[0]:
 
             updates = { }
 
-            # Check if we are starting up.  If yes, update pages to display any start message.
-            if self.starttime + pydPiper_config.STARTUP_MSG_DURATION > time.time():
-                time.sleep(pydPiper_config.STARTUP_MSG_DURATION)
-                with self.musicdata_lock:
-                    self.musicdata['state'] = 'stop'
-                continue
-
-            # Attempt to get an update from the queue
+            # Wait for an update from the queue but no longer than the next forced update
+            timeout = lastupdate - time.time()
             try:
-                updates = self.musicqueue.get_nowait()
-                self.musicqueue.task_done()
+                messages = [ self.musicqueue.get(True, timeout) if timeout > 0 else self.musicqueue.get_nowait() ]
             except Queue.Empty:
-                pass
+                messages = [ ]
+
+            # Drain anything else that is pending so that a burst of source updates is committed as a single update
+            while messages:
+                try:
+                    messages.append(self.musicqueue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            # Merge the messages in the order they were sent
+            elapsedat = None
+            for enqueued, msg in messages:
+                updates.update(msg)
+                if u'elapsed' in msg:
+                    elapsedat = enqueued
+                self.musicqueue.task_done()
+
+            # The first status from a music service replaces the restored state or ends the startup message.
+            # Without a status the startup message is shown for STARTUP_MSG_DURATION but restored values are kept.
+            if firststatus and messages:
+                firststatus = False
+                logging.info(u"First status from a music service {0:.2f}s after launch".format(time.time()-launched))
+                updates[u'stale'] = False
+                if u'state' not in updates and self.musicdata[u'state'] == u'starting':
+                    updates[u'state'] = u'stop'
+            elif self.musicdata[u'state'] == u'starting' and self.starttime + pydPiper_config.STARTUP_MSG_DURATION <= time.time():
+                updates[u'state'] = u'stop'
 
             # Get current time
-            try:
-                utc = moment.utcnow()
-                localtime = moment.utcnow().timezone(pydPiper_config.TIMEZONE)
-                current_time_ampm = moment.utcnow().timezone(pydPiper_config.TIMEZONE).strftime(u"%p").strip().decode()
-                if pydPiper_config.TIME24HOUR == True:
-                    current_time = moment.utcnow().timezone(pydPiper_config.TIMEZONE).strftime(u"%H:%M").strip().decode()
-                    current_time_sec = moment.utcnow().timezone(pydPiper_config.TIMEZONE).strftime(u"%H:%M:%S").strip().decode()
-                    current_time_ampm = u''
-                else:
-                    current_time = moment.utcnow().timezone(pydPiper_config.TIMEZONE).strftime(u"%-I:%M %p").strip().decode()
-                    current_time_sec = moment.utcnow().timezone(pydPiper_config.TIMEZONE).strftime(u"%-I:%M:%S %p").strip().decode()
-            except ValueError:
-                # Don't know why but on exit, the moment code is occasionally throwing a ValueError
-                current_time = u"00:00"
-                current_time_sec = u"00:00:00"
+            # The clock returns the same value for the rest of the second so each format below is only computed once a second
+            utc = displays.clock.utcnow()
+            localtime = displays.clock.localnow()
+            if pydPiper_config.TIME24HOUR == True:
+                current_time = localtime.strftime(u"%H:%M").strip()
+                current_time_sec = localtime.strftime(u"%H:%M:%S").strip()
                 current_time_ampm = u''
-                utc = None
-                localtime = None
+            else:
+                current_time = localtime.strftime(u"%-I:%M %p").strip()
+                current_time_sec = localtime.strftime(u"%-I:%M:%S %p").strip()
+                current_time_ampm = localtime.strftime(u"%p").strip()
 
             with self.musicdata_lock:
+                # Position before the update in case the state changes without a new position
+                position = self.musicdata[u'elapsed']
+
                 # Update musicdata based upon received message
                 for item, value in updates.iteritems():
-                    self.musicdata[item] = value
+                    if item != u'elapsed':
+                        self.musicdata[item] = value
 
                 # Update song timing variables
+                # elapsed is not stored.  It is computed when read from the last position a source sent (the anchor),
+                # when that was received and the rate it advances at so it does not need to be updated while playing.
+                # The position was accurate when the source sent it so anchor it to when it was enqueued.
+                rate = 1.0 if self.musicdata[u'state'] == u'play' else 0.0
                 if u'elapsed' in updates:
-                    self.musicdata[u'elapsed'] = self.musicdata[u'current'] = updates[u'elapsed']
-                    timesongstarted = time.time() - self.musicdata[u'elapsed']
-
-                if self.musicdata[u'state'] == u'play':
-                    if u'elapsed' not in updates:
-                        if timesongstarted > 0:
-                            self.musicdata[u'elapsed'] = int(time.time() - timesongstarted)
-                        else:
-                            # We got here without timesongstarted being set which is a problem...
-                            logging.debug(u"Trying to update current song position with an uninitialized start time")
-
-                # If the value of current has changed then update the other related timing variables
-                if self.musicdata[u'elapsed'] != self.musicdata_prev[u'elapsed']:
-                    if self.musicdata[u'length'] > 0:
-                        timepos = time.strftime("%-M:%S", time.gmtime(self.musicdata[u'elapsed'])) + "/" + time.strftime("%-M:%S", time.gmtime(self.musicdata[u'length']))
-                        remaining = time.strftime("%-M:%S", time.gmtime(self.musicdata[u'length'] - self.musicdata[u'elapsed'] ) )
-
-                    else:
-                        timepos = time.strftime("%-M:%S", time.gmtime(self.musicdata[u'elapsed']))
-                        remaining = timepos
-
-                    self.musicdata[u'remaining'] = remaining.decode()
-                    self.musicdata[u'elapsed_formatted'] = self.musicdata[u'position'] = timepos.decode()
-
-                # Update onoff variables (random, single, repeat)
-                self.musicdata[u'random_onoff'] = u"On" if self.musicdata[u'random'] else u"Off"
-                self.musicdata[u'single_onoff'] = u"On" if self.musicdata[u'single'] else u"Off"
-                self.musicdata[u'repeat_onoff'] = u"On" if self.musicdata[u'repeat'] else u"Off"
+                    self.musicdata[u'elapsed_anchor'] = updates[u'elapsed']
+                    self.musicdata[u'elapsed_anchortime'] = elapsedat
+                    self.musicdata[u'elapsed_rate'] = rate
+                elif rate != self.musicdata[u'elapsed_rate']:
+                    self.musicdata[u'elapsed_anchor'] = position
+                    self.musicdata[u'elapsed_anchortime'] = sources.derived.monotonic()
+                    self.musicdata[u'elapsed_rate'] = rate
 
                 # update time variables
                 self.musicdata[u'utc'] = utc
@@ -245,34 +285,46 @@ class music_controller(threading.Thread):
                 self.musicdata[u'current_time'] = current_time
                 self.musicdata[u'current_time_sec'] = current_time
 
+                self.musicdata.commit()
+
+                if firsttrack and self.musicdata[u'title']:
+                    firsttrack = False
+                    logging.info(u"First track received {0:.2f}s after launch".format(time.time()-launched))
+
+            # Record how long the committed updates waited
+            if messages:
+                latency = sources.derived.monotonic() - messages[0][0]
+                self.stats['messages'] += len(messages)
+                self.stats['commits'] += 1
+                self.stats['latency_last'] = latency
+                self.stats['latency_total'] += latency
+                if latency > self.stats['latency_max']:
+                    self.stats['latency_max'] = latency
 
             # If anything has changed, update pages ### probably unnecessary to check this now that time is being updated in this section
-            if self.musicdata != self.musicdata_prev or lastupdate < time.time():
+            if self.musicdata.version != lastversion or lastupdate < time.time():
 
                 # Set lastupdate time to 1 second in the future
                 lastupdate = time.time()+1
 
-                self.musicdata[u'time_formatted'] = moment.utcnow().timezone(pydPiper_config.TIMEZONE).strftime('%H:%M').strip().decode()
-                # To support previous key used for this purpose
-                self.musicdata[u'current_time_formatted'] = self.musicdata[u'time_formatted']
+                with self.musicdata_lock:
+                    self.musicdata[u'time_formatted'] = displays.clock.localnow().strftime(u'%H:%M').strip()
+                    # To support previous key used for this purpose
+                    self.musicdata[u'current_time_formatted'] = self.musicdata[u'time_formatted']
+                    self.musicdata.commit()
 
                 # Update display controller
                 # The primary call to this routine is in main but this call is needed to catch variable changes before musicdata_prev is updated.
-                self.display_controller.next()
+                # The frame is not displayed here so it is held for main to deliver.
+                self.display_controller.next(False)
 
                 # Print the current contents of musicdata if showupdates is True
                 if self.showupdates:
 
                     # Check to see if a variable has changed (except time variables)
                     shouldshowupdate = False
-                    for item, value in self.musicdata.iteritems():
-                        try:
-                            if item in ['utc', 'localtime', 'time', 'time_ampm', 'current_time', 'current_time_sec']:
-                                continue
-                            if self.musicdata_prev[item] != value:
-                                shouldshowupdate = True
-                                break
-                        except KeyError:
+                    for item in self.musicdata.changedsince(lastversion):
+                        if item not in ['utc', 'localtime', 'time', 'time_ampm', 'current_time', 'current_time_sec', 'audio_rms', 'audio_peak', 'audio_spectrum']:
                             shouldshowupdate = True
                             break
 
@@ -294,15 +346,97 @@ class music_controller(threading.Thread):
 
                 # Update musicdata_prev
                 with self.musicdata_lock:
-                    for item, value in self.musicdata.iteritems():
-                        try:
-                            if self.musicdata_prev[item] != value:
-                                self.musicdata_prev[item] = value
-                        except KeyError:
-                            self.musicdata_prev[item] = value
+                    self.musicdata.settle()
+                    self.musicdata.commit()
+                    lastversion = self.musicdata.version
+
+    def startaudiometer(self):
+        # Read live audio for the vumeter and spectrum widgets if a fifo is configured
+        # The meter publishes into musicdata itself.  See sources/audiometer.py.
+        self.audiometer = None
+        if not pydPiper_config.AUDIO_FIFO:
+            return
+        try:
+            import sources.audiometer
+            self.audiometer = sources.audiometer.audiometer(self.musicdata, self.musicdata_lock, pydPiper_config.AUDIO_FIFO,
+                pydPiper_config.AUDIO_FORMAT, pydPiper_config.AUDIO_FPS, pydPiper_config.AUDIO_BANDS, exitapp)
+        except ImportError as e:
+            logging.warning(u"Audio meter requires numpy ({0})".format(e))
+        except ValueError as e:
+            logging.warning(u"Audio meter not started: {0}".format(e))
+
+    def restorestate(self):
+        # Restore the variables saved by savestate so the first page shows the last known track, weather and system status.
+        # They are marked stale (db['stale']) until a music service sends its status.  Returns True if the state was restored.
+        try:
+            with open(pydPiper_config.STATEFILE) as f:
+                state = json.load(f)
+            values = state[u'values']
+            saved = state[u'saved']
+            weatherexpires = state[u'weatherexpires']
+        except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+            logging.debug(u"No state restored from {0} ({1})".format(pydPiper_config.STATEFILE, e))
+            return False
+
+        for k in self.statekeys:
+            if k in values:
+                self.musicdata[k] = values[k]
+
+        # The position does not advance until the music service confirms the track is still playing
+        self.musicdata[u'elapsed_anchor'] = values.get(u'elapsed', -1)
+        self.musicdata[u'elapsed_anchortime'] = sources.derived.monotonic()
+        self.musicdata[u'elapsed_rate'] = 0.0
+        self.musicdata[u'stale'] = True
+        self.weatherexpires.update(weatherexpires)
 
-            # Update display data every 1/4 second
-            time.sleep(.25)
+        logging.info(u"Restored the state saved {0:.0f}s ago from {1}".format(time.time()-saved, pydPiper_config.STATEFILE))
+        return True
+
+    def savestate(self):
+        # Save the variables in statekeys and when the weather has to be fetched again to STATEFILE (see restorestate)
+        # The file is replaced in one step so a crash or power loss while saving leaves the previous one intact.
+        snap = self.musicdata.snapshot
+        values = { }
+        for k in self.statekeys + [ u'elapsed' ]:
+            v = snap.get(k)
+            if isinstance(v, (basestring, int, long, float, bool)):
+                values[k] = v
+        if values.get(u'state') == u'starting':
+            del values[u'state']
+
+        state = { u'saved': time.time(), u'values': values, u'weatherexpires': self.weatherexpires }
+        with self.statelock:
+            tmp = u'{0}.{1}'.format(pydPiper_config.STATEFILE, os.getpid())
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump(state, f)
+                os.rename(tmp, pydPiper_config.STATEFILE)
+            except (IOError, OSError, TypeError, ValueError) as e:
+                logging.warning(u"Unable to save state to {0} ({1})".format(pydPiper_config.STATEFILE, e))
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                return False
+        return snap.version
+
+    def updatestatefile(self):
+        # Save the state every stateinterval seconds if one of the saved variables has changed.  main saves it again at shutdown.
+        lastsaved = self.musicdata.snapshot.version
+        while not exitapp[0]:
+            pause.sleepUntil(time.time()+self.stateinterval, exitapp)
+            if exitapp[0]:
+                break
+            snap = self.musicdata.snapshot
+            if max(snap.stamp(k) for k in self.statekeys) > lastsaved:
+                lastsaved = self.savestate() or lastsaved
+
+    def waitforweather(self, kind):
+        # Weather restored from the state file is shown until it is due to be fetched again instead of being fetched at once
+        expires = self.weatherexpires.get(kind, 0)
+        if expires > time.time():
+            logging.debug(u"Using the restored weather {0} until {1}".format(kind, time.strftime(u'%H:%M', time.localtime(expires))))
+            pause.sleepUntil(expires, exitapp)
 
     def checkweatherconfiguration(self):
         if not pydPiper_config.WEATHER_SERVICE:
@@ -345,6 +479,7 @@ class music_controller(threading.Thread):
             return
 
         logging.debug('Initializing weather forecast update process.  Forecasts will update every 12 hours at noon and midnight')
+        self.waitforweather(u'forecast')
 
         while not exitapp[0]:
             updateFlag = False
@@ -378,9 +513,13 @@ class music_controller(threading.Thread):
                     self.musicdata[u'outside_temp_max_formatted'] = outside_temp_max_formatted
                     self.musicdata[u'outside_temp_min_formatted'] = outside_temp_min_formatted
                     self.musicdata[u'outside_conditions'] = outside_conditions
+                    self.musicdata.commit()
 
             # Sleep until next update which occurs every half day
-            pause.sleepUntil(time.time()+pause.nextHalfday(60), exitapp)
+            nextupdate = time.time()+pause.nextHalfday(60)
+            if updateFlag:
+                self.weatherexpires[u'forecast'] = nextupdate
+            pause.sleepUntil(nextupdate, exitapp)
 
 
     def updateconditions(self):
@@ -388,6 +527,7 @@ class music_controller(threading.Thread):
             return
 
         logging.debug('Initializing weather current conditions update process.  Current conditions will update every hour')
+        self.waitforweather(u'conditions')
 
         while not exitapp[0]:
             updateFlag = False
@@ -413,6 +553,7 @@ class music_controller(threading.Thread):
                         with self.musicdata_lock:
                             self.musicdata[u'outside_temp'] = temp
                             self.musicdata[u'outside_temp_formatted'] = temp_formatted
+                            self.musicdata.commit()
 
             # If using Weather Undergroun, sample current and forecast condition date every hour
             elif pydPiper_config.WEATHER_SERVICE == 'wunderground':
@@ -454,6 +595,7 @@ class music_controller(threading.Thread):
                             self.musicdata[u'outside_temp_max_formatted'] = outside_temp_max_formatted
                             self.musicdata[u'outside_temp_min_formatted'] = outside_temp_min_formatted
                             self.musicdata[u'outside_conditions'] = outside_conditions
+                            self.musicdata.commit()
 
             # If using weerlive.nl, sample current condition date every hour
             elif pydPiper_config.WEATHER_SERVICE == 'weerlive':
@@ -492,9 +634,13 @@ class music_controller(threading.Thread):
                             self.musicdata[u'outside_temp_max_formatted'] = outside_temp_max_formatted
                             self.musicdata[u'outside_temp_min_formatted'] = outside_temp_min_formatted
                             self.musicdata[u'outside_conditions'] = outside_conditions
+                            self.musicdata.commit()
 
             # Sleep until next update which occurs every hour
-            pause.sleepUntil(time.time()+pause.nextHour(60), exitapp)
+            nextupdate = time.time()+pause.nextHour(60)
+            if updateFlag:
+                self.weatherexpires[u'conditions'] = nextupdate
+            pause.sleepUntil(nextupdate, exitapp)
 
 
     def updatesystemvars(self):
@@ -588,10 +734,6 @@ class music_controller(threading.Thread):
                 self.musicdata[u'system_tempc'] = system_tempc
                 self.musicdata[u'system_tempf'] = system_tempf
 
-                # For backward compatibility
-                self.musicdata[u'current_tempc'] = self.musicdata[u'system_tempc']
-                self.musicdata[u'current_tempf'] = self.musicdata[u'system_tempf']
-
                 self.musicdata[u'disk_avail'] = avail
                 self.musicdata[u'disk_availp'] = availp
                 self.musicdata[u'disk_used'] = used
@@ -600,8 +742,7 @@ class music_controller(threading.Thread):
 
                 self.musicdata[u'ip'] = current_ip.decode()
 
-                # For backwards compatibility
-                self.musicdata[u'current_ip'] = current_ip.decode()
+                self.musicdata.commit()
 
             # Sleep until next update which occurs every minutes
             pause.sleepUntil(time.time()+300, exitapp)
@@ -609,6 +750,47 @@ class music_controller(threading.Thread):
 def sigterm_handler(_signo, _stack_frame):
         sys.exit(0)
 
+def checkpages(files, size):
+    # Report the problems found in each page file and how long it takes to load without using the display
+    # Returns 1 if any page file has errors, otherwise 0
+    retval = 0
+    for file in files:
+        print u"{0}".format(file)
+        try:
+            t = time.time()
+            plan = displays.pageplan.compilepage(file)
+            compiletime = time.time() - t
+        except Exception as e:
+            print u"  ERROR: Unable to load page file ({0})".format(e)
+            retval = 1
+            continue
+
+        displays.pageplan.save(plan)
+        t = time.time()
+        displays.pageplan.load(file)
+        cachedtime = time.time() - t
+
+        # The problems found are reported below and widgets complain about the missing music data so silence the log while loading
+        dc = displays.display.display_controller(size)
+        logging.disable(logging.ERROR)
+        try:
+            t = time.time()
+            dc.load(file, {}, {})
+            loadtime = time.time() - t
+        except Exception as e:
+            loadtime = None
+            plan.error(u"Display controller failed to load the page file ({0})", e)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        for level, msg in plan.errors:
+            print u"  {0}: {1}".format(logging.getLevelName(level), msg)
+        errors = len([ e for e in plan.errors if e[0] >= logging.ERROR ])
+        if errors:
+            retval = 1
+        print u"  {0} errors, {1} warnings.  Compile {2:.1f}ms, cached plan {3:.1f}ms, display load {4}".format(errors, len(plan.errors)-errors, compiletime*1000, cachedtime*1000, u"{0:.1f}ms".format(loadtime*1000) if loadtime is not None else u"failed")
+    return retval
+
 if __name__ == u'__main__':
     import math
     signal.signal(signal.SIGTERM, sigterm_handler)
@@ -648,15 +830,16 @@ if __name__ == u'__main__':
     loggingPIL.setLevel( logging.WARN )
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:],u"d:",[u"driver=",u"devicetype=",u"width=",u"height=","rs=","e=","d4=","d5=","d6=","d7=","i2caddress=","i2cport=" ,u"wapi=", u"wlocale=", u"timezone=", u"temperature=", u"lms",u"mpd",u"spop",u"rune",u"volumio",u"pages=", u"lmsplayer=", u"showupdates"])
+        opts, args = getopt.getopt(sys.argv[1:],u"d:",[u"driver=",u"devicetype=",u"width=",u"height=","rs=","e=","d4=","d5=","d6=","d7=","i2caddress=","i2cport=" ,u"wapi=", u"wlocale=", u"timezone=", u"temperature=", u"lms",u"mpd",u"spop",u"rune",u"volumio",u"pages=", u"lmsplayer=", u"showupdates", u"check-pages"])
     except getopt.GetoptError:
-        print (u'pydPiper.py -d <driver> --devicetype <devicetype (for LUMA devices)> --width <width in pixels> --height <height in pixels> --rs <rs> --e <e> --d4 <d4> --d5 <d5> --d6 <d6> --d7 <d7> --i2caddress <i2c address> --i2cport <i2c port> --wapi <weather underground api key> --wlocale <weather location> --timezone <timezone> --temperature <fahrenheit or celsius> --mpd --spop --lms --rune --volumio --pages <pagefile> --lmsplayer <mac address of lms player> --showupdates')
+        print (u'pydPiper.py -d <driver> --devicetype <devicetype (for LUMA devices)> --width <width in pixels> --height <height in pixels> --rs <rs> --e <e> --d4 <d4> --d5 <d5> --d6 <d6> --d7 <d7> --i2caddress <i2c address> --i2cport <i2c port> --wapi <weather underground api key> --wlocale <weather location> --timezone <timezone> --temperature <fahrenheit or celsius> --mpd --spop --lms --rune --volumio --pages <pagefile> --lmsplayer <mac address of lms player> --showupdates --check-pages [pagefile ...]')
         sys.exit(2)
 
     services_list = [ ]
     driver = ''
     devicetype = ''
     showupdates = False
+    check = False
     pagefile = 'pages.py'
 
     pin_rs = pydPiper_config.DISPLAY_PIN_RS
@@ -674,7 +857,7 @@ if __name__ == u'__main__':
 
     for opt, arg in opts:
         if opt == u'-h':
-            print (u'pydPiper.py -d <driver> --devicetype <devicetype e.g. ssd1306, sh1106> --width <width in pixels> --height <height in pixels> --rs <rs> --e <e> --d4 <d4> --d5 <d5> --d6 <d6> --d7 <d7> --i2caddress <i2c address> --i2cport <i2c port> --enable <enable duration> --wapi <weather underground api key> --wlocale <weather location> --timezone <timezone> --temperature <fahrenheit or celsius> --mpd --spop --lms --rune --volumio --pages <pagefile> --lmsplayer <mac address of lms player> --showupdates')
+            print (u'pydPiper.py -d <driver> --devicetype <devicetype e.g. ssd1306, sh1106> --width <width in pixels> --height <height in pixels> --rs <rs> --e <e> --d4 <d4> --d5 <d5> --d6 <d6> --d7 <d7> --i2caddress <i2c address> --i2cport <i2c port> --enable <enable duration> --wapi <weather underground api key> --wlocale <weather location> --timezone <timezone> --temperature <fahrenheit or celsius> --mpd --spop --lms --rune --volumio --pages <pagefile> --lmsplayer <mac address of lms player> --showupdates --check-pages [pagefile ...]')
             sys.exit()
         elif opt in (u"-d", u"--driver"):
             driver = arg
@@ -738,9 +921,15 @@ if __name__ == u'__main__':
 
         elif opt in (u"--showupdates"):
             showupdates = True
+        elif opt in (u"--check-pages"):
+            check = True
 
     pydPiper_config.DISPLAY_SIZE = (cols, rows)
 
+    # Check the page files given as arguments (or the configured page file) and exit
+    if check:
+        sys.exit(checkpages(args or [pagefile], pydPiper_config.DISPLAY_SIZE))
+
     pins_data = [pin_d4, pin_d5, pin_d6, pin_d7]
 
     if len(services_list) == 0:
@@ -768,43 +957,102 @@ if __name__ == u'__main__':
             devicetype = u''
 
 
-    if driver == u"winstar_weg":
-        lcd = displays.winstar_weg.winstar_weg(rows, cols, pin_rs, pin_e, pins_data, enable)
-    elif driver == u"hd44780":
-        lcd = displays.hd44780.hd44780(rows, cols, pin_rs, pin_e, pins_data, enable)
-    elif driver == u"hd44780_i2c":
-        lcd = displays.hd44780_i2c.hd44780_i2c(rows, cols, i2c_address, i2c_port, enable)
-    elif driver == u"hd44780_mcp23008":
-        lcd = displays.hd44780_i2c.hd44780_mcp23008(rows, cols, i2c_address, i2c_port, enable)
-    elif driver == u"ssd1306_i2c":
-        lcd = displays.ssd1306_i2c.ssd1306_i2c(rows, cols, i2c_address, i2c_port)
-    elif driver == u"luma_i2c":
-        lcd = displays.luma_i2c.luma_i2c(rows, cols, i2c_address, i2c_port, devicetype)
-    elif driver == u"lcd_curses":
-        lcd = displays.lcd_curses.lcd_curses(rows, cols)
-    else:
+    # Arguments for each display driver.  Only the selected driver is imported (see displays.DRIVERS).
+    arguments = {
+        u'winstar_weg': (rows, cols, pin_rs, pin_e, pins_data, enable),
+        u'hd44780': (rows, cols, pin_rs, pin_e, pins_data, enable),
+        u'hd44780_i2c': (rows, cols, i2c_address, i2c_port, enable),
+        u'hd44780_mcp23008': (rows, cols, i2c_address, i2c_port, enable),
+        u'ssd1306_i2c': (rows, cols, i2c_address, i2c_port),
+        u'luma_i2c': (rows, cols, i2c_address, i2c_port, devicetype),
+        u'lcd_curses': (rows, cols),
+    }
+
+    if driver not in displays.DRIVERS or driver not in arguments:
         logging.critical(u"No valid display found")
         sys.exit()
 
-    lcd.clear()
-
-
     logging.debug('Loading display controller')
     dc = displays.display.display_controller(pydPiper_config.DISPLAY_SIZE)
+    displays.albumart.cache.directory = pydPiper_config.ALBUMART_CACHE
+
+    # Startup tasks run in parallel as soon as the tasks they need have finished (see startup.py)
+    def initdisplay():
+        lcd = displays.driver(driver)(*arguments[driver])
+        lcd.clear()
+        return lcd
+
+    def loadplan():
+        return displays.pageplan.load(pagefile)
+
+    def loaddefaultfont(plan):
+        for v in plan.FONTS.itervalues():
+            if v.get(u'default') and v.get(u'file'):
+                return displays.fonts.bmfont.bmfont(v[u'file']).fontpkg
+        raise RuntimeError(u"Page file {0} has no default font".format(pagefile))
+
+    def showsplash(lcd, fontpkg):
+        # Shown until the page file has loaded
+        lcd.update(dc.splash(fontpkg))
+        logging.info(u"Splash shown {0:.2f}s after launch".format(time.time()-launched))
+
+    def startmusic():
+        # Music services connect on their own threads
+        logging.debug('Loading music controller')
+        return music_controller(services_list, dc, showupdates)
+
+    def loadpages(plan, mc):
+        dc.load(pagefile, mc.musicdata, mc.musicdata_prev, plan)
+        # Pick up changes to the page file without restarting
+        dc.watch()
+
+    boot = startup.tasks()
+    boot.add(u'display', initdisplay)
+    boot.add(u'plan', loadplan)
+    boot.add(u'font', loaddefaultfont, u'plan')
+    boot.add(u'splash', showsplash, u'display', u'font')
+    boot.add(u'music', startmusic)
+    boot.add(u'pages', loadpages, u'plan', u'music')
+    boot.start()
 
-    logging.debug('Loading music controller')
-    mc = music_controller(services_list, dc, showupdates)
-    time.sleep(2)
+    try:
+        lcd = boot.wait(u'display')
+    except ImportError as e:
+        logging.critical(u"Display driver {0} is missing a dependency ({1})".format(driver, e))
+        sys.exit()
+    mc = boot.wait(u'music')
+    boot.wait(u'pages')
+    try:
+        # The display must not be updated from two threads
+        boot.wait(u'splash')
+    except Exception as e:
+        logging.warning(u"Unable to show the splash screen ({0})".format(e))
     mc.start()
-    dc.load(pagefile, mc.musicdata,mc.musicdata_prev )
 
     try:
+        laststats = time.time()
+        firstframe = True
         while True:
             # Get next image and send it to the display every .1 seconds
-            with mc.musicdata_lock:
-                img = dc.next()
+            # next renders from the last snapshot committed to musicdata so no lock is needed
+            img = dc.next()
 #            displays.graphics.update(img)
-            lcd.update(img)
+
+            # Skip the display update entirely if the frame has not changed
+            # Drivers that accept bitmaps are sent the packed frame instead of the PIL image
+            if img is not displays.display.SAMEFRAME:
+                lcd.update(dc.frame if getattr(lcd, 'BITMAPS_SUPPORTED', False) else img)
+                if firstframe:
+                    firstframe = False
+                    logging.info(u"First page shown {0:.2f}s after launch".format(time.time()-launched))
+
+            # Report frame and update statistics once a minute
+            if laststats + 60 < time.time():
+                laststats = time.time()
+                logging.debug(u"Frame stats: {0} frames, {1} skipped, {2} layers culled".format(dc.stats['frames'], dc.stats['skipped'], dc.stats['culled']))
+                if mc.stats['commits'] > 0:
+                    logging.debug(u"Update stats: {0} messages in {1} commits, latency last {2:.3f}s avg {3:.3f}s max {4:.3f}s".format(mc.stats['messages'], mc.stats['commits'], mc.stats['latency_last'], mc.stats['latency_total']/mc.stats['commits'], mc.stats['latency_max']))
+
             time.sleep(pydPiper_config.ANIMATION_SMOOTHING)
 
 
@@ -814,6 +1062,7 @@ if __name__ == u'__main__':
     finally:
         print (u"Shutting down threads")
         exitapp[0] = True
+        mc.savestate()
         try:
             lcd.clear()
             lcd.message(u"Exiting...")
@@ -823,4 +1072,5 @@ if __name__ == u'__main__':
         except:
             pass
         mc.join()
+        displays.hotlog.flush()
         logging.info(u"Exiting...")
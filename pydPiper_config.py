@@ -1,5 +1,6 @@
 import logging
 import sys
+import os
 if sys.version_info[0] < 3:
     import ConfigParser
     config = ConfigParser.RawConfigParser()
@@ -7,7 +8,9 @@ else:
     import configparser
     config = configparser.RawConfigParser()
 
-config.read('pydPiper.cfg')
+# Page files that import this module depend on it.  See displays/pageplan.py.
+CONFIGFILE = os.path.abspath('pydPiper.cfg')
+config.read(CONFIGFILE)
 
 def safeget(config, section, option, default=None):
     return config.has_option(section, option) and config.get(section, option) or default
@@ -44,6 +47,12 @@ LOGFILE=safeget(config,'SYSTEM','logfile')
 # Logging level
 LOGLEVEL={'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'critical': logging.CRITICAL }.get(safeget(config,'SYSTEM', 'loglevel'))
 
+# The last known music data, weather and system status are saved here so they can be shown at once after a restart
+STATEFILE=safeget(config,'SYSTEM','statefile','/var/tmp/pydPiper.state')
+
+# Artwork shown by albumart widgets is saved here so it does not have to be fetched again
+ALBUMART_CACHE=safeget(config,'SYSTEM','albumartcache','/var/tmp/pydPiper.albumart')
+
 # Localization Parameters
 # Adjust this setting to localize the time display to your region
 TIMEZONE=safeget(config,'SYSTEM', 'timezone')
@@ -87,4 +96,11 @@ LMS_USER = safeget(config, 'SOURCE', 'lms_user')
 LMS_PASSWORD = safeget(config, 'SOURCE', 'lms_password')
 LMS_PLAYER = safeget(config, 'SOURCE', 'lms_player')
 
+# Live audio for the vumeter and spectrum widgets.  Raw PCM is read from audio_fifo (e.g. an MPD fifo output).
+# audio_format is rate:bits:channels as in mpd.conf.
+AUDIO_FIFO = safeget(config, 'SOURCE', 'audio_fifo')
+AUDIO_FORMAT = safeget(config, 'SOURCE', 'audio_format', '44100:16:2')
+AUDIO_FPS = int(safeget(config, 'SOURCE', 'audio_fps', 30))
+AUDIO_BANDS = int(safeget(config, 'SOURCE', 'audio_bands', 16))
+
 del (safeget)
@@ -1,37 +1,24 @@
-__all__ = [ u"musicdata_lms", u"musicdata_mpd", u"musicdata_spop", u"musicdata_rune", u"musicdata_volumio2", u"keydata" ]
-
-
-try:
-	import musicdata_lms
-except ImportError:
-	pass
-
-try:
-	import musicdata_mpd
-except ImportError:
-	pass
-
-try:
-	import musicdata_spop
-except ImportError:
-	pass
-
-try:
-	import musicdata_rune
-except ImportError:
-	pass
-
-try:
-	import musicdata_volumio2
-except ImportError:
-	pass
-
-try:
-	import musicdata
-except ImportError:
-	pass
-
-try:
-	import kegdata
-except ImportError:
-	pass
+__all__ = [ u"musicdata_lms", u"musicdata_mpd", u"musicdata_spop", u"musicdata_rune", u"musicdata_volumio2", u"musicstore", u"derived", u"keydata", u"audiometer", u"SOURCES", u"source" ]
+
+import importlib
+
+import derived
+import musicstore
+
+# Music services are only imported when they are selected (see source).  Each one needs its own client library
+# (mpd, pylms, redis, socketIO_client...) and importing them all would load every library that is installed.
+# kegdata is not a music service.  Import sources.kegdata directly to use it.
+SOURCES = {
+	u'mpd': u'musicdata_mpd.musicdata_mpd',
+	u'moode': u'musicdata_mpd.musicdata_mpd',
+	u'spop': u'musicdata_spop.musicdata_spop',
+	u'lms': u'musicdata_lms.musicdata_lms',
+	u'rune': u'musicdata_rune.musicdata_rune',
+	u'volumio': u'musicdata_volumio2.musicdata_volumio2',
+}
+
+def source(name):
+	# Import and return the class of music service name
+	# Raises KeyError if there is no such service and ImportError if a library it needs is not installed
+	module, cls = SOURCES[name].rsplit(u'.', 1)
+	return getattr(importlib.import_module(u'{0}.{1}'.format(__name__, module)), cls)
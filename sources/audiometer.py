@@ -0,0 +1,305 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# audiometer - live audio levels and spectrum read from a PCM fifo
+#
+# Reads raw PCM from a named pipe (e.g. MPD's fifo output) into a ring buffer and publishes the level of each channel
+# and a spectrum for the vumeter and spectrum widgets a fixed number of times a second.
+#
+# Unlike the music services it writes straight into the music controller's musicdata (holding its lock) instead of
+# sending updates over the queue.  The meters change up to fps times a second and every queued update wakes the music
+# controller which renders a frame on its own thread.
+#
+# MPD fifo output (mpd.conf)...
+#	audio_output {
+#		type	"fifo"
+#		name	"pydPiper"
+#		path	"/tmp/mpd.fifo"
+#		format	"44100:16:2"
+#	}
+#
+# Variables (every level is 0-100.  -60 dBFS is 0 and 0 dBFS is 100)...
+#	audio_rms -- tuple with the RMS level of each channel
+#	audio_peak -- tuple with the peak level of each channel.  Peaks fall back at FALL dB a second.
+#	audio_spectrum -- tuple with the level of each band.  Bands are spaced logarithmically from LOWEST to HIGHEST Hz
+#		and fall back at FALL dB a second.
+#
+# Requires numpy
+
+from __future__ import unicode_literals
+
+import threading, logging, time, os, sys, getopt, wave
+import numpy
+import derived
+
+# Sample formats by bits per sample.  8 bit samples are unsigned.
+DTYPES = { 8: '<u1', 16: '<i2', 32: '<i4' }
+
+VARIABLES = [ 'audio_rms', 'audio_peak', 'audio_spectrum' ]
+
+class audiometer(object):
+
+	WINDOW = 2048		# Samples in each FFT.  46ms at 44.1kHz.
+	RANGE = 60.0		# dB from the bottom to the top of a meter
+	FALL = 30.0			# dB a second that peaks and bands fall back
+	LOWEST = 40.0		# Hz
+	HIGHEST = 16000.0	# Hz
+	SILENCE = 0.5		# Seconds without samples before the meters fall back to 0
+
+	def __init__(self, db, lock, fifo, format=u'44100:16:2', fps=30, bands=16, exitapp=[ False ]):
+		# db (musicstore) -- where the variables are published
+		# lock (Lock) -- held while db is changed and committed
+		# fifo (unicode) -- path of the named pipe to read
+		# format (unicode) -- rate:bits:channels of the samples in the same form MPD uses
+		# fps (int) -- how many times a second the variables are published
+		# bands (int) -- number of bands in audio_spectrum
+
+		try:
+			self.rate, self.bits, self.channels = [ int(v) for v in format.split(u':') ]
+		except ValueError:
+			raise ValueError(u"Audio format {0} is not rate:bits:channels".format(format))
+		if self.bits not in DTYPES:
+			raise ValueError(u"Audio format {0} has {1} bit samples.  Supported sizes are {2}".format(format, self.bits, sorted(DTYPES)))
+
+		self.db = db
+		self.lock = lock
+		self.fifo = fifo
+		self.fps = fps
+		self.bands = bands
+		self.exitapp = exitapp
+		self.dtype = numpy.dtype(DTYPES[self.bits])
+
+		# Ring buffer of the most recent samples scaled to -1..1.  Twice the FFT window so the reader never has to wait for the analysis.
+		self.ring = numpy.zeros((self.WINDOW*2, self.channels), numpy.float32)
+		self.written = 0		# Frames written to ring since the start
+		self.received = 0		# When the last samples arrived
+		self.ringlock = threading.Lock()
+
+		# Hann window normalized so a full scale sine reads 0 dB
+		self.window = numpy.hanning(self.WINDOW).astype(numpy.float32)
+		self.windowgain = (self.window.sum()/2)**2
+
+		# First FFT bin of each band.  Every band gets at least one bin.
+		freqs = numpy.fft.rfftfreq(self.WINDOW, 1.0/self.rate)
+		edges = numpy.logspace(numpy.log10(self.LOWEST), numpy.log10(min(self.HIGHEST, self.rate/2.0)), bands+1)
+		starts = numpy.searchsorted(freqs, edges)
+		starts = numpy.maximum(starts, starts[0] + numpy.arange(bands+1))
+		self.starts = numpy.minimum(starts, len(freqs)-1)
+
+		# Levels as last published (in dB) so peaks and bands can fall back gradually
+		self.peaks = numpy.zeros(self.channels)
+		self.spectrum = numpy.zeros(bands)
+		self.analyzed = 0		# Frames written when the last analysis was done
+		self.lastrun = derived.monotonic()
+
+		self.stats = { 'frames':0, 'analysis':0.0, 'late':0 }
+
+		read_t = threading.Thread(target=self.read)
+		read_t.daemon = True
+		read_t.start()
+
+		run_t = threading.Thread(target=self.run)
+		run_t.daemon = True
+		run_t.start()
+
+	def read(self):
+		# Copy samples from the fifo into the ring buffer.  Opening the fifo waits until something writes to it.
+		framebytes = self.channels * self.dtype.itemsize
+		chunk = framebytes * max(1, self.rate // (self.fps*2))
+
+		while not self.exitapp[0]:
+			try:
+				fd = os.open(self.fifo, os.O_RDONLY)
+			except OSError as e:
+				logging.warning(u"Unable to open audio fifo {0}: {1}".format(self.fifo, e))
+				time.sleep(5)
+				continue
+
+			logging.debug(u"Reading audio from {0}".format(self.fifo))
+			try:
+				leftover = b''
+				while not self.exitapp[0]:
+					data = os.read(fd, chunk)
+					if not data:
+						# The writer closed the fifo
+						break
+					data = leftover + data
+					usable = len(data) - len(data) % framebytes
+					leftover = data[usable:]
+					if usable:
+						self.write(numpy.frombuffer(data[:usable], self.dtype).reshape(-1, self.channels))
+			except OSError as e:
+				logging.warning(u"Error reading audio fifo {0}: {1}".format(self.fifo, e))
+				time.sleep(1)
+			finally:
+				os.close(fd)
+
+	def write(self, samples):
+		# Add samples (frames x channels) to the ring buffer
+		if self.bits == 8:
+			samples = (samples.astype(numpy.float32) - 128) / 128
+		else:
+			samples = samples.astype(numpy.float32) / 2**(self.bits-1)
+
+		size = len(self.ring)
+		if len(samples) > size:
+			samples = samples[-size:]
+		with self.ringlock:
+			start = self.written % size
+			end = start + len(samples)
+			if end <= size:
+				self.ring[start:end] = samples
+			else:
+				self.ring[start:] = samples[:size-start]
+				self.ring[:end-size] = samples[size-start:]
+			self.written += len(samples)
+			self.received = derived.monotonic()
+
+	def recent(self, frames):
+		# Return the last frames written to the ring buffer (oldest first) and how many frames have been written
+		with self.ringlock:
+			written = self.written
+			index = numpy.arange(written-frames, written) % len(self.ring)
+			return self.ring[index], written
+
+	def analyze(self):
+		# Return the variables for the samples that have arrived since the last call
+		now = derived.monotonic()
+		fall = self.FALL * (now - self.lastrun)
+		self.lastrun = now
+
+		if now - self.received > self.SILENCE:
+			# Nothing is playing
+			rms = numpy.zeros(self.channels)
+			peaks = numpy.maximum(self.peaks - fall, 0)
+			spectrum = numpy.maximum(self.spectrum - fall, 0)
+		else:
+			samples, written = self.recent(self.WINDOW)
+			new = samples[-min(written - self.analyzed, self.WINDOW):]
+			self.analyzed = written
+
+			# Levels in dB above the bottom of the meter
+			rms = numpy.clip(20*numpy.log10(numpy.sqrt((samples**2).mean(axis=0)) + 1e-9) + self.RANGE, 0, self.RANGE)
+			peak = numpy.clip(20*numpy.log10(numpy.abs(new).max(axis=0) + 1e-9) + self.RANGE, 0, self.RANGE) if len(new) else 0
+			peaks = numpy.maximum(peak, self.peaks - fall)
+
+			power = numpy.abs(numpy.fft.rfft(samples.mean(axis=1) * self.window))**2 / self.windowgain
+			bands = numpy.add.reduceat(power[:self.starts[-1]], self.starts[:-1])
+			bands = numpy.clip(10*numpy.log10(bands + 1e-12) + self.RANGE, 0, self.RANGE)
+			spectrum = numpy.maximum(bands, self.spectrum - fall)
+
+		self.peaks = peaks
+		self.spectrum = spectrum
+
+		# Published as tuples of integers.  They compare equal while nothing changes so musicdata only changes when a meter moves.
+		scale = 100 / self.RANGE
+		return {
+			u'audio_rms': tuple(numpy.rint(rms * scale).astype(int).tolist()),
+			u'audio_peak': tuple(numpy.rint(peaks * scale).astype(int).tolist()),
+			u'audio_spectrum': tuple(numpy.rint(spectrum * scale).astype(int).tolist()),
+		}
+
+	def run(self):
+		# Publish the variables fps times a second.  If the analysis falls behind frames are dropped instead of run back to back.
+		period = 1.0 / self.fps
+		due = derived.monotonic()
+		while not self.exitapp[0]:
+			due += period
+			delay = due - derived.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+			else:
+				self.stats['late'] += 1
+				due = derived.monotonic()
+
+			start = derived.monotonic()
+			values = self.analyze()
+			with self.lock:
+				version = self.db.version
+				for k, v in values.iteritems():
+					self.db[k] = v
+				if self.db.version != version:
+					self.db.commit()
+			self.stats['frames'] += 1
+			self.stats['analysis'] += derived.monotonic() - start
+
+def playwav(filename, fifo, exitapp=[ False ]):
+	# Write the samples of a wav file to fifo at the speed they would play.  Used to test the meters without a music player.
+	w = wave.open(filename, 'rb')
+	format = u'{0}:{1}:{2}'.format(w.getframerate(), w.getsampwidth()*8, w.getnchannels())
+	def play():
+		with open(fifo, 'wb') as f:
+			chunk = w.getframerate() // 20
+			start = time.time()
+			sent = 0
+			while not exitapp[0]:
+				data = w.readframes(chunk)
+				if not data:
+					break
+				f.write(data)
+				f.flush()
+				sent += chunk
+				delay = start + float(sent)/w.getframerate() - time.time()
+				if delay > 0:
+					time.sleep(delay)
+		w.close()
+	play_t = threading.Thread(target=play)
+	play_t.daemon = True
+	play_t.start()
+	return format
+
+
+if __name__ == u'__main__':
+
+	import musicstore
+
+	logging.basicConfig(format=u'%(asctime)s:%(levelname)s:%(message)s', level=logging.DEBUG)
+
+	usage = u'audiometer.py -f <fifo> -a <rate:bits:channels> -w <wav file to play into the fifo> --fps <updates per second> --bands <bands>'
+	try:
+		opts, args = getopt.getopt(sys.argv[1:],u"hf:a:w:",[u"fifo=",u"format=",u"wav=",u"fps=",u"bands="])
+	except getopt.GetoptError:
+		print usage
+		sys.exit(2)
+
+	# Set defaults
+	fifo = u'/tmp/mpd.fifo'
+	format = u'44100:16:2'
+	wavfile = None
+	fps = 30
+	bands = 16
+
+	for opt, arg in opts:
+		if opt == u'-h':
+			print usage
+			sys.exit()
+		elif opt in (u"-f", u"--fifo"):
+			fifo = arg
+		elif opt in (u"-a", u"--format"):
+			format = arg
+		elif opt in (u"-w", u"--wav"):
+			wavfile = arg
+		elif opt in (u"--fps"):
+			fps = int(arg)
+		elif opt in (u"--bands"):
+			bands = int(arg)
+
+	if wavfile:
+		if not os.path.exists(fifo):
+			os.mkfifo(fifo)
+		format = playwav(wavfile, fifo)
+
+	db = musicstore.musicstore({ u'audio_rms': (), u'audio_peak': (), u'audio_spectrum': () })
+	meter = audiometer(db, threading.Lock(), fifo, format, fps, bands)
+
+	try:
+		while True:
+			time.sleep(1)
+			snap = db.snapshot
+			print u"rms {0} peak {1} spectrum {2}".format(snap[u'audio_rms'], snap[u'audio_peak'], snap[u'audio_spectrum'])
+			if meter.stats['frames']:
+				print u"{0} updates, {1} late, analysis avg {2:.2f}ms".format(meter.stats['frames'], meter.stats['late'], meter.stats['analysis']/meter.stats['frames']*1000)
+	except KeyboardInterrupt:
+		pass
+
+	print u"Exiting..."
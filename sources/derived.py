@@ -0,0 +1,170 @@
+# derived - musicdata variables that are computed from other musicdata variables
+from __future__ import unicode_literals
+
+import time, logging, ctypes, ctypes.util
+
+# Derived variables are not stored.  musicstore computes one the first time it is read after
+# any of its inputs has changed and remembers the result until an input changes again.
+# Variables that no page reads are never computed.
+
+# Volatile variables also depend on the passage of time (e.g. elapsed) so they are computed every time they are read.
+# Their due function returns the monotonic time at which their value next changes so widgets that show them only
+# check their value again once it is due (see due).
+NEVER = float('inf')
+
+class timespec(ctypes.Structure):
+	_fields_ = [ ('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long) ]
+
+CLOCK_MONOTONIC = 1
+
+def clockgettime():
+	# Return clock_gettime(CLOCK_MONOTONIC) from the C library or None if it is not available.
+	# Older C libraries only provide it in librt.
+	for name in [ ctypes.util.find_library('c'), ctypes.util.find_library('rt'), 'librt.so.1' ]:
+		if not name:
+			continue
+		try:
+			f = ctypes.CDLL(name, use_errno=True).clock_gettime
+		except (OSError, AttributeError):
+			continue
+		f.argtypes = [ ctypes.c_int, ctypes.POINTER(timespec) ]
+		t = timespec()
+		if f(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+			continue
+		def monotonic():
+			t = timespec()
+			f(CLOCK_MONOTONIC, ctypes.byref(t))
+			return t.tv_sec + t.tv_nsec * 1e-9
+		return monotonic
+	return None
+
+try:
+	monotonic = time.monotonic
+except AttributeError:
+	# Python 2 does not have a monotonic clock so it is read from the C library.  os.times is not used because its
+	# tick counter is a 32 bit clock_t on the Raspberry Pi which goes negative soon after boot and wraps.
+	monotonic = clockgettime()
+	if monotonic is None:
+		warned = [ False ]
+		def monotonic():
+			# Logged on first use because logging is not configured yet when this module is imported
+			if not warned[0]:
+				warned[0] = True
+				logging.warning(u"No monotonic clock available.  Using the time of day which jumps if the clock is set.")
+			return time.time()
+
+class derivedvar(object):
+	def __init__(self, name, inputs, function, volatile=False, due=None):
+		self.name = name			# Name of the variable
+		self.inputs = inputs		# Names of the variables it is computed from
+		self.function = function	# function(db) returning the value
+		self.volatile = volatile	# True if the value changes with time even if the inputs have not
+		self.due = due				# function(db) returning when a volatile value next changes.  None if it can change at any time.
+
+registry = { }
+
+def derive(name, *inputs, **kwargs):
+	# Decorator that registers function as the way to compute name from inputs
+	# volatile (bool) -- Set if the value changes with time
+	# due (function) -- function(db) returning the monotonic time at which a volatile value next changes
+	def register(function):
+		registry[name] = derivedvar(name, inputs, function, kwargs.get('volatile', False), kwargs.get('due'))
+		return function
+	return register
+
+def stamp(db, name):
+	# The version at which a derived variable last changed is the latest version at which one of its inputs changed
+	# Volatile variables also change with time without a new stamp.  See due.
+	return max([ db.stamp(i) for i in registry[name].inputs ] or [ 0 ])
+
+def due(db, name):
+	# Returns the monotonic time at which derived variable name next changes even if none of its inputs are changed.
+	# NEVER if it only changes with its inputs.
+	d = registry[name]
+	if d.volatile:
+		return d.due(db) if d.due else 0
+	return min([ due(db, i) for i in d.inputs if i in registry ] or [ NEVER ])
+
+def compute(db, name, memo=None):
+	# Returns the value of derived variable name as seen from db
+	# memo (dict) -- If provided, results are remembered in it keyed by the stamps of their inputs
+	d = registry[name]
+	if memo is None or d.volatile:
+		return d.function(db)
+
+	# Volatile inputs do not have a meaningful stamp so use their value instead
+	key = tuple([ db[i] if i in registry and registry[i].volatile else db.stamp(i) for i in d.inputs ])
+	e = memo.get(name)
+	if e is not None and e[0] == key:
+		return e[1]
+	value = d.function(db)
+	memo[name] = (key, value)
+	return value
+
+
+def elapsed_due(db):
+	# elapsed changes each time the position passes a whole second
+	rate = db[u'elapsed_rate']
+	if not rate:
+		return NEVER
+	anchor = db[u'elapsed_anchor']
+	anchortime = db[u'elapsed_anchortime']
+	position = anchor + (monotonic() - anchortime)*rate
+	if db[u'length'] > 0 and position >= db[u'length']:
+		return NEVER
+	return anchortime + (int(position) + 1 - anchor)/float(rate)
+
+@derive(u'elapsed', u'elapsed_anchor', u'elapsed_anchortime', u'elapsed_rate', u'length', volatile=True, due=elapsed_due)
+def elapsed(db):
+	# Playback position in seconds
+	# Sources only report the position when it can not be predicted (seek, pause or track change).  That report is
+	# the anchor which is advanced at rate (1 while playing, 0 otherwise) from the monotonic time it was received.
+	anchor = db[u'elapsed_anchor']
+	rate = db[u'elapsed_rate']
+	if not rate:
+		return anchor
+	retval = int(anchor + (monotonic() - db[u'elapsed_anchortime'])*rate)
+	if db[u'length'] > 0 and retval > db[u'length']:
+		retval = db[u'length']
+	return retval
+
+def minsec(seconds):
+	return time.strftime(u"%-M:%S", time.gmtime(int(seconds))).decode()
+
+@derive(u'elapsed_formatted', u'elapsed', u'length')
+def elapsed_formatted(db):
+	# if duration is not available, then suppress its display
+	if int(db[u'length']) > 0:
+		return u"{0}/{1}".format(minsec(db[u'elapsed']), minsec(db[u'length']))
+	return minsec(db[u'elapsed'])
+
+@derive(u'remaining', u'elapsed', u'length')
+def remaining(db):
+	if int(db[u'length']) > 0:
+		return minsec(int(db[u'length']) - int(db[u'elapsed']))
+	return minsec(db[u'elapsed'])
+
+@derive(u'random_onoff', u'random')
+def random_onoff(db):
+	return u"On" if db[u'random'] else u"Off"
+
+@derive(u'single_onoff', u'single')
+def single_onoff(db):
+	return u"On" if db[u'single'] else u"Off"
+
+@derive(u'repeat_onoff', u'repeat')
+def repeat_onoff(db):
+	return u"On" if db[u'repeat'] else u"Off"
+
+
+# For backwards compatibility
+def alias(name, original):
+	derive(name, original)(lambda db: db[original])
+
+alias(u'position', u'elapsed_formatted')
+alias(u'current', u'elapsed')
+alias(u'duration', u'length')
+alias(u'playlist_count', u'playlist_length')
+alias(u'current_ip', u'ip')
+alias(u'current_tempc', u'system_tempc')
+alias(u'current_tempf', u'system_tempf')
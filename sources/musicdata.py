@@ -2,6 +2,7 @@
 from __future__ import unicode_literals
 
 import abc,logging,urllib2,contextlib
+import musicstore, derived
 
 class musicdata:
 	__metaclass__ = abc.ABCMeta
@@ -15,6 +16,9 @@ class musicdata:
 	# Will send a message over the data queue whenever an update is received
 	# Will only send keys that have been updated
 
+	# Variables that can be computed from other variables (elapsed_formatted, remaining, the backwards
+	# compatibility aliases...) are not set by sources.  musicstore derives them when read.  See derived.py.
+
 	# May use a thread to issue keyalives to the music service if needed
 
 	# Future state
@@ -34,12 +38,10 @@ class musicdata:
 		'bitdepth':u"",
 		'bitrate':u"",
 		'samplerate':u"",
-		'elapsed_formatted':u"",
 		'album':u"",
 		'elapsed':-1,
 		'channels':0,
 		'length':0,
-		'remaining':u"",
 		'volume':-1,
 		'repeat':False,
 		'single':False,
@@ -51,10 +53,6 @@ class musicdata:
 		'my_name':u"", # Volumio 2 only
 
 		# Deprecated values
-		'current':-1,
-		'duration':-1,
-		'position':u"",
-		'playlist_count':-1,
 		'type':u""
 	}
 
@@ -76,8 +74,6 @@ class musicdata:
 			u'bitdepth',
 			u'bitrate',
 			u'samplerate',
-			u'elapsed_formatted',
-			u'remaining',
 			u'playlist_display',
 			u'my_name'
 		],
@@ -104,9 +100,14 @@ class musicdata:
 	}
 
 
+	# How far (in seconds) elapsed may stray from the position predicted from the last one sent before it is sent again
+	ELAPSEDTOLERANCE = 2
+
 	def __init__(self, q):
-		self.musicdata = self.musicdata_init.copy()
-		self.musicdata_prev = self.musicdata.copy()
+		self.musicdata = musicstore.musicstore(self.musicdata_init)
+		self.musicdata_prev = self.musicdata.dbp	# musicdata as it was when the last update was sent
+		self.sentversion = self.musicdata.version	# Version of musicdata when the last update was sent
+		self.anchor = (self.musicdata[u'elapsed'], derived.monotonic(), self.musicdata[u'state'])	# Last elapsed and state sent and when
 		self.dataqueue = q
 
 	def validatemusicvars(self, vars):
@@ -165,6 +166,20 @@ class musicdata:
 
 
 
+	def artwork(self, uri, album, artist):
+		# Return the artwork of a track as the contents of an image file or None if it is not available.
+		# Called from the album art cache's thread (see displays/albumart.py).  Services that can provide artwork override this.
+		return None
+
+	def fetch(self, url, timeout=10):
+		# Return the contents of url or None if it could not be read
+		try:
+			with contextlib.closing(urllib2.urlopen(url, timeout=timeout)) as page:
+				return page.read()
+		except (urllib2.URLError, IOError, ValueError) as e:
+			logging.debug(u"Unable to read {0}: {1}".format(url, e))
+			return None
+
 	def webradioname(self,url):
 		# Attempt to get name of webradio station
 		# Requires station to send name using the M3U protocol
@@ -216,23 +231,36 @@ class musicdata:
 
 
 	def sendUpdate(self):
-		# Figure out what has changed and then send just those values across dataqueue
+		# Send just the values that have changed since the last update across dataqueue
 		md = { }
-		for k, v in self.musicdata.iteritems():
-			pv = self.musicdata_prev[k] if k in self.musicdata_prev else None
-			if pv != v:
-				md[k] = v
-
+		for k in self.musicdata.changedsince(self.sentversion):
+			if k in self.musicdata:
+				md[k] = self.musicdata[k]
+
+		# elapsed is advanced by the receiver while playing so it is only sent when it can not be predicted
+		# from the last value sent.  That is after a seek, a pause or resume, or a change of track.
+		md.pop(u'elapsed', None)
+		if self.elapsedjumped() or u'state' in md or u'uri' in md or u'title' in md or u'playlist_position' in md:
+			md[u'elapsed'] = self.musicdata[u'elapsed']
+			md[u'state'] = self.musicdata[u'state']
+			self.anchor = (md[u'elapsed'], derived.monotonic(), md[u'state'])
 
 		# Send md to queue if anything has changed
 		if len(md) > 0:
-			# elapsed is special as it needs to be sent to guarantee that the timer gets updated correctly.  Even if it hasn't changed, send it anyway
-			md[u'elapsed'] = self.musicdata[u'elapsed']
-			md[u'state'] = self.musicdata[u'state']
 			self.dataqueue.put(md)
 
-			# Update musicdata_prev
-			self.musicdata_prev = self.musicdata.copy()
+		# Update musicdata_prev
+		self.sentversion = self.musicdata.version
+		self.musicdata.settle()
+
+	def elapsedjumped(self):
+		# Returns True if elapsed is no longer where the receiver expects it to be
+		elapsed, sent, state = self.anchor
+		expected = elapsed + (derived.monotonic() - sent) if state == u'play' else elapsed
+		try:
+			return abs(int(self.musicdata[u'elapsed']) - expected) > self.ELAPSEDTOLERANCE
+		except (ValueError, TypeError):
+			return True
 
 	def intn(self,val):
 		# A version of int that returns 0 if the value is not convertable
@@ -261,7 +289,7 @@ class musicdata:
 
 	def clear(self):
 		# revert data back to init state
-		self.musicdata = self.musicdata_init.copy()
+		self.musicdata.update(self.musicdata_init)
 
 	@abc.abstractmethod
 	def run():
@@ -19,6 +19,7 @@ class musicdata_lms(musicdata.musicdata):
 		self.user = user
 		self.pwd = pwd
 		self.player = player
+		self.webport = 9000	# Port of the LMS web interface.  Used for artwork.
 		self.connection_failed = 0
 		self.timeout = 20
 		self.idle_state = False
@@ -175,6 +176,12 @@ class musicdata_lms(musicdata.musicdata):
 				continue
 
 
+	def artwork(self, uri, album, artist):
+		# LMS serves the artwork of the track its player is playing from its web interface
+		if self.dataplayer is None or uri != self.musicdata[u'uri']:
+			return None
+		return self.fetch(u'http://{0}:{1}/music/current/cover.jpg?player={2}'.format(self.server, self.webport, urllib.quote(self.dataplayer.get_ref())))
+
 	def status(self):
 		# Read musicplayer status and update musicdata
 
@@ -199,10 +206,6 @@ class musicdata_lms(musicdata.musicdata):
 		except:
 			self.musicdata[u'length'] = 0
 
-		# For backwards compatibility
-		self.musicdata[u'current'] = self.musicdata[u'elapsed']
-		self.musicdata[u'duration'] = self.musicdata[u'length']
-
 		playlist_mode = int(self.dataplayer.request("playlist repeat ?", True))
 		if playlist_mode == 0:
 			self.musicdata[u'single'] = self.musicdata[u'repeat'] = False
@@ -228,8 +231,6 @@ class musicdata_lms(musicdata.musicdata):
 
 		plp = self.musicdata[u'playlist_position'] = int(self.dataplayer.request("playlist index ?"))+1
 		plc = self.musicdata[u'playlist_length'] = self.dataplayer.playlist_track_count()
-		# For backwards compatibility
-		self.musicdata[u'playlist_count'] = self.musicdata[u'playlist_length']
 
 		playlist_display = u"{0}/{1}".format(plp, plc)
 		# If the track count is greater than 1, we are playing from a playlist and can display track position and track count
@@ -289,20 +290,6 @@ class musicdata_lms(musicdata.musicdata):
 
 		self.musicdata[u'tracktype'] = self.musicdata[u'encoding']
 
-		# if duration is not available, then suppress its display
-		if int(self.musicdata[u'length']) > 0:
-			timepos = time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'elapsed']))) + "/" + time.strftime("%-M:%S", time.gmtime(int(self.musicdata[u'length'])))
-			remaining = time.strftime(u"%-M:%S", time.gmtime( int(self.musicdata[u'length']) - int(self.musicdata[u'elapsed']) ) )
-		else:
-			timepos = time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'current'])))
-			remaining = timepos
-
-		self.musicdata[u'remaining'] = remaining.decode()
-		self.musicdata[u'elapsed_formatted'] = timepos.decode()
-
-		# For backwards compatibility
-		self.musicdata[u'position'] = self.musicdata[u'elapsed_formatted']
-
 		# UNSUPPORTED VARIABLES
 		self.musicdata[u'bitdepth'] = u""
 		self.musicdata[u'samplerate'] = u""
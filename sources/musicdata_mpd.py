@@ -5,7 +5,7 @@
 # Written by: Ron Ritchey
 from __future__ import unicode_literals
 
-import json, mpd, threading, logging, Queue, time, sys, getopt
+import json, mpd, threading, logging, Queue, time, sys, getopt, socket
 import musicdata
 
 class musicdata_mpd(musicdata.musicdata):
@@ -22,6 +22,7 @@ class musicdata_mpd(musicdata.musicdata):
 		self.idle_state = False
 
 		self.dataclient = None
+		self.artcommands = None		# Which of readpicture and albumart MPD supports.  None until it has been asked.
 
 		# Now set up a thread to listen to the channel and update our data when
 		# the channel indicates a relevant key has changed
@@ -110,6 +111,76 @@ class musicdata_mpd(musicdata.musicdata):
 				continue
 
 
+	def artwork(self, uri, album, artist):
+		# Return the picture embedded in track uri (readpicture) or else the cover file in its directory (albumart).
+		# python-mpd2 only has these commands from version 3 which needs python 3 so they are sent directly over a
+		# connection of its own.  That also keeps the idle loop of the data connection undisturbed.
+		# MPD added albumart in 0.21 and readpicture in 0.22.  The server is asked once which of them it supports
+		# and older servers are not contacted for artwork again.
+		if not uri or uri.split(u':')[0] in [ u'http', u'https' ] or self.artcommands == [ ]:
+			return None
+
+		sock = socket.create_connection((self.server, int(self.port)), 10)
+		try:
+			f = sock.makefile('rb')
+			if not f.readline().startswith(b'OK MPD'):
+				raise mpd.ConnectionError(u"Unexpected greeting from MPD")
+			if self.pwd:
+				self.command(sock, f, u'password', self.pwd)
+
+			if self.artcommands is None:
+				fields, binary = self.command(sock, f, u'commands')
+				self.artcommands = [ c for c in [ u'readpicture', u'albumart' ] if c in fields.get(u'command', [ ]) ]
+				if not self.artcommands:
+					logging.info(u"MPD does not support albumart or readpicture (MPD 0.21 or newer is needed).  No artwork will be shown")
+					return None
+
+			for c in self.artcommands:
+				# Pictures are sent in chunks.  size is the size of the whole picture.
+				data = [ ]
+				offset = 0
+				try:
+					while True:
+						fields, binary = self.command(sock, f, c, uri, offset)
+						if not binary:
+							break
+						data.append(binary)
+						offset += len(binary)
+						if offset >= int(fields.get(u'size', [ 0 ])[0]):
+							break
+				except mpd.CommandError:
+					# No picture (e.g. no cover file in the directory)
+					continue
+				if data:
+					return b''.join(data)
+			return None
+		finally:
+			sock.close()
+
+	def command(self, sock, f, name, *args):
+		# Send command name to MPD on sock and return its response as a dictionary of lists of values and its binary data
+		# Raises mpd.CommandError if MPD reports an error
+		line = u' '.join([ name ] + [ u'"{0}"'.format(unicode(a).replace(u'\\', u'\\\\').replace(u'"', u'\\"')) for a in args ])
+		sock.sendall(line.encode('utf-8') + b'\n')
+
+		fields = { }
+		binary = b''
+		while True:
+			response = f.readline()
+			if not response:
+				raise mpd.ConnectionError(u"Connection to MPD lost")
+			response = response.rstrip(b'\n')
+			if response == b'OK':
+				return fields, binary
+			if response.startswith(b'ACK'):
+				raise mpd.CommandError(response.decode('utf-8'))
+			key, value = response.split(b': ', 1)
+			if key == b'binary':
+				binary = f.read(int(value))
+				f.readline()
+			else:
+				fields.setdefault(key.decode('utf-8'), [ ]).append(value.decode('utf-8'))
+
 	def status(self):
 		# Read musicplayer status and update musicdata
 
@@ -150,10 +221,6 @@ class musicdata_mpd(musicdata.musicdata):
 		self.musicdata[u'elapsed'] = int(self.musicdata[u'elapsed'])
 		self.musicdata[u'length'] = int(self.musicdata[u'length'])
 
-		# for backwards compatibility
-		self.musicdata[u'current'] = self.musicdata[u'elapsed']
-		self.musicdata[u'duration'] = self.musicdata[u'length']
-
 		self.musicdata[u'actPlayer'] = u"MPD"
 		self.musicdata[u'musicdatasource'] = u"MPD"
 
@@ -169,16 +236,13 @@ class musicdata_mpd(musicdata.musicdata):
 		plp = self.musicdata[u'playlist_position'] = int(status[u'song'])+1 if u'song' in status else 0
 		plc = self.musicdata[u'playlist_length'] = int(status[u'playlistlength']) if u'playlistlength' in status else 0
 
-		# For Backwards compatibility
-		self.musicdata[u'playlist_count'] = self.musicdata[u'playlist_length']
-
 		# If playlist is length 1 and the song playing is from an http source it is streaming
 		if self.musicdata[u'encoding'] == u'webradio':
 			self.musicdata[u'playlist_display'] = u"Radio"
 			if not self.musicdata[u'artist']:
 				self.musicdata[u'artist'] = current_song[u'name'] if u'name' in current_song else u""
 		else:
-				self.musicdata[u'playlist_display'] = u"{0}/{1}".format(self.musicdata[u'playlist_position'], self.musicdata[u'playlist_count'])
+				self.musicdata[u'playlist_display'] = u"{0}/{1}".format(self.musicdata[u'playlist_position'], self.musicdata[u'playlist_length'])
 
 		audio = status[u'audio'] if u'audio' in status else None
 		bitdepth = u""
@@ -215,20 +279,6 @@ class musicdata_mpd(musicdata.musicdata):
 		self.musicdata[u'samplerate'] = samplerate
 		self.musicdata[u'channels'] = chnum
 
-		# if duration is not available, then suppress its display
-		if int(self.musicdata[u'length']) > 0:
-			timepos = time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'elapsed']))) + u"/" + time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'length'])))
-			remaining = time.strftime(u"%-M:%S", time.gmtime( int(self.musicdata[u'length']) - int(self.musicdata[u'elapsed']) ) )
-		else:
-			timepos = time.strftime("%-M:%S", time.gmtime(int(self.musicdata['elapsed'])))
-			remaining = timepos
-
-		self.musicdata[u'remaining'] = remaining.decode()
-		self.musicdata[u'elapsed_formatted'] = timepos.decode()
-
-		# For backwards compatibility
-		self.musicdata[u'position'] = self.musicdata[u'elapsed_formatted']
-
 		self.validatemusicvars(self.musicdata)
 
 
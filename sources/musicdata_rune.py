@@ -141,10 +141,6 @@ class musicdata_rune(musicdata.musicdata):
 		self.musicdata[u'repeat'] = bool(self.intn(status[u'repeat'])) if u'repeat' in status else False
 		self.musicdata[u'musicdatasource'] = u"Rune"
 
-		# For backwards compatibility
-		self.musicdata[u'duration'] = self.musicdata[u'length']
-		self.musicdata[u'current'] = self.musicdata[u'elapsed']
-
 		# Set default values
 		self.musicdata[u'samplerate'] = u""
 		self.musicdata[u'bitrate'] = u""
@@ -159,9 +155,6 @@ class musicdata_rune(musicdata.musicdata):
 			plp = self.musicdata[u'playlist_position'] = self.intn(status[u'song'])+1 if u'song' in status else 0
 			plc = self.musicdata[u'playlist_length'] = self.intn(status[u'playlistlength']) if u'playlistlength' in status else 0
 
-			# For backwards compatibility
-			self.musicdata[u'playlist_count'] = self.musicdata[u'playlist_length']
-
 			self.musicdata[u'playlist_display'] = u"{0}/{1}".format(plp, plc)
 			self.musicdata[u'actPlayer'] = u"Spotify"
 			self.musicdata[u'tracktype'] = u"Spotify"
@@ -171,9 +164,6 @@ class musicdata_rune(musicdata.musicdata):
 			plp = self.musicdata[u'playlist_position'] = self.intn(status[u'song'])+1 if u'song' in status else 0
 			plc = self.musicdata[u'playlist_length'] = self.intn(status[u'playlistlength']) if u'playlistlength' in status else 0
 
-			# For backwards compatibility
-			self.musicdata[u'playlist_count'] = self.musicdata[u'playlist_length']
-
 			self.musicdata[u'bitrate'] = u"{0} kbps".format(status[u'bitrate']) if u'bitrate' in status else u""
 
 			# if radioname is None then this is coming from a playlist (e.g. not streaming)
@@ -220,7 +210,6 @@ class musicdata_rune(musicdata.musicdata):
 
 		elif self.musicdata[u'actPlayer'] == u'Airplay':
 			self.musicdata[u'playlist_position'] = 1
-			self.musicdata[u'playlist_count'] = 1
 			self.musicdata[u'playlist_length'] = 1
 			self.musicdata[u'tracktype'] = u"Airplay"
 			self.musicdata[u'playlist_display'] = u"Aplay"
@@ -230,26 +219,11 @@ class musicdata_rune(musicdata.musicdata):
 			# Unexpected player type
 			logging.debug(u"Unexpected player type {0} discovered".format(actPlayer))
 			self.musicdata[u'playlist_position'] = 1
-			self.musicdata[u'playlist_count'] = 1
 			self.musicdata[u'playlist_length'] = 1
 			self.musicdata[u'tracktype'] = actPlayer
 			self.musicdata[u'playlist_display'] = u"Radio"
 			self.musicdata[u'stream'] = u'webradio'
 
-		# if duration is not available, then suppress its display
-		if int(self.musicdata[u'length']) > 0:
-			timepos = time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'elapsed']))) + "/" + time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'length'])))
-			remaining = time.strftime(u"%-M:%S", time.gmtime( int(self.musicdata[u'length']) - int(self.musicdata[u'elapsed']) ) )
-		else:
-			timepos = time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'elapsed'])))
-			remaining = timepos
-
-		self.musicdata[u'remaining'] = remaining.decode()
-		self.musicdata[u'elapsed_formatted'] = timepos.decode()
-
-		# For backwards compatibility
-		self.musicdata[u'position'] = self.musicdata[u'elapsed_formatted']
-
 		self.validatemusicvars(self.musicdata)
 
 
@@ -142,16 +142,13 @@ class musicdata_spop(musicdata.musicdata):
 		self.musicdata[u'length'] = self.intn(status[u'duration']/1000) if u'duration' in status else 0
 		self.musicdata[u'elapsed'] = self.intn(status[u'position']) if u'position' in status else 0
 		self.musicdata[u'playlist_position'] = self.intn(status[u'current_track']) if u'current_track' in status else 0
-		self.musicdata[u'playlist_length'] = self.musicdata[u'playlist_count'] = self.intn(status[u'total_tracks']) if u'total_tracks' in status else 0
+		self.musicdata[u'playlist_length'] = self.intn(status[u'total_tracks']) if u'total_tracks' in status else 0
 		self.musicdata[u'uri'] = status[u'uri'] if u'uri' in status else u""
 		self.musicdata[u'repeat'] = status[u'repeat'] if u'repeat' in status else False
 		self.musicdata[u'random'] = status[u'shuffle'] if u'shuffle' in status else False
 
 		self.musicdata[u'single'] = False # Not support in SPOP
 
-		self.musicdata[u'current'] = self.musicdata[u'elapsed']
-		self.musicdata[u'duration'] = self.musicdata[u'length']
-
 		self.musicdata[u'actPlayer'] = u"Spotify"
 		self.musicdata[u'musicdatasource'] = u"SPOP"
 
@@ -161,17 +158,6 @@ class musicdata_spop(musicdata.musicdata):
 		plp = self.musicdata[u'playlist_position']
 		plc = self.musicdata[u'playlist_length']
 
-		if self.musicdata[u'length'] > 0:
-			timepos = time.strftime(u"%-M:%S", time.gmtime(self.musicdata[u'elapsed'])) + "/" + time.strftime(u"%-M:%S", time.gmtime(self.musicdata[u'length']))
-			remaining = time.strftime(u"%-M:%S", time.gmtime(self.musicdata[u'length'] - self.musicdata[u'duration'] ) )
-
-		else:
-			timepos = time.strftime(u"%-M:%S", time.gmtime(self.musicdata[u'elapsed']))
-			remaining = timepos
-
-		self.musicdata[u'remaining'] = remaining.decode()
-		self.musicdata[u'elapsed_formatted'] = self.musicdata[u'position'] = timepos.decode()
-
 		self.musicdata[u'playlist_display'] = u"{0}/{1}".format(plp, plc)
 		self.musicdata[u'tracktype'] = u"SPOP"
 
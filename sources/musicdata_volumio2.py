@@ -27,6 +27,9 @@ class musicdata_volumio2(musicdata.musicdata):
 
 		self.musicdata_lock = threading.Lock()
 
+		# uri and artwork url of the current track
+		self.albumart = (u'', u'')
+
 		# Now set up a thread to listen to the channel and update our data when
 		# the channel indicates a relevant key has changed
 		data_t = threading.Thread(target=self.run)
@@ -57,6 +60,15 @@ class musicdata_volumio2(musicdata.musicdata):
 				socketIO.emit(u'getQueue', '')
 				socketIO.emit(u'getState', '')
 
+	def artwork(self, uri, album, artist):
+		# Volumio sends the url of the current track's artwork with its state.  Local artwork has a url relative to the Volumio web service.
+		current, url = self.albumart
+		if not url or current != uri:
+			return None
+		if not url.startswith(u'http'):
+			url = u'http://{0}:{1}{2}'.format(self.server, self.port, url if url.startswith(u'/') else u'/' + url)
+		return self.fetch(url)
+
 	def on_multiroomdevices_response(self, *args):
 		list = args[0][u'list']
 
@@ -76,9 +88,6 @@ class musicdata_volumio2(musicdata.musicdata):
 			except:
 				self.musicdata[u'playlist_length'] = 0
 
-			# For backwards compatibility
-			self.musicdata[u'playlist_count'] = self.musicdata[u'playlist_length']
-
 			plp = self.musicdata[u'playlist_position'] if u'playlist_position' in self.musicdata else 0
 			stream = self.musicdata[u'stream'] if u'stream' in self.musicdata else u""
 
@@ -128,6 +137,7 @@ class musicdata_volumio2(musicdata.musicdata):
 			self.musicdata[u'artist'] = status[u'artist'] if u'artist' in status else u""
 			self.musicdata[u'title'] = status[u'title'] if u'title' in status else u""
 			self.musicdata[u'uri'] = status[u'uri'] if u'uri' in status else u""
+			self.albumart = (self.musicdata[u'uri'], status[u'albumart'] if u'albumart' in status else u"")
 			self.musicdata[u'bitdepth'] = status[u'bitdepth'] if u'bitdepth' in status else u""
 			self.musicdata[u'tracktype'] = status[u'trackType'] if u'trackType' in status else u""
 			self.musicdata[u'samplerate'] = status[u'samplerate'] if u'samplerate' in status else u""
@@ -135,14 +145,9 @@ class musicdata_volumio2(musicdata.musicdata):
 			# Numeric values
 			self.musicdata[u'elapsed'] = int(self.floatn(status[u'seek'])/1000) if u'seek' in status else 0
 
-			# For backwards compatibility
-			self.musicdata[u'current'] = self.musicdata[u'elapsed']
-
 			self.musicdata[u'volume'] = self.intn(status[u'volume']) if u'volume' in status else 0
 
 			self.musicdata[u'length'] = self.intn(status[u'duration']) if u'duration' in status else 0
-			# For backwards compatibility
-			self.musicdata[u'duration'] = self.musicdata[u'length']
 
 			try:
 				playlist_position = status[u'position'] if u'position' in status else 0
@@ -178,7 +183,7 @@ class musicdata_volumio2(musicdata.musicdata):
 
 
 			# Determine what playlist_display should look like
-			# playlist_count comes from queue messages which are handled in on_queue_response
+			# playlist_length comes from queue messages which are handled in on_queue_response
 			# So, we'll be updating playlist_display both here and there to make sure we have the latest
 			# regardless of whether on_state_response or on_queue_response updates the underlying data
 			plc = self.musicdata[u'playlist_length'] if u'playlist_length' in self.musicdata else 0
@@ -191,21 +196,6 @@ class musicdata_volumio2(musicdata.musicdata):
 			else:
 				self.musicdata[u'playlist_display'] = u"{0}/{1}".format(self.musicdata[u'playlist_position'], plc)
 
-
-			# if duration is not available, then suppress its display
-			if int(self.musicdata[u'length']) > 0:
-				timepos = time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'elapsed']))) + u"/" + time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'length'])))
-				remaining = time.strftime(u"%-M:%S", time.gmtime( int(self.musicdata[u'length']) - int(self.musicdata[u'elapsed']) ) )
-			else:
-				timepos = time.strftime(u"%-M:%S", time.gmtime(int(self.musicdata[u'elapsed'])))
-				remaining = timepos
-
-			self.musicdata[u'remaining'] = remaining.decode()
-			self.musicdata[u'elapsed_formatted'] = timepos.decode()
-
-			# For backwards compatibility
-			self.musicdata[u'position'] = self.musicdata[u'elapsed_formatted']
-
 			self.validatemusicvars(self.musicdata)
 
 		self.sendUpdate()
@@ -213,7 +203,7 @@ class musicdata_volumio2(musicdata.musicdata):
 
 if __name__ == u'__main__':
 
-	import moment, getopt
+	import getopt
 
 	logging.basicConfig(format=u'%(asctime)s:%(levelname)s:%(message)s', filename=u'musicdata_volumio2.log', level=logging.DEBUG)
 	logging.getLogger().addHandler(logging.StreamHandler())
@@ -251,7 +241,7 @@ if __name__ == u'__main__':
 				status = q.get(timeout=1000)
 				q.task_done()
 
-				ctime = moment.utcnow().timezone(u"US/Eastern").strftime(u"%-I:%M:%S %p").strip()
+				ctime = time.strftime(u"%-I:%M:%S %p").strip()
 				print u"\n\nStatus at time {0}".format(ctime)
 				for item,value in status.iteritems():
 					print u"    [{0}]={1} {2}".format(item,value, type(value))
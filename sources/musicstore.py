@@ -0,0 +1,254 @@
+# musicstore - versioned dictionary used to hold musicdata
+from __future__ import unicode_literals
+
+import derived
+
+# Markers used in musicstore.previous
+_UNCHANGED = object()	# Key has not changed since settle was last called
+_ABSENT = object()		# Key did not exist when settle was last called
+
+class musicstore(dict):
+
+	# A dictionary that keeps a version stamp for each of its keys
+	# Every assignment that changes a value increments the global version and stamps the key with it.
+	# Assigning a value equal to the current one is ignored so callers can rewrite
+	# a whole status without creating spurious changes.
+
+	# The store also remembers the value each key had when settle was last called.
+	# The dbp view reads those values which gives page conditionals their
+	# db['x'] != dbp['x'] change detection without keeping a second copy of the data.
+
+	# Reading a key that is not stored but is registered in derived computes it from its inputs.
+	# The result is memoized until one of the inputs changes.
+
+	# Writers change the store while holding their own lock and then call commit.
+	# commit publishes an immutable musicsnapshot by replacing the snapshot reference
+	# so that readers can use snapshot without taking any lock.
+
+	# Number of changed keys a snapshot carries before they are folded into a new base dictionary
+	FLATTEN = 16
+
+	def __init__(self, *args, **kwargs):
+		super(musicstore, self).__init__()
+		self.version = 0		# Incremented on every change
+		self.stamps = { }		# Version at which each key last changed
+		self.previous = { }		# Value of each key changed since the last settle, as it was before the change
+		self.pending = set()	# Keys changed since the last commit
+		self.memo = { }			# Derived variable values.  Shared with the snapshots.
+		self.dbp = previousview(self)
+		self.update(*args, **kwargs)
+		self.settle()
+
+		# Publish the initial state
+		base = dict( (k, (v, self.stamps[k])) for k, v in self.iteritems() )
+		self.pending = set()
+		self.snapshot = musicsnapshot(base, { }, { }, self.version, self.memo)
+
+	def __missing__(self, key):
+		if key in derived.registry:
+			return derived.compute(self, key, self.memo)
+		raise KeyError(key)
+
+	def __contains__(self, key):
+		return dict.__contains__(self, key) or key in derived.registry
+
+	def __setitem__(self, key, value):
+		old = dict.get(self, key, _ABSENT)
+		if old is not _ABSENT and old == value:
+			return
+
+		self.version += 1
+		self.stamps[key] = self.version
+		self.pending.add(key)
+		if key not in self.previous:
+			self.previous[key] = old
+		super(musicstore, self).__setitem__(key, value)
+
+	def __delitem__(self, key):
+		old = dict.__getitem__(self, key)
+		self.version += 1
+		self.stamps[key] = self.version
+		self.pending.add(key)
+		if key not in self.previous:
+			self.previous[key] = old
+		super(musicstore, self).__delitem__(key)
+
+	def update(self, *args, **kwargs):
+		# dict.update does not call __setitem__ so route each item through it
+		for k, v in dict(*args, **kwargs).iteritems():
+			self[k] = v
+
+	def setdefault(self, key, value=None):
+		if not dict.__contains__(self, key):
+			self[key] = value
+		return self[key]
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def stamp(self, key):
+		# Returns the version at which key last changed.  0 if it has never changed.
+		s = self.stamps.get(key)
+		if s is None:
+			return derived.stamp(self, key) if key in derived.registry else 0
+		return s
+
+	def due(self, key):
+		# Returns the monotonic time at which key next changes without being assigned (see derived.due)
+		return derived.due(self, key) if key in derived.registry else derived.NEVER
+
+	# The clock due is measured with
+	clock = staticmethod(derived.monotonic)
+
+	def derivednames(self):
+		# Returns the names of the variables that are computed rather than stored
+		return derived.registry.keys()
+
+	def changedsince(self, version):
+		# Returns the keys that have changed after version
+		return [ k for k, s in self.stamps.iteritems() if s > version ]
+
+	def settle(self):
+		# Mark the current values as the previous values seen through dbp
+		self.previous = { }
+
+	def commit(self):
+		# Publish the current state as a new snapshot
+		# Only the keys that changed since the last commit are copied.  The base dictionary is
+		# shared with the previous snapshot until enough changes accumulate to fold them into a new one.
+		snap = self.snapshot
+		base = snap.base
+		changes = dict(snap.changes)
+		for k in self.pending:
+			changes[k] = (dict.get(self, k, _ABSENT), self.stamps[k])
+		self.pending = set()
+
+		if len(changes) > self.FLATTEN:
+			base = dict(base)
+			for k, e in changes.iteritems():
+				if e[0] is _ABSENT:
+					base.pop(k, None)
+				else:
+					base[k] = e
+			changes = { }
+
+		# Assigning the reference is atomic so readers see either the old or the new snapshot
+		self.snapshot = musicsnapshot(base, changes, dict(self.previous), self.version, self.memo)
+		return self.snapshot
+
+
+class musicsnapshot(object):
+
+	# Immutable copy of a musicstore at a single version
+	# Provides the same read interface as musicstore (including stamp and dbp) so it can be used in its place by readers.
+
+	def __init__(self, base, changes, previous, version, memo):
+		self.base = base			# key -> (value, stamp).  Shared between snapshots and never modified
+		self.changes = changes		# key -> (value, stamp) for keys changed since base was built
+		self.previous = previous	# Same as musicstore.previous when the snapshot was taken
+		self.version = version
+		self.memo = memo			# The musicstore's derived variable values
+		self.dbp = previousview(self)
+
+	def _entry(self, key):
+		e = self.changes.get(key)
+		if e is None:
+			e = self.base[key]
+		if e[0] is _ABSENT:
+			raise KeyError(key)
+		return e
+
+	def __getitem__(self, key):
+		try:
+			return self._entry(key)[0]
+		except KeyError:
+			if key in derived.registry:
+				return derived.compute(self, key, self.memo)
+			raise
+
+	def __contains__(self, key):
+		try:
+			self._entry(key)
+		except KeyError:
+			return key in derived.registry
+		return True
+
+	def __len__(self):
+		return len(self.keys())
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def stamp(self, key):
+		e = self.changes.get(key) or self.base.get(key)
+		if e is None:
+			return derived.stamp(self, key) if key in derived.registry else 0
+		return e[1]
+
+	def due(self, key):
+		return derived.due(self, key) if key in derived.registry else derived.NEVER
+
+	clock = staticmethod(derived.monotonic)
+
+	def derivednames(self):
+		return derived.registry.keys()
+
+	def keys(self):
+		return [ k for k in set(self.base.keys()) | set(self.changes.keys()) if k not in self.changes or self.changes[k][0] is not _ABSENT ]
+
+	def iteritems(self):
+		for k in self.keys():
+			yield k, self[k]
+
+
+class previousview(object):
+
+	# Read only view of a musicstore as it was when settle was last called
+
+	def __init__(self, store):
+		self.store = store
+
+	def __getitem__(self, key):
+		v = self.store.previous.get(key, _UNCHANGED)
+		if v is _UNCHANGED:
+			# A derived variable whose inputs have changed is recomputed from their previous values
+			if key in derived.registry and self.inputschanged(key):
+				return derived.compute(self, key)
+			return self.store[key]
+		if v is _ABSENT:
+			raise KeyError(key)
+		return v
+
+	def __contains__(self, key):
+		v = self.store.previous.get(key, _UNCHANGED)
+		if v is _UNCHANGED:
+			return key in self.store
+		return v is not _ABSENT
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def inputschanged(self, key):
+		for i in derived.registry[key].inputs:
+			if i in self.store.previous or (i in derived.registry and self.inputschanged(i)):
+				return True
+		return False
+
+	def keys(self):
+		return [ k for k in set(self.store.keys()) | set(self.store.previous.keys()) if k in self ]
+
+	def iteritems(self):
+		for k in self.keys():
+			yield k, self[k]
@@ -0,0 +1,60 @@
+# Startup tasks for pydPiper
+#
+# Startup is described as a set of tasks and the tasks each one depends on.  Every task runs on its own
+# thread as soon as its dependencies have finished and is passed their results as arguments (in the order
+# the dependencies were listed).  Tasks that do not depend on each other (e.g. initializing the display
+# and compiling the page file) run at the same time.
+
+from __future__ import unicode_literals
+import threading, logging, time, sys
+
+class tasks(object):
+
+    def __init__(self):
+        self.tasks = { }        # name -> (function, names of the tasks it depends on)
+        self.finished = { }     # name -> Event set when the task has finished (or failed)
+        self.results = { }      # name -> value returned by the task
+        self.errors = { }       # name -> exc_info of a task that raised (or whose dependency failed)
+        self.times = { }        # name -> (start, end) of the task
+        self.started = None
+
+    def add(self, name, func, *dependencies):
+        # Add task name which runs func(*results of dependencies)
+        self.tasks[name] = (func, dependencies)
+        self.finished[name] = threading.Event()
+
+    def start(self):
+        # Start every task.  Returns immediately.  Use wait to get the result of a task.
+        for name, (func, dependencies) in self.tasks.iteritems():
+            for d in dependencies:
+                if d not in self.tasks:
+                    raise KeyError(u"Startup task {0} depends on {1} which does not exist".format(name, d))
+
+        self.started = time.time()
+        for name in self.tasks:
+            task_t = threading.Thread(target=self.run, args=(name,))
+            task_t.daemon = True
+            task_t.start()
+
+    def run(self, name):
+        func, dependencies = self.tasks[name]
+        try:
+            args = [ self.wait(d) for d in dependencies ]
+            start = time.time()
+            self.results[name] = func(*args)
+            self.times[name] = (start, time.time())
+            logging.debug(u"Startup task {0} finished in {1:.1f}ms ({2:.1f}ms after startup began)".format(name, (time.time()-start)*1000, (time.time()-self.started)*1000))
+        except:
+            self.errors[name] = sys.exc_info()
+        finally:
+            self.finished[name].set()
+
+    def wait(self, name, timeout=None):
+        # Wait for task name to finish and return its result.  Raises the exception of a task that failed.
+        # A timeout (in seconds) raises RuntimeError if the task has not finished in time.
+        if not self.finished[name].wait(timeout):
+            raise RuntimeError(u"Startup task {0} did not finish within {1} seconds".format(name, timeout))
+        if name in self.errors:
+            exc_type, exc_value, exc_traceback = self.errors[name]
+            raise exc_type, exc_value, exc_traceback
+        return self.results[name]
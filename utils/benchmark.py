@@ -0,0 +1,569 @@
+#!/usr/bin/python
+# coding: UTF-8
+
+# Benchmarks for the display and music data pipeline
+
+from __future__ import unicode_literals
+
+import time, sys, os, getopt, threading, logging, glob, types, imp
+from PIL import Image, ImageDraw, ImageFont, ImageChops
+
+# Make the displays and sources modules importable the same way their own test harnesses do
+basedir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(basedir, 'displays'))
+sys.path.insert(0, os.path.join(basedir, 'sources'))
+sys.path.insert(0, basedir)
+
+import bitmap
+import clock
+import display
+import fonts
+import musicstore
+
+def testdb():
+	return {
+		'actPlayer':'mpd',
+		'playlist_position':1,
+		'playlist_length':5,
+		'playlist_display':'1/5',
+		'title':"Nicotine & Gravy",
+		'artist':"Beck",
+		'album':'Midnight Vultures',
+		'tracktype':'MP3 Stereo 24 bit 44.1 Khz',
+		'bitdepth':'16 bits',
+		'samplerate':'44.1 kHz',
+		'elapsed':0,
+		'elapsed_formatted':'0:00',
+		'length':400,
+		'volume':50,
+		'stream':'Not webradio',
+		'utc': 	clock.utcnow(),
+		'localtime': clock.utcnow(),
+		'time':'12:00',
+		'outside_temp_formatted':'46\xb0F',
+		'outside_temp_max':72,
+		'outside_temp_min':48,
+		'outside_conditions':'Windy',
+		'system_temp_formatted':'98\xb0C',
+		'state':'play',
+		'system_tempc':81.0,
+		'random':False,
+		'single':False,
+		'repeat':False
+	}
+
+def percentile(values, p):
+	if not values:
+		return 0.0
+	values = sorted(values)
+	return values[min(len(values)-1, int(len(values)*p))]
+
+def contention(pagefile, size, duration, nwriters):
+	# Measure how long writers wait for the musicdata lock while the display renders
+	# locked   -- the renderer holds the lock for the whole frame (how pydPiper used to render)
+	# snapshot -- the renderer reads the last committed snapshot without taking the lock
+
+	print "Contention benchmark: {0} at {1}x{2}, {3} writers, {4} seconds per mode".format(os.path.basename(pagefile), size[0], size[1], nwriters, duration)
+	print "{0:<10}{1:>8}{2:>9}{3:>12}{4:>12}{5:>12}{6:>12}".format('mode', 'frames', 'writes', 'wait avg', 'wait p99', 'wait max', 'hold avg')
+
+	for mode in ['locked', 'snapshot']:
+		store = musicstore.musicstore(testdb())
+		lock = threading.Lock()
+		dc = display.display_controller(size)
+		dc.load(pagefile, store, store.dbp)
+
+		waits = []
+		holds = []
+		stop = [ False ]
+
+		def writer(n):
+			i = 0
+			while not stop[0]:
+				t = time.time()
+				with lock:
+					waits.append(time.time()-t)
+					store[u'elapsed'] = i
+					store[u'volume'] = (i+n) % 100
+					store[u'title'] = u"Title {0}".format(i/100)
+					store[u'utc'] = clock.utcnow()
+					store.commit()
+				i += 1
+				time.sleep(.005)
+
+		threads = [ threading.Thread(target=writer, args=(n,)) for n in range(nwriters) ]
+		for t in threads:
+			t.daemon = True
+			t.start()
+
+		frames = 0
+		end = time.time() + duration
+		while time.time() < end:
+			t = time.time()
+			if mode == 'locked':
+				with lock:
+					dc.next()
+				holds.append(time.time()-t)
+			else:
+				dc.next()
+			frames += 1
+
+		stop[0] = True
+		for t in threads:
+			t.join()
+
+		hold = sum(holds)/len(holds) if holds else 0.0
+		print "{0:<10}{1:>8}{2:>9}{3:>10.3f}ms{4:>10.3f}ms{5:>10.3f}ms{6:>10.3f}ms".format(mode, frames, len(waits), sum(waits)/len(waits)*1000, percentile(waits, .99)*1000, max(waits)*1000, hold*1000)
+
+def imagebytes(*widgets):
+	# Memory used by the pixels of the widgets' images
+	retval = 0
+	for w in widgets:
+		for i in [ w.image, getattr(w, 'expanded_image', None), getattr(w, 'strip', None) ]:
+			if i is not None:
+				retval += len(i.tobytes())
+	return retval
+
+def marquee(size, duration, length):
+	# Scroll a very long title (e.g. webradio stream metadata) across a window the width of the display
+	# full    -- the whole title is rendered and the scroll crops it on every step
+	# marquee -- only the part of the title visible through the window is rendered
+
+	fontpkg = fonts.bmfont.bmfont('latin1_5x8.fnt').fontpkg
+	title = (u"Stream title with a lot of metadata \xe9\xe8 - Artist - Album (Live) - " * (length/60+1))[:length]
+	print "Marquee benchmark: {0} character title at {1}x{2}, {3} seconds per mode".format(len(title), size[0], size[1], duration)
+	print "{0:<10}{1:>12}{2:>12}{3:>14}{4:>14}".format('mode', 'steps', 'step avg', 'new title', 'image bytes')
+
+	frames = { }
+	for mode in ['full', 'marquee']:
+		db = { 'title': title }
+		text = display.gwidgetText(u'{0}', fontpkg, db, [u'title'], True, (0,0), u'left')
+		scroll = display.gwidgetScroll(text, u'left', 1, 1, 20, u'none', 0, size[0])
+		if mode == 'marquee':
+			canvas = display.gwidgetCanvas(size)
+			canvas.add(scroll, (0,0), (size[0], 8))
+
+		# Time how long a change of title takes to render
+		t = time.time()
+		for i in range(10):
+			db[u'title'] = title[i:] + title[:i]
+			text.curMsg = None
+			scroll.update()
+		newtitle = (time.time()-t)/10
+
+		steps = 0
+		frames[mode] = []
+		end = time.time() + duration
+		while time.time() < end:
+			scroll.update()
+			if steps < 2000:
+				frames[mode].append(scroll.image.crop( (0,0,size[0],8) ).tobytes())
+			steps += 1
+		print "{0:<10}{1:>12}{2:>10.3f}ms{3:>12.3f}ms{4:>14}".format(mode, steps, duration/steps*1000, newtitle*1000, imagebytes(text, scroll))
+
+	print "Frames identical: {0}".format(frames['full'] == frames['marquee'])
+
+def ttext(pagefile, size, duration):
+	# Render the truetype text widgets of a page file with a new time every update
+	# freetype -- every message is drawn by FreeType into a mode "1" image (how ttext used to render)
+	# cache    -- messages are composed from the font's 1-bit glyph cache
+
+	dc = display.display_controller(size)
+	db = testdb()
+	dc.load(pagefile, db, db)
+	widgets = [ (k, v) for k, v in dc.widgets.iteritems() if v.type == u'ttext' ]
+	if not widgets:
+		print "{0} has no truetype text widgets".format(os.path.basename(pagefile))
+		return
+
+	print "TrueType benchmark: {0}, {1} seconds per widget and mode".format(os.path.basename(pagefile), duration)
+	print "{0:<16}{1:<10}{2:>10}{3:>12}".format('widget', 'mode', 'messages', 'avg')
+	for name, widget in widgets:
+		font = [ v for v in dc.pages.TRUETYPE_FONTS.itervalues() if v['fontpkg'] is widget.fontpkg ][0]
+		freetype = ImageFont.truetype(font=font['file'], size=font['size'])
+		for mode in ['freetype', 'cache']:
+			n = 0
+			end = time.time() + duration
+			t = time.time()
+			while time.time() < end:
+				msg = u"{0}:{1:02d}".format(n/60%12+1, n%60)
+				if mode == 'freetype':
+					image = Image.new("1", freetype.getsize(msg), 0)
+					draw = ImageDraw.Draw(image)
+					draw.text( (0,0), msg, font=freetype, fill='white')
+					del draw
+				else:
+					widget.ttext(msg, [], widget.fontpkg, widget.varwidth, widget.specifiedsize, widget.just)
+				n += 1
+			print "{0:<16}{1:<10}{2:>10}{3:>10.3f}ms".format(name, mode, n, (time.time()-t)/n*1000)
+
+def deepsize(obj, seen):
+	# Bytes used by obj and everything it references that has not already been counted in seen
+	# Images are left out (their pixels are not what this measures) as are classes, functions and modules
+	if id(obj) in seen or isinstance(obj, (Image.Image, type, types.ModuleType, types.FunctionType, types.MethodType)):
+		return 0
+	seen.add(id(obj))
+	retval = sys.getsizeof(obj)
+	if isinstance(obj, dict):
+		for k, v in obj.iteritems():
+			retval += deepsize(k, seen) + deepsize(v, seen)
+	elif isinstance(obj, (list, tuple, set, frozenset)):
+		for i in obj:
+			retval += deepsize(i, seen)
+	else:
+		if hasattr(obj, '__dict__'):
+			retval += deepsize(obj.__dict__, seen)
+		for cls in type(obj).__mro__:
+			for name in cls.__dict__.get('__slots__', ()):
+				if name not in ('__weakref__', '__dict__'):
+					retval += deepsize(getattr(obj, name, None), seen)
+	return retval
+
+def memory(pagefiles, size):
+	# Memory used by the widgets of each page file, not counting fonts, images and musicdata
+	# followed by the glyphs each font has created and the bytes they use
+	print "Widget memory at {0}x{1}".format(size[0], size[1])
+	print "{0:<28}{1:>9}{2:>12}{3:>12}".format('page file', 'widgets', 'bytes', 'per widget')
+	fontreport = []
+	for pagefile in pagefiles:
+		db = musicstore.musicstore(testdb())
+		dc = display.display_controller(size)
+		fonts.bmfont.loaded.clear()
+		try:
+			dc.load(pagefile, db, db.dbp)
+		except Exception as e:
+			print "{0:<28} could not be loaded ({1})".format(os.path.basename(pagefile), e)
+			continue
+
+		# Glyphs are created as they are drawn so render a frame before looking at the fonts
+		dc.next()
+		fontreport.append( (pagefile, fonts.bmfont.memory()) )
+
+		# Fonts, the variable db and the controller are shared by every widget so they are not counted
+		seen = set([ id(db), id(db.dbp), id(dc), id(dc.db), id(dc.dbp), id(dc.source), id(dc.sourcep), id(clock.default) ])
+		for fonttable in [ 'FONTS', 'TRUETYPE_FONTS' ]:
+			for v in getattr(dc.pages, fonttable, { }).itervalues():
+				if 'fontpkg' in v:
+					seen.add(id(v['fontpkg']))
+
+		total = 0
+		count = 0
+		pending = list(dc.widgets.itervalues())
+		while pending:
+			w = pending.pop()
+			if id(w) in seen:
+				continue
+			count += 1
+			total += deepsize(w, set(seen))
+			seen.add(id(w))
+			# Count the nested widgets of canvases and effects as widgets too
+			pending.extend([ e[0] for e in getattr(w, 'widgets', None) or [] ])
+			if getattr(w, 'widget', None) is not None:
+				pending.append(w.widget)
+		print "{0:<28}{1:>9}{2:>12}{3:>12}".format(os.path.basename(pagefile), count, total, total/count if count else 0)
+
+	print ""
+	print "Font memory after the first frame"
+	print "{0:<28}{1:<30}{2:>8}{3:>8}{4:>10}".format('page file', 'font', 'glyphs', 'of', 'bytes')
+	for pagefile, report in fontreport:
+		for name, count, glyphs, size in report:
+			print "{0:<28}{1:<30}{2:>8}{3:>8}{4:>10}".format(os.path.basename(pagefile), name, count, glyphs, size)
+
+def pixelpages(image):
+	# Page layout of image computed a pixel at a time (how drivers converted frames before bitmap)
+	width, height = image.size
+	data = list(image.convert("1").getdata())
+	retval = []
+	for p in range(0, height, 8):
+		line = [0]*width
+		for y in range(p, min(p+8, height)):
+			for x in range(width):
+				if data[y*width+x]:
+					line[x] |= 1 << (y-p)
+		retval.append(line)
+	return retval
+
+def frame(pagefile, size, duration):
+	# Composite the layers of a page file's first frame and convert it for the driver with PIL images and with bitmaps
+	# composite -- paste every active widget into a new frame
+	# export    -- convert the frame into pages (a byte per column for each band of 8 rows)
+	# diff      -- find what changed from the previous frame
+
+	dc = display.display_controller(size)
+	db = testdb()
+	dc.load(pagefile, db, db)
+	dc.next()
+	layers = [ (w.image, s.coordinates, s.opaque) for w, s in reversed(dc.lastactive) ]
+	blayers = [ (bitmap.bitmap.frompil(i), c, o) for i, c, o in layers ]
+	previous = Image.new("1", size)
+	bprevious = bitmap.bitmap.frompil(previous)
+
+	def pilcomposite():
+		img = Image.new("1", size)
+		for i, c, o in layers:
+			if o:
+				img.paste(i, c)
+			else:
+				img.paste(i, c, i)
+		return img
+
+	def bitmapcomposite():
+		bm = bitmap.bitmap(size[0], size[1])
+		for i, c, o in blayers:
+			bm.blit(i, c, not o)
+		return bm
+
+	img = pilcomposite()
+	bm = bitmapcomposite()
+	if img.tobytes() != bm.topil().tobytes() or pixelpages(img) != [ list(p) for p in bm.pages() ]:
+		print "Bitmap frame does not match the PIL frame"
+		return
+
+	stages = [
+		('composite', pilcomposite, bitmapcomposite),
+		('export', lambda: pixelpages(img), bm.pages),
+		('diff', lambda: img.tobytes() != previous.tobytes() and ImageChops.difference(img, previous).getbbox(), lambda: bm.dirty(bprevious)),
+	]
+
+	print "Frame benchmark: {0} at {1}x{2}, {3} layers, {4} seconds per stage".format(os.path.basename(pagefile), size[0], size[1], len(layers), duration)
+	print "{0:<12}{1:>12}{2:>12}".format('stage', 'PIL', 'bitmap')
+	totals = [ 0.0, 0.0 ]
+	for name, pil, packed in stages:
+		results = []
+		for i, f in enumerate([ pil, packed ]):
+			n = 0
+			end = time.time() + duration/2.0
+			t = time.time()
+			while time.time() < end:
+				f()
+				n += 1
+			results.append((time.time()-t)/n*1000)
+			totals[i] += results[-1]
+		print "{0:<12}{1:>10.3f}ms{2:>10.3f}ms".format(name, results[0], results[1])
+	print "{0:<12}{1:>10.3f}ms{2:>10.3f}ms".format('total', totals[0], totals[1])
+
+
+def fontload(pagefiles, duration):
+	# Time to load the FONTS of each page file
+	# parse    -- the fonts are read from their .fnt files and sprite sheets
+	# cache    -- the fonts are read from their compiled cache files
+	# registry -- the fonts have already been loaded by this process (e.g. by the driver)
+	print "Font load benchmark"
+	print "{0:<28}{1:>7}{2:>12}{3:>12}{4:>12}".format('page file', 'fonts', 'parse', 'cache', 'registry')
+	devnull = open(os.devnull, 'w')
+	for pagefile in pagefiles:
+		try:
+			files = [ v['file'] for v in imp.load_source('benchmarkpages', pagefile).FONTS.itervalues() if 'file' in v ]
+		except Exception:
+			continue
+		results = []
+		for mode in [ 'parse', 'cache', 'registry' ]:
+			n = 0
+			end = time.time() + duration/3.0
+			t = time.time()
+			while time.time() < end:
+				if mode != 'registry':
+					fonts.bmfont.loaded.clear()
+				stdout, sys.stdout = sys.stdout, devnull
+				try:
+					for f in files:
+						fonts.bmfont.bmfont(f, mode != 'parse')
+				finally:
+					sys.stdout = stdout
+				n += 1
+			results.append((time.time()-t)/n*1000)
+		print "{0:<28}{1:>7}{2:>10.2f}ms{3:>10.2f}ms{4:>10.3f}ms".format(os.path.basename(pagefile), len(files), results[0], results[1], results[2])
+
+# Run in a new interpreter by imports.  Python 2 has no -X importtime so __import__ is wrapped to time every module that is imported for the first time.
+IMPORTTIME = """
+import sys, time, resource, __builtin__
+original = __builtin__.__import__
+children = [ 0.0 ]
+report = [ ]
+loaded = list(sys.modules)
+known = set(loaded)
+def timed(label, func, *args, **kwargs):
+	before = len(sys.modules)
+	start = len(loaded)
+	children.append(0.0)
+	t = time.time()
+	try:
+		return func(*args, **kwargs)
+	finally:
+		cumulative = time.time() - t
+		inner = children.pop()
+		if len(sys.modules) > before:
+			new = [ k for k in sys.modules if k not in known ]
+			known.update(new)
+			loaded.extend(new)
+		# Failed implicit relative imports add None entries which are not imports
+		if any(sys.modules.get(k) is not None for k in loaded[start:]):
+			children[-1] += cumulative
+			report.append( (cumulative - inner, cumulative, len(children)-1, label) )
+def timedimport(name, *args, **kwargs):
+	return timed(name, original, name, *args, **kwargs)
+__builtin__.__import__ = timedimport
+
+t = time.time()
+for step in sys.argv[1:]:
+	kind, name = step.split(':')
+	try:
+		if kind == 'package':
+			__import__(name)
+		elif kind == 'driver':
+			timed(step, sys.modules['displays'].driver, name)
+		else:
+			timed(step, sys.modules['sources'].source, name)
+	except Exception as e:
+		print 'import time: {0} failed ({1}: {2})'.format(step, type(e).__name__, e)
+total = time.time() - t
+__builtin__.__import__ = original
+
+print 'import time: self [us] | cumulative | imported package'
+for own, cumulative, depth, name in report:
+	print 'import time: {0:>9} | {1:>10} | {2}{3}'.format(int(own*1e6), int(cumulative*1e6), '  '*depth, name)
+print 'total {0:.1f}ms, {1} modules, max RSS {2} KB'.format(total*1000, len(sys.modules), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def imports(driver, source, verbose):
+	# Cold start imports of pydPiper: the displays and sources packages and the selected driver and music service
+	import subprocess
+	print "Import benchmark (driver {0}, source {1})".format(driver, source)
+	steps = [ 'package:displays', 'package:sources', 'driver:{0}'.format(driver), 'source:{0}'.format(source) ]
+	output = subprocess.Popen([ sys.executable, '-c', IMPORTTIME ] + steps, cwd=basedir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()[0]
+	for line in output.splitlines():
+		if verbose or not line.startswith('import time: ') or ' failed ' in line:
+			print line
+
+def drawbars(levels, peaks, size, gap):
+	# Draw the bars of a spectrum one rectangle at a time.  The way meters would be drawn without numpy.
+	w, h = size
+	image = Image.new('1', size)
+	draw = ImageDraw.Draw(image)
+	width = max(1, (w - gap*(len(levels)-1)) // len(levels))
+	for i, level in enumerate(levels):
+		x = i * (width + gap)
+		length = int(round(level * h / 100.0))
+		if length:
+			draw.rectangle( (x, h-length, x+width-1, h-1), fill=1 )
+		if peaks:
+			y = h - int(round(peaks[i] * h / 100.0))
+			if y < h:
+				draw.line( (x, y, x+width-1, y), fill=1 )
+	return image
+
+def meter(size, duration, bands):
+	# Cost of one update of the audio meter (analysis of the ring buffer) and of drawing a spectrum widget
+	# rectangles -- one ImageDraw rectangle per bar
+	# numpy      -- every bar at once (displays/meters.py)
+	import numpy, audiometer, meters, derived
+
+	fifo = os.path.join('/tmp', 'benchmark.{0}.fifo'.format(os.getpid()))
+	os.mkfifo(fifo)
+	try:
+		db = musicstore.musicstore({ 'audio_rms': (), 'audio_peak': (), 'audio_spectrum': () })
+		meter = audiometer.audiometer(db, threading.Lock(), fifo, '44100:16:2', 1000, bands, [ True ])
+		t = numpy.arange(meter.WINDOW*2) / 44100.0
+		meter.write((numpy.stack([ numpy.sin(2*numpy.pi*440*t), numpy.random.uniform(-0.5, 0.5, len(t)) ], 1) * 32767).astype('<i2'))
+
+		print "Meter benchmark: {0} bands at {1}x{2}, {3} seconds per test".format(bands, size[0], size[1], duration)
+		count = 0
+		end = time.time() + duration
+		while time.time() < end:
+			meter.received = derived.monotonic()
+			meter.analyze()
+			count += 1
+		analysis = duration/count
+		print "{0:<12}{1:>10.3f}ms".format('analysis', analysis*1000)
+
+		frames = { }
+		levels = [ tuple(numpy.random.randint(0, 101, bands).tolist()) for i in range(100) ]
+		for mode, draw in [ ('rectangles', lambda l: drawbars(l, l, size, 1)), ('numpy', lambda l: meters.bars(l, l, size, 'up', 1)) ]:
+			frames[mode] = [ draw(l).tobytes() for l in levels ]
+			count = 0
+			end = time.time() + duration
+			while time.time() < end:
+				draw(levels[count % len(levels)])
+				count += 1
+			print "{0:<12}{1:>10.3f}ms".format(mode, duration/count*1000)
+			if mode == 'numpy':
+				drawing = duration/count
+
+		print "Frames identical: {0}".format(frames['rectangles'] == frames['numpy'])
+		print "Share of a 30 fps frame: {0:.1f}%".format((analysis + drawing) * 30 * 100)
+	finally:
+		os.remove(fifo)
+
+if __name__ == "__main__":
+
+	usage = 'benchmark.py -b <benchmark> -p <pagefile> --width <width in pixels> --height <height in pixels> -t <seconds> --writers <number of writer threads> --length <title length>\nBenchmarks: contention, marquee, ttext, memory (of every page file unless -p is given), frame (pages_weh_80x16.py at 80x16 unless -p, --width or --height are given), fonts (of every page file unless -p is given), imports (of the --driver and --source modules, -v to list every module), meter (--bands bands at 128x64 unless --width or --height are given)'
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:],"hvb:p:t:",["benchmark=","pages=","width=","height=","time=","writers=","length=","driver=","source=","bands="])
+	except getopt.GetoptError:
+		print usage
+		sys.exit(2)
+
+	# Set defaults
+	benchmark = 'contention'
+	pagefile = None
+	width = None
+	height = None
+	duration = 5
+	writers = 3
+	length = 2048
+	driver = 'lcd_curses'
+	source = 'mpd'
+	verbose = False
+	bands = 16
+
+	for opt, arg in opts:
+		if opt == '-h':
+			print usage
+			sys.exit()
+		elif opt in ("-b", "--benchmark"):
+			benchmark = arg
+		elif opt in ("-p", "--pages"):
+			pagefile = arg
+		elif opt in ("--width"):
+			width = int(arg)
+		elif opt in ("--height"):
+			height = int(arg)
+		elif opt in ("-t", "--time"):
+			duration = float(arg)
+		elif opt in ("--writers"):
+			writers = int(arg)
+		elif opt in ("--length"):
+			length = int(arg)
+		elif opt in ("--driver"):
+			driver = arg
+		elif opt in ("--source"):
+			source = arg
+		elif opt in ("--bands"):
+			bands = int(arg)
+		elif opt == '-v':
+			verbose = True
+
+	logging.basicConfig(format=u'%(asctime)s:%(levelname)s:%(message)s', level=logging.WARNING)
+
+	pagefiles = [ pagefile ] if pagefile else sorted(glob.glob(os.path.join(basedir, 'pages*.py')))
+	size = (width or 128, height or 64)
+
+	if benchmark == 'contention':
+		contention(pagefile or os.path.join(basedir, 'pages_ssd1306.py'), size, duration, writers)
+	elif benchmark == 'marquee':
+		marquee(size, duration, length)
+	elif benchmark == 'ttext':
+		ttext(pagefile or os.path.join(basedir, 'pages_ssd1306.py'), size, duration)
+	elif benchmark == 'memory':
+		memory(pagefiles, size)
+	elif benchmark == 'fonts':
+		fontload(pagefiles, duration)
+	elif benchmark == 'frame':
+		frame(pagefile or os.path.join(basedir, 'pages_weh_80x16.py'), (width or 80, height or 16), duration)
+	elif benchmark == 'imports':
+		imports(driver, source, verbose)
+	elif benchmark == 'meter':
+		meter(size, duration, bands)
+	else:
+		print usage
+		sys.exit(2)